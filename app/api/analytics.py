@@ -1,12 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, desc, text
+from sqlalchemy import select, func, desc, text, literal_column
 from typing import List, Optional
-from datetime import datetime, date
+from datetime import datetime, date, timedelta, timezone
 
+from ..config import settings
 from ..db.session import get_db
-from ..db.base import RequestLog, APIKey
+from ..db.base import APIKey
 from ..auth.jwt import get_current_user
+from ..services.logging_service import log_sink
+from ..services.response_cache import response_cache
+from ..services.near_duplicate_cache import near_duplicate_cache
+from ..services.singleflight import inference_flight
+from ..services.hedging import hedge_budget
+from ..services.rollups import rollup_source, latency_sketches, date_range, get_watermark, rollup_compactor, unrolled_rows
+from ..services.partitions import partition_manager
+from ..router.model_router import router as model_router
+from ..providers.admission import admission_controllers
 
 router = APIRouter(
     prefix="/analytics",
@@ -22,22 +32,18 @@ async def get_usage_by_key(
     db: AsyncSession = Depends(get_db)
 ):
     """Get total token usage and cost grouped by API Key ID."""
+    logs = await rollup_source(db, *date_range(start_date, end_date))
     stmt = (
         select(
-            RequestLog.api_key_id,
-            func.sum(RequestLog.token_count).label("total_tokens"),
-            func.sum(RequestLog.cost).label("total_cost"),
-            func.count(RequestLog.id).label("request_count")
+            logs.c.api_key_id,
+            func.sum(logs.c.token_count).label("total_tokens"),
+            func.sum(logs.c.cost).label("total_cost"),
+            func.sum(logs.c.request_count).label("request_count")
         )
-        .group_by(RequestLog.api_key_id)
+        .group_by(logs.c.api_key_id)
         .order_by(desc("total_tokens"))
         .limit(limit)
     )
-    
-    if start_date:
-        stmt = stmt.where(func.date(RequestLog.timestamp) >= start_date)
-    if end_date:
-        stmt = stmt.where(func.date(RequestLog.timestamp) <= end_date)
         
     result = await db.execute(stmt)
     
@@ -45,10 +51,10 @@ async def get_usage_by_key(
     data = []
     for row in result:
         data.append({
-            "api_key_id": row.api_key_id,
-            "total_tokens": row.total_tokens,
-            "total_cost": round(row.total_cost, 6),
-            "request_count": row.request_count
+            "api_key_id": row.api_key_id or None, # 0 = logged without a key
+            "total_tokens": int(row.total_tokens or 0),
+            "total_cost": round(row.total_cost or 0.0, 6),
+            "request_count": int(row.request_count)
         })
     return data
 
@@ -59,21 +65,19 @@ async def get_cost_by_provider(
     db: AsyncSession = Depends(get_db)
 ):
     """Get cost breakdown by provider."""
+    logs = await rollup_source(db, *date_range(start_date, end_date))
     stmt = (
         select(
-            RequestLog.provider,
-            func.sum(RequestLog.cost).label("total_cost"),
-            func.sum(RequestLog.token_count).label("total_tokens"),
-            func.count(RequestLog.id).label("request_count")
+            logs.c.provider,
+            func.sum(logs.c.cost).label("total_cost"),
+            func.sum(logs.c.token_count).label("total_tokens"),
+            func.sum(logs.c.input_tokens).label("input_tokens"),
+            func.sum(logs.c.output_tokens).label("output_tokens"),
+            func.sum(logs.c.request_count).label("request_count")
         )
-        .group_by(RequestLog.provider)
+        .group_by(logs.c.provider)
         .order_by(desc("total_cost"))
     )
-    
-    if start_date:
-        stmt = stmt.where(func.date(RequestLog.timestamp) >= start_date)
-    if end_date:
-        stmt = stmt.where(func.date(RequestLog.timestamp) <= end_date)
         
     result = await db.execute(stmt)
     
@@ -82,8 +86,10 @@ async def get_cost_by_provider(
         data.append({
             "provider": row.provider,
             "total_cost": round(row.total_cost or 0.0, 6),
-            "total_tokens": row.total_tokens or 0,
-            "request_count": row.request_count
+            "total_tokens": int(row.total_tokens or 0),
+            "input_tokens": int(row.input_tokens or 0),
+            "output_tokens": int(row.output_tokens or 0),
+            "request_count": int(row.request_count)
         })
     return data
 
@@ -94,28 +100,23 @@ async def get_error_summary(
     db: AsyncSession = Depends(get_db)
 ):
     """Get error counts grouped by status."""
+    logs = await rollup_source(db, *date_range(start_date, end_date))
     stmt = (
         select(
-            RequestLog.status,
-            func.count(RequestLog.id).label("count")
+            logs.c.status,
+            func.sum(logs.c.request_count).label("count")
         )
-        .group_by(RequestLog.status)
+        .group_by(logs.c.status)
         .order_by(desc("count"))
     )
-    
-    if start_date:
-        stmt = stmt.where(func.date(RequestLog.timestamp) >= start_date)
-    if end_date:
-        stmt = stmt.where(func.date(RequestLog.timestamp) <= end_date)
         
     result = await db.execute(stmt)
     
-    data = []
     total = 0
     details = []
     for row in result:
-        details.append({"status": row.status, "count": row.count})
-        total += row.count
+        details.append({"status": row.status, "count": int(row.count)})
+        total += int(row.count)
         
     return {
         "total_requests": total,
@@ -127,16 +128,17 @@ async def get_requests_per_day(
     days: int = 7,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get request volume for the last N days."""
-    # Postgres specific date_trunc
+    """Get request volume for the last N days (UTC, today included)."""
+    today = datetime.now(timezone.utc).date()
+    logs = await rollup_source(db, *date_range(today - timedelta(days=days - 1), None))
+    day = func.date_trunc(literal_column("'day'"), logs.c.bucket, literal_column("'UTC'"))
     stmt = (
         select(
-            func.date_trunc('day', RequestLog.timestamp).label("day"),
-            func.count(RequestLog.id).label("count")
+            day.label("day"),
+            func.sum(logs.c.request_count).label("count")
         )
-        .group_by("day")
+        .group_by(day)
         .order_by(desc("day"))
-        .limit(days)
     )
     
     result = await db.execute(stmt)
@@ -144,7 +146,143 @@ async def get_requests_per_day(
     data = []
     for row in result:
         data.append({
-            "date": row.day.date(),
-            "request_count": row.count
+            "date": row.day.astimezone(timezone.utc).date(),
+            "request_count": int(row.count)
         })
     return data
+
+
+LATENCY_GROUPS = ("provider", "model", "api_key_id", "status")
+
+
+@router.get("/latency")
+async def get_latency_percentiles(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+    api_key_id: Optional[int] = None,
+    status: str = "success", # "all" for every status
+    group_by: List[str] = Query(default=["provider"]),
+    db: AsyncSession = Depends(get_db)
+):
+    """Latency percentiles (ms, within 1%) merged from the rollups' sketches, per group_by value."""
+    group_by = list(dict.fromkeys(group_by))
+    unknown = set(group_by) - set(LATENCY_GROUPS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group latency by: {', '.join(sorted(unknown))}")
+
+    filters = {name: value for name, value in (("provider", provider), ("model", model), ("api_key_id", api_key_id))
+               if value is not None}
+    if status != "all":
+        filters["status"] = status
+    sketches = await latency_sketches(db, *date_range(start_date, end_date), group_by=group_by, **filters)
+
+    data = []
+    for key, sketch in sorted(sketches.items(), key=lambda item: -item[1].count):
+        group = dict(zip(group_by, key))
+        if "api_key_id" in group:
+            group["api_key_id"] = group["api_key_id"] or None # 0 = logged without a key
+        if "model" in group:
+            group["model"] = group["model"] or None
+        data.append({**group, **sketch.summary()})
+    return data
+
+
+@router.get("/rollups")
+async def get_rollup_stats(db: AsyncSession = Depends(get_db)):
+    """
+    Rollup compactor progress: everything before `rolled_until` is served from the rollup tables.
+    `unrolled` counts raw rows just below it that the rollups missed - it should stay 0.
+    """
+    watermark = await get_watermark(db)
+    return {
+        "rolled_until": watermark,
+        "unrolled": await unrolled_rows(db, watermark, settings.ROLLUP_AUDIT_HOURS),
+        **rollup_compactor.stats()
+    }
+
+
+@router.get("/partitions")
+async def get_partition_stats(db: AsyncSession = Depends(get_db)):
+    """request_logs partitions and their time ranges, plus partition upkeep stats (this worker)."""
+    return {
+        "partitions": [
+            {"name": p.name, "start": p.start, "end": p.end} for p in await partition_manager.partitions(db)
+        ],
+        **partition_manager.stats()
+    }
+
+
+@router.get("/log-sink")
+async def get_log_sink_stats():
+    """Request log writer health: queue depth, drops/spills and flush latency (this worker)."""
+    return log_sink.stats()
+
+
+@router.get("/response-cache")
+async def get_response_cache_stats():
+    """Response cache hit ratio and local tier size (this worker)."""
+    return {
+        "exact": response_cache.stats(),
+        "near_duplicate": near_duplicate_cache.stats()
+    }
+
+
+@router.get("/coalescing")
+async def get_coalescing_stats():
+    """Single-flight request coalescing: upstream calls made vs. saved (this worker)."""
+    return inference_flight.stats()
+
+
+@router.get("/routing")
+async def get_routing_stats():
+    """Live per-provider latency (EWMA, p95) and error rate used by auto routing (this worker)."""
+    return model_router.stats.snapshot()
+
+
+@router.get("/admission")
+async def get_admission_stats():
+    """Per-provider admission control: in-flight calls, queue depth, wait times and shed counts (this worker)."""
+    return {name: controller.stats() for name, controller in admission_controllers.items()}
+
+
+@router.get("/hedging")
+async def get_hedging_stats(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Hedged requests by provider and outcome, with the cost of the losing attempts."""
+    logs = await rollup_source(db, *date_range(start_date, end_date))
+    count = func.sum(logs.c.hedged_count)
+    stmt = (
+        select(
+            logs.c.provider,
+            logs.c.status,
+            count.label("count"),
+            func.sum(logs.c.hedged_cost).label("total_cost")
+        )
+        .group_by(logs.c.provider, logs.c.status)
+        .having(count > 0)
+    )
+
+    result = await db.execute(stmt)
+
+    breakdown = []
+    hedge_cost = 0.0
+    for row in result:
+        breakdown.append({
+            "provider": row.provider,
+            "status": row.status,
+            "count": int(row.count),
+            "total_cost": round(row.total_cost or 0.0, 6)
+        })
+        if row.status == "hedge_cancelled":
+            hedge_cost += row.total_cost or 0.0
+
+    return {
+        "hedge_cost": round(hedge_cost, 6), # Spent on cancelled losing attempts
+        "breakdown": breakdown,
+        "budget": hedge_budget.stats() # This worker
+    }
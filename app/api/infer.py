@@ -1,16 +1,18 @@
-from fastapi import APIRouter, Request, Depends, HTTPException, BackgroundTasks, Header
+from fastapi import APIRouter, Request, HTTPException, Header
+from fastapi.responses import Response
+from starlette.background import BackgroundTask
 from ..api.schemas import InferRequest, InferResponse
-from ..services.inference_service import run_inference
-from ..providers.base import ProviderTemporaryError, ProviderPermanentError
-from ..db.session import get_db
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from ..db.base import RequestLog, IdempotencyKey
-from ..config import AsyncSessionLocal
+from ..services.inference_service import run_inference, resolve_provider, stream_inference
+from ..services.idempotency import idempotency_store, IdempotencyTimeout, StoredResponse
+from ..providers.tokenizer import count_prompt_tokens
+from ..utils.token_bucket import token_limiter, RateLimitExceededError
+from ..providers.base import ProviderTemporaryError, ProviderPermanentError, ProviderUnavailableError
+from ..utils.sse import EventSourceResponse, sse_event
+from ..utils.prometheus import RATELIMIT_SECONDS
+from ..utils.tracing import span
 import logging
-import json
-from datetime import datetime, timezone
-from dataclasses import asdict
+import math
+from contextlib import aclosing
 
 logger = logging.getLogger(__name__)
 
@@ -20,91 +22,148 @@ router = APIRouter(tags=["inference"])  # No prefix - route is /infer directly
 async def infer_endpoint(
     request: Request,
     req: InferRequest,
-    background_tasks: BackgroundTasks,
-    idempotency_key: str | None = Header(default=None)
+    idempotency_key: str | None = Header(default=None),
+    cache_control: str | None = Header(default=None)
 ):
     """
     Smart Inference Endpoint with Idempotency.
     - Authn: Validated by Middleware
-    - Idempotency: Deduplicates requests via Idempotency-Key header
+    - Idempotency: Deduplicates requests via Idempotency-Key header; concurrent duplicates wait for the first
     - Routing: Handled by InferenceService
-    - Logging: Non-blocking background task
+    - Caching: Response cache is skipped with `Cache-Control: no-cache` (or no-store)
+    - Rate limiting: Requests/min and tokens/min per key; max_tokens + prompt estimate charged up front, reconciled after
+    - Logging: Buffered by the request log sink, written in bulk
     """
     api_key_id = request.state.api_key.id
+    use_cache = not (cache_control and ("no-cache" in cache_control or "no-store" in cache_control))
     
-    # 1. Idempotency Check
+    # 1. Idempotency Check - duplicates wait for the leader's stored response
+    lease = None
     if idempotency_key:
-        async with AsyncSessionLocal() as db:
-            result = await db.execute(
-                select(IdempotencyKey).where(
-                    IdempotencyKey.idempotency_key == idempotency_key,
-                    IdempotencyKey.api_key_id == api_key_id
-                )
-            )
-            existing = result.scalar_one_or_none()
-            
-            if existing:
-                if existing.response_json:
-                    # Return cached response
-                    cached = json.loads(existing.response_json)
-                    return InferResponse(**cached)
-                else:
-                    # Key exists but no response => currently processing
-                    # Or stuck. For now, assume concurrent processing.
-                    raise HTTPException(status_code=409, detail="Request with this idempotency key is currently processing")
-            
-            # Create lock record
-            new_key = IdempotencyKey(
-                idempotency_key=idempotency_key,
-                api_key_id=api_key_id,
-                locked_at=datetime.now(timezone.utc)
-            )
-            db.add(new_key)
-            await db.commit()
+        try:
+            with span("idempotency", op="begin") as scope:
+                lease, stored = await idempotency_store.begin(api_key_id, idempotency_key)
+                scope.set("replay", stored is not None)
+        except IdempotencyTimeout:
+            raise HTTPException(status_code=409, detail="Request with this idempotency key is still processing")
+        if stored:
+            # Stored bytes are returned verbatim - no Pydantic round trip
+            return Response(content=stored.body, status_code=stored.status_code, media_type="application/json")
 
+    charge = None
     try:
-        # 2. Run Inference
-        result = await run_inference(req.model, req.prompt, req.max_tokens, api_key_id, background_tasks)
+        # 2. Rate limit (replays of stored responses above are free)
+        # Counted with the requested provider's tokenizer (the default one for "auto")
+        with RATELIMIT_SECONDS.time("tokens"), span("token_limit"):
+            charge = await token_limiter.acquire(
+                request.state.api_key, req.max_tokens + count_prompt_tokens(req.prompt, req.model)
+            )
+
+        # 3. Run Inference
+        with span("inference", model=req.model):
+            result = await run_inference(
+                req.model, req.prompt, req.max_tokens, api_key_id,
+                use_cache=use_cache,
+                near_duplicate=request.state.api_key.near_duplicate_cache
+            )
         
         response_obj = InferResponse(
             output=result.text,
-            provider=result.model_used,
+            provider=result.provider or result.model_used,
             latency_ms=result.latency_ms,
             tokens_used=result.tokens_used,
-            model=result.model_used
+            input_tokens=result.input_tokens,
+            output_tokens=result.output_tokens,
+            model=result.model_used,
+            fallback_hops=result.fallback_hops
         )
+        # Refund the unused part of the up-front charge
+        token_limiter.settle(charge, result.tokens_used)
+        charge = None
+
+        # Serialize once; the same bytes go to the client and the idempotency store
+        body = response_obj.model_dump_json().encode()
 
-        # 3. Update Idempotency Record
-        if idempotency_key:
-            # Fire and forget update? No, we should ensure it's saved.
-            # Use separate session
-            async with AsyncSessionLocal() as db:
-                await db.execute(
-                   update(IdempotencyKey)
-                   .where(IdempotencyKey.idempotency_key == idempotency_key)
-                   .values(
-                       response_json=json.dumps(response_obj.model_dump()), 
-                       status_code=200,
-                       locked_at=None
-                   )
-                )
-                await db.commit()
+        # 4. Store the response for duplicates
+        if lease is not None:
+            with span("idempotency", op="complete"):
+                await idempotency_store.complete(api_key_id, idempotency_key, lease, StoredResponse(200, body))
+            lease = None
         
-        return response_obj
+        return Response(content=body, media_type="application/json")
 
+    except RateLimitExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+    except ProviderUnavailableError as e:
+        # Circuit open or load shed - tell the client when to come back
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
     except (ProviderTemporaryError, ProviderPermanentError) as e:
         logger.error(f"Inference failed: {e}")
-        # Cleanup idempotency key on failure so user can retry
-        if idempotency_key:
-             async with AsyncSessionLocal() as db:
-                # Need to import delete
-                from sqlalchemy import delete
-                await db.execute(delete(IdempotencyKey).where(IdempotencyKey.idempotency_key == idempotency_key))
-                await db.commit()
-                
         raise HTTPException(status_code=503, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Unexpected inference error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal inference error")
+    finally:
+        # Failed or cancelled - no tokens were used
+        if charge is not None:
+            token_limiter.settle(charge, 0)
+        # Failed or cancelled - free the key so the client can retry
+        if lease is not None:
+            await idempotency_store.release(api_key_id, idempotency_key, lease)
+
+
+@router.post("/infer/stream")
+async def infer_stream_endpoint(request: Request, req: InferRequest):
+    """
+    Streaming inference over server-sent events.
+    - Emits `data: {"text": ...}` frames as the provider produces them
+    - Ends with an `event: done` frame, or `event: error` if the provider fails mid-stream
+    - Client disconnect cancels the upstream provider stream
+    """
+    api_key_id = request.state.api_key.id
+
+    # Resolve before the response starts so unknown models still get a 400
+    try:
+        provider = resolve_provider(req.model, req.prompt, req.max_tokens)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Charge before the response starts so an over-limit key gets a real 429
+    try:
+        with RATELIMIT_SECONDS.time("tokens"), span("token_limit"):
+            charge = await token_limiter.acquire(
+                request.state.api_key, req.max_tokens + provider.count_prompt_tokens(req.prompt)
+            )
+    except RateLimitExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+
+    settled = False
+
+    def on_usage(tokens: int):
+        nonlocal settled
+        settled = True
+        token_limiter.settle(charge, tokens)
+
+    async def refund_if_unstarted():
+        # The client went away before events() ran (a never-started generator
+        # skips its finally blocks), so stream_inference never reported usage
+        if not settled:
+            token_limiter.settle(charge, 0)
+
+    async def events():
+        try:
+            # aclosing: if we are closed at a yield, close the inner stream (and upstream) too
+            async with aclosing(stream_inference(provider, req.model, req.prompt, req.max_tokens, api_key_id,
+                                                  on_usage=on_usage)) as chunks:
+                async for text in chunks:
+                    yield sse_event({"text": text})
+        except (ProviderTemporaryError, ProviderPermanentError, ValueError) as e:
+            logger.error(f"Streaming inference failed: {e}")
+            yield sse_event({"detail": str(e)}, event="error")
+            return
+        yield sse_event({"provider": provider.name}, event="done")
+
+    return EventSourceResponse(events(), headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                               background=BackgroundTask(refund_if_unstarted))
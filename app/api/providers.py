@@ -1,12 +1,14 @@
 from fastapi import APIRouter
 from ..providers.registry import list_providers
+from ..providers.circuit_breaker import circuit_breakers
+from ..providers.admission import admission_controllers
 import asyncio
 
 router = APIRouter(prefix="/providers", tags=["providers"])
 
 @router.get("/")
 async def get_providers():
-    # List all available providers with health status
+    # List all available providers with health status, circuit breaker and admission state
     providers_list = list_providers()
     # Collect health check coroutines
     health_tasks = [(name, provider.is_healthy()) for name, provider in providers_list]
@@ -16,8 +18,12 @@ async def get_providers():
     providers = []
     for (name, _), result in zip(health_tasks, results):
         healthy = result is True
+        breaker = circuit_breakers.get(name)
+        controller = admission_controllers.get(name)
         providers.append({
             "name": name,
-            "healthy": healthy
+            "healthy": healthy,
+            "circuit": breaker.snapshot() if breaker else None,
+            "admission": controller.stats() if controller else None
         })
-    return providers
\ No newline at end of file
+    return providers
@@ -11,4 +11,7 @@ class InferResponse(BaseModel):
     provider:str="mock"
     latency_ms: float
     tokens_used: int
+    input_tokens: int = 0
+    output_tokens: int = 0
     model: str
+    fallback_hops: int = 0
@@ -1,69 +1,164 @@
 import secrets
 import bcrypt
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import hmac
+import logging
+import time
 from typing import Optional
-from sqlalchemy import select
+from cachetools import TTLCache
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..db.base import APIKey
 from ..db.session import get_db
+from ..config import settings
+from .key_cache import key_cache
+from ..utils.prometheus import registry
 from fastapi import HTTPException, status, Header, Depends
 
+logger = logging.getLogger(__name__)
+
+# bcrypt gets its own sized pool: auth latency must not depend on how busy
+# the default executor is with other blocking work
+_auth_executor = ThreadPoolExecutor(max_workers=settings.AUTH_EXECUTOR_WORKERS, thread_name_prefix="auth")
+_auth_pending = 0  # bcrypt jobs submitted and not finished
+
+
+async def _run_bcrypt(fn, *args):
+    global _auth_pending
+    _auth_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_auth_executor, fn, *args)
+    finally:
+        _auth_pending -= 1
+
+
+registry.gauge("gateway_executor_queue_depth", "bcrypt jobs waiting for a thread",
+               lambda: {("auth",): max(0, _auth_pending - settings.AUTH_EXECUTOR_WORKERS)}, ("executor",))
+
+
+# Fingerprints the legacy scan matched no key for: repeating an invalid key
+# (or retrying a revoked one) doesn't pay the scan again
+_legacy_misses: TTLCache = TTLCache(maxsize=settings.API_KEY_CACHE_MAXSIZE, ttl=settings.API_KEY_LEGACY_MISS_TTL)
+_legacy_cap_logged_at = float("-inf")
+
+
+def fingerprint_api_key(raw_key: str) -> str:
+    """Keyed HMAC-SHA256 of the raw key, stored in the indexed key_fingerprint column."""
+    secret = (settings.API_KEY_HMAC_SECRET or settings.SECRET_KEY).encode()
+    return hmac.new(secret, raw_key.encode(), hashlib.sha256).hexdigest()
+
+
+async def _check_hash(raw_key: str, key_hash: str) -> bool:
+    # bcrypt is CPU bound - keep it off the event loop
+    return await _run_bcrypt(bcrypt.checkpw, raw_key.encode(), key_hash.encode())
+
 
 async def create_api_key(db: AsyncSession, owner_id: int) -> str:
     # generate secure random API keys, hash it, store active entry
     raw_key = secrets.token_urlsafe(32)  # 43 chars, cryptographically secure
-    loop = asyncio.get_running_loop()
 
     def _compute_hash(key: str) -> str:
         return bcrypt.hashpw(key.encode(), bcrypt.gensalt()).decode()
 
-    key_hash = await loop.run_in_executor(None, _compute_hash, raw_key)
+    key_hash = await _run_bcrypt(_compute_hash, raw_key)
 
-    api_key = APIKey(key_hash=key_hash, rate_limit=100, active=True, owner_id=owner_id)
+    api_key = APIKey(
+        key_hash=key_hash,
+        key_fingerprint=fingerprint_api_key(raw_key),
+        rate_limit=100,
+        active=True,
+        owner_id=owner_id
+    )
     db.add(api_key)
     await db.commit()
     await db.refresh(api_key)
     return raw_key  # Return raw (client keeps it), hash stored in DB
 
 
-async def verify_api_key(api_key: Optional[str] = Header(None, alias="X-API-Key"), db: AsyncSession = Depends(get_db)):
-    # Verify raw API key against hashed DB entries
-    if not api_key:
-        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "API key required (provide X-API-Key header)")
+async def revoke_api_key(db: AsyncSession, key_id: int, owner_id: int) -> bool:
+    """Deactivate a key and evict it from every worker's key cache."""
+    result = await db.execute(
+        update(APIKey)
+        .where(APIKey.id == key_id, APIKey.owner_id == owner_id, APIKey.active == True)
+        .values(active=False)
+    )
+    await db.commit()
+    if result.rowcount == 0:
+        return False
+    await key_cache.publish_invalidation(key_id)
+    return True
 
-    key_bytes = api_key.encode()
-    result = await db.execute(select(APIKey).where(APIKey.active == True))
-    db_keys = result.scalars().all()
 
-    if not db_keys:
-        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid API key")
+def _log_legacy_cap(limit: int):
+    # Loud, but at most once per miss TTL - any invalid key can get here
+    global _legacy_cap_logged_at
+    now = time.monotonic()
+    if now - _legacy_cap_logged_at < settings.API_KEY_LEGACY_MISS_TTL:
+        return
+    _legacy_cap_logged_at = now
+    logger.error(
+        f"More than {limit} active API keys have no fingerprint; only the first {limit} can authenticate. "
+        f"Raise API_KEY_LEGACY_SCAN_MAX briefly or deactivate abandoned keys (see migrations/003)."
+    )
 
-    loop = asyncio.get_running_loop()
-    max_concurrency = 50
-    semaphore = asyncio.Semaphore(max_concurrency)
 
-    async def _check_db_key(db_key: APIKey) -> Optional[APIKey]:
-        """Check if key matches and return the db_key on match, None otherwise."""
-        async with semaphore:
-            is_match = await loop.run_in_executor(None, bcrypt.checkpw, key_bytes, db_key.key_hash.encode())
-            return db_key if is_match else None
+async def _legacy_lookup(db: AsyncSession, raw_key: str, fingerprint: str) -> Optional[APIKey]:
+    """
+    Fallback for keys created before fingerprints existed.
+    Only scans rows without a fingerprint and backfills the match, so each
+    legacy key pays the scan once; afterwards it takes the indexed path.
+    Any key can trigger the scan, so it is capped at API_KEY_LEGACY_SCAN_MAX
+    bcrypt checks and misses are remembered for API_KEY_LEGACY_MISS_TTL.
+    """
+    if fingerprint in _legacy_misses:
+        return None
+    limit = settings.API_KEY_LEGACY_SCAN_MAX
+    result = await db.execute(
+        select(APIKey).where(APIKey.active == True, APIKey.key_fingerprint.is_(None))
+        .order_by(APIKey.id).limit(limit + 1)
+    )
+    legacy = result.scalars().all()
+    if len(legacy) > limit:
+        legacy = legacy[:limit]
+        _log_legacy_cap(limit)
+    for db_key in legacy:
+        if await _check_hash(raw_key, db_key.key_hash):
+            db_key.key_fingerprint = fingerprint
+            await db.commit()
+            return db_key
+    _legacy_misses[fingerprint] = True
+    return None
 
-    tasks = [asyncio.create_task(_check_db_key(db_key)) for db_key in db_keys]
 
-    try:
-        for fut in asyncio.as_completed(tasks):
-            try:
-                match = await fut
-            except asyncio.CancelledError:
-                continue
-            if match:
-                # cancel remaining tasks
-                for t in tasks:
-                    if not t.done():
-                        t.cancel()
-                return match  # Valid key found (the db_key itself)
-    finally:
-        # ensure all tasks are cleaned up
-        await asyncio.gather(*tasks, return_exceptions=True)
+async def lookup_api_key(db: AsyncSession, raw_key: str) -> Optional[APIKey]:
+    """
+    Resolve a raw API key to its active DB row.
+    One indexed SELECT on key_fingerprint plus at most one bcrypt check
+    (up to API_KEY_LEGACY_SCAN_MAX more while legacy keys remain).
+    """
+    fingerprint = fingerprint_api_key(raw_key)
+    result = await db.execute(
+        select(APIKey).where(APIKey.key_fingerprint == fingerprint, APIKey.active == True)
+    )
+    db_key = result.scalar_one_or_none()
+
+    if db_key is not None:
+        # Defence in depth: fingerprint matched, confirm against the bcrypt hash
+        return db_key if await _check_hash(raw_key, db_key.key_hash) else None
+
+    if settings.API_KEY_LEGACY_SCAN:
+        return await _legacy_lookup(db, raw_key, fingerprint)
+    return None
 
-    raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid API key")
\ No newline at end of file
+
+async def verify_api_key(api_key: Optional[str] = Header(None, alias="X-API-Key"), db: AsyncSession = Depends(get_db)):
+    # Verify raw API key against hashed DB entries
+    if not api_key:
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "API key required (provide X-API-Key header)")
+
+    db_key = await lookup_api_key(db, api_key)
+    if db_key is None:
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid API key")
+    return db_key
@@ -0,0 +1,191 @@
+# In-process snapshot cache of validated API keys
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from ..config import settings
+from ..db.base import APIKey
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "apikey:invalidate"
+
+
+@dataclass(frozen=True)
+class APIKeyRecord:
+    """Immutable snapshot of an APIKey row - safe to share between requests."""
+    id: int
+    owner_id: int
+    active: bool
+    rate_limit: int
+    near_duplicate_cache: bool = False
+    token_limit: Optional[int] = None  # tokens/minute; None = RATE_LIMIT_DEFAULT_TPM
+
+    @classmethod
+    def from_model(cls, api_key: APIKey) -> "APIKeyRecord":
+        return cls(
+            id=api_key.id,
+            owner_id=api_key.owner_id,
+            active=api_key.active,
+            rate_limit=api_key.rate_limit,
+            near_duplicate_cache=bool(api_key.near_duplicate_cache),
+            token_limit=api_key.token_limit
+        )
+
+
+class LocalInvalidationBus:
+    """In-process stand-in for the Redis bus (single worker, tests)."""
+
+    def __init__(self):
+        self._subscribers: list[Callable[[int], None]] = []
+
+    async def start(self, on_invalidate: Callable[[int], None], on_reset: Callable[[], None]):
+        self._subscribers.append(on_invalidate)
+
+    async def stop(self):
+        self._subscribers.clear()
+
+    async def publish(self, key_id: int):
+        for callback in list(self._subscribers):
+            callback(key_id)
+
+
+class RedisInvalidationBus:
+    """Broadcasts key invalidations to every worker over Redis pub/sub."""
+
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, redis, channel: str = INVALIDATION_CHANNEL):
+        self.redis = redis
+        self.channel = channel
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, on_invalidate: Callable[[int], None], on_reset: Callable[[], None]):
+        self._task = asyncio.create_task(self._listen(on_invalidate, on_reset))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def publish(self, key_id: int):
+        await self.redis.publish(self.channel, str(key_id))
+
+    async def _listen(self, on_invalidate: Callable[[int], None], on_reset: Callable[[], None]):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Anything published while we were not subscribed is lost - start clean
+                on_reset()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        on_invalidate(int(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"API key invalidation listener error, reconnecting: {e}")
+                on_reset()
+                await asyncio.sleep(self.RECONNECT_DELAY)
+            finally:
+                await pubsub.aclose()
+
+
+class APIKeyCache:
+    """
+    Maps sha256(raw key) -> APIKeyRecord so cache hits need no DB access.
+
+    All mutation happens on the event loop without awaiting, so reads are a
+    plain dict lookup and need no lock. Staleness is bounded by the bus
+    (revocations are pushed to every worker) and by the TTL as a backstop.
+    """
+
+    def __init__(self, bus, ttl: float, maxsize: int):
+        self.bus = bus
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: Dict[str, Tuple[APIKeyRecord, float]] = {}
+        self._by_id: Dict[int, Set[str]] = {}
+        # Bumped on every invalidation; fills started before a bump are discarded
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cache_key: str) -> Optional[APIKeyRecord]:
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            self.misses += 1
+            return None
+        record, expires_at = entry
+        if expires_at < time.monotonic():
+            self._discard(cache_key, record.id)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return record
+
+    def put(self, cache_key: str, record: APIKeyRecord, generation: int):
+        # The DB read may predate a revocation that arrived while we awaited it
+        if generation != self.generation or not record.active:
+            return
+        if len(self._entries) >= self.maxsize and cache_key not in self._entries:
+            # Dicts keep insertion order - evict the oldest fill
+            oldest_key = next(iter(self._entries))
+            self._discard(oldest_key, self._entries[oldest_key][0].id)
+        self._entries[cache_key] = (record, time.monotonic() + self.ttl)
+        self._by_id.setdefault(record.id, set()).add(cache_key)
+
+    def invalidate(self, key_id: int):
+        self.generation += 1
+        for cache_key in self._by_id.pop(key_id, ()):
+            self._entries.pop(cache_key, None)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self._by_id.clear()
+
+    def _discard(self, cache_key: str, key_id: int):
+        self._entries.pop(cache_key, None)
+        keys = self._by_id.get(key_id)
+        if keys is not None:
+            keys.discard(cache_key)
+            if not keys:
+                del self._by_id[key_id]
+
+    async def start(self):
+        await self.bus.start(self.invalidate, self.clear)
+
+    async def stop(self):
+        await self.bus.stop()
+
+    async def publish_invalidation(self, key_id: int):
+        # Drop locally right away; the bus fans out to the other workers
+        self.invalidate(key_id)
+        await self.bus.publish(key_id)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "generation": self.generation
+        }
+
+
+def _build_bus():
+    if settings.API_KEY_CACHE_BUS == "local":
+        return LocalInvalidationBus()
+    from ..utils.redis_client import redis_client
+    return RedisInvalidationBus(redis_client)
+
+
+# Global singleton
+key_cache = APIKeyCache(
+    _build_bus(),
+    ttl=settings.API_KEY_CACHE_TTL,
+    maxsize=settings.API_KEY_CACHE_MAXSIZE
+)
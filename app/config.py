@@ -2,6 +2,7 @@ import os
 from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from pydantic_settings import BaseSettings
+from typing import Dict, List
 
 load_dotenv()
 
@@ -10,6 +11,127 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-here"  # Default, should be overridden by env var
     REDIS_URL: str = "redis://localhost:6379/0" # Default Redis URL
 
+    # API key fingerprinting (HMAC secret falls back to SECRET_KEY when unset)
+    API_KEY_HMAC_SECRET: str = ""
+    API_KEY_LEGACY_SCAN: bool = True  # bcrypt-scan keys without a fingerprint; disable once backfilled
+    API_KEY_LEGACY_SCAN_MAX: int = 20  # bcrypt checks one scan may cost; keys past it are logged, not matched
+    API_KEY_LEGACY_MISS_TTL: int = 60  # seconds a key the scan didn't match skips the scan
+
+    # Validated API key snapshot cache
+    API_KEY_CACHE_TTL: int = 60  # seconds; upper bound on staleness if an invalidation is missed
+    API_KEY_CACHE_MAXSIZE: int = 10000
+    AUTH_EXECUTOR_WORKERS: int = 4  # dedicated bcrypt threads (bcrypt releases the GIL)
+    API_KEY_CACHE_BUS: str = "redis"  # "redis" (pub/sub across workers) or "local" (single process/tests)
+
+    # Batched request-log writer
+    LOG_SINK_MAX_QUEUE: int = 10000  # rows buffered in memory before the overflow policy applies
+    LOG_SINK_BATCH_SIZE: int = 500
+    LOG_SINK_FLUSH_INTERVAL: float = 1.0  # seconds
+    LOG_SINK_OVERFLOW_POLICY: str = "drop_oldest"  # "drop_oldest", "drop_newest" or "spill"
+    LOG_SINK_SPILL_PATH: str = "request_logs.spill.jsonl"  # also used for rows left over at shutdown
+    LOG_SINK_DRAIN_TIMEOUT: float = 10.0  # seconds allowed for the final flush on shutdown
+
+    # Exact-match response cache (opt-in)
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_TTL: int = 3600  # seconds, both tiers
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # in-process tier size bound
+    RESPONSE_CACHE_REDIS: bool = True  # shared tier across workers
+
+    # Near-duplicate prompt cache (SimHash/LSH, in-process; keys opt in via api_keys.near_duplicate_cache)
+    NEAR_DUP_CACHE_ENABLED: bool = False
+    NEAR_DUP_CACHE_THRESHOLD: float = 0.95  # min SimHash similarity (1 - hamming/64); >= 0.7656 (16 LSH bands)
+    NEAR_DUP_CACHE_MAX_ENTRIES: int = 100_000
+
+    # Coalesce identical in-flight (provider, prompt, max_tokens) requests into one upstream call
+    SINGLEFLIGHT_ENABLED: bool = True
+
+    # Idempotency-Key store
+    IDEMPOTENCY_BACKEND: str = "redis"  # "redis", "postgres" or "memory" (single process/tests)
+    IDEMPOTENCY_LEASE_SECONDS: float = 60.0  # a leader that hasn't finished by then is presumed dead
+    IDEMPOTENCY_TTL_SECONDS: int = 86400  # how long completed responses are replayed
+    IDEMPOTENCY_WAIT_TIMEOUT: float = 30.0  # max time a duplicate waits for the leader before 409
+    IDEMPOTENCY_SWEEP_INTERVAL: float = 300.0  # postgres backend only; Redis expires keys itself
+
+    # Hourly/daily rollups of request_logs read by the analytics endpoints
+    ROLLUP_ENABLED: bool = True
+    ROLLUP_INTERVAL_SECONDS: float = 60.0  # how often the compactor looks for whole hours to roll up
+    ROLLUP_LAG_SECONDS: float = 300.0  # an hour is rolled only this long after it ends (in-flight inserts)
+    ROLLUP_AUDIT_HOURS: int = 24  # hours below the watermark /analytics/rollups checks for rows never rolled up
+    ROLLUP_MAX_HOURS_PER_RUN: int = 24  # bounds one transaction while backfilling history
+
+    # Time-range partitions of request_logs
+    REQUEST_LOG_PARTITION_INTERVAL: str = "day"  # "day" or "week" (UTC; weeks start on Monday)
+    REQUEST_LOG_PARTITIONS_AHEAD: int = 7  # future partitions kept created beyond the current one
+    REQUEST_LOG_RETENTION_DAYS: int = 0  # partitions entirely older than this are dropped; 0 = keep forever
+    REQUEST_LOG_PARTITION_CHECK_SECONDS: float = 3600.0
+
+    # Per-key token buckets: APIKey.rate_limit requests/min and APIKey.token_limit tokens/min
+    RATE_LIMIT_BACKEND: str = "redis"  # "redis" (atomic Lua, shared by all workers) or "memory" (single process/tests)
+    RATE_LIMIT_DEFAULT_TPM: int = 100_000  # for keys whose token_limit is NULL
+    RATE_LIMIT_DEFAULT: str = "100 per minute"  # global limit on every request, per key + client address
+    # Leased limits (global default limit, api_key_limiter): workers sync with Redis per lease, not per request
+    RATE_LIMIT_LEASE_FRACTION: float = 0.1  # share of a key's budget a worker leases at a time
+    RATE_LIMIT_LEASE_MAX: int = 50  # cap on a single lease; overshoot is bounded by workers * lease size
+    RATE_LIMIT_LEASE_TTL: float = 2.0  # seconds before unused leased tokens go back to Redis
+
+    # Per-provider circuit breakers (trip on failure rate or slow-call rate)
+    CIRCUIT_BREAKER_ENABLED: bool = True
+    CIRCUIT_FAILURE_RATE: float = 0.5  # share of failed calls in the window that opens the circuit
+    CIRCUIT_SLOW_CALL_MS: float = 10_000.0  # calls slower than this (incl. provider retries) count as slow
+    CIRCUIT_SLOW_CALL_RATE: float = 0.5  # share of slow calls in the window that opens the circuit
+    CIRCUIT_WINDOW_SIZE: int = 20  # last N calls considered
+    CIRCUIT_MIN_CALLS: int = 5  # don't judge a provider on fewer calls than this
+    CIRCUIT_OPEN_SECONDS: float = 30.0  # fail fast for this long before probing again
+    CIRCUIT_HALF_OPEN_PROBES: int = 2  # probe requests admitted (and needed to close) when half-open
+
+    # Per-provider admission control: calls beyond the concurrency limit wait in a
+    # bounded FIFO queue; if the expected wait exceeds the budget they are shed (503)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_DEFAULT_CONCURRENCY: int = 64
+    ADMISSION_MAX_CONCURRENCY: Dict[str, int] = {}  # per-provider overrides, e.g. {"gemini": 32}
+    ADMISSION_MAX_QUEUE: int = 256
+    ADMISSION_MAX_WAIT_MS: float = 2000.0  # expected queueing delay budget
+
+    # Cross-provider failover on temporary errors. Keyed by requested model ("auto",
+    # "openai", ...) with "*" as the default; the selected provider is always tried first.
+    FALLBACK_CHAINS: Dict[str, List[str]] = {"*": ["openai", "gemini"], "mock": []}
+    FALLBACK_DEADLINE_SECONDS: float = 30.0  # total budget across all attempts of one request
+
+    # Hedged requests (model="auto" only): if the primary hasn't answered by its
+    # observed p95, race the next-best provider; first response wins
+    HEDGING_ENABLED: bool = False
+    HEDGE_BUDGET_RATIO: float = 0.05  # max extra upstream calls per eligible request
+    HEDGE_MAX_BURST: float = 10.0  # hedges that can be banked during quiet periods
+    HEDGE_MIN_DELAY_MS: float = 50.0  # never hedge sooner than this, whatever the p95 says
+
+    # Prometheus /metrics (stage latency histograms, request counters, pool/queue gauges)
+    METRICS_ENABLED: bool = True
+    METRICS_BEARER_TOKEN: str = ""  # scrapers send "Authorization: Bearer <token>"; /metrics is off while unset
+    METRICS_BACKEND: str = "redis"  # "redis" (summed across workers) or "memory" (this process only)
+    METRICS_FLUSH_INTERVAL: float = 5.0  # seconds between a worker's pushes; bounds how stale other workers' data is
+
+    # Deterministic mock provider (model="mock") for load tests; never picked by "auto"
+    MOCK_PROVIDER_ENABLED: bool = False
+    MOCK_LATENCY_MS: float = 200.0  # median for lognormal, mean otherwise
+    MOCK_LATENCY_DISTRIBUTION: str = "lognormal"  # "fixed", "uniform", "normal", "lognormal" or "exponential"
+    MOCK_LATENCY_SPREAD: float = 0.5  # lognormal sigma; relative stdev (normal) or half-width (uniform)
+    MOCK_TEMPORARY_ERROR_RATE: float = 0.0
+    MOCK_PERMANENT_ERROR_RATE: float = 0.0
+    MOCK_OUTPUT_TOKENS: int = 64  # capped by the request's max_tokens
+    MOCK_STREAM_CHUNK_TOKENS: int = 4
+    MOCK_STREAM_TTFT_RATIO: float = 0.3  # share of the latency before the first streamed chunk
+    MOCK_SEED: int = 0
+
+    # Per-request stage timing (Server-Timing header) and sampled trace export
+    TRACING_SERVER_TIMING: bool = True
+    TRACING_SAMPLE_RATE: float = 0.0  # share of requests whose full trace is exported; when > 0 a sampled traceparent forces it
+    TRACING_EXPORTER: str = "jsonl"  # "jsonl" (file) or "otlp" (OTLP/HTTP JSON, e.g. a local collector)
+    TRACING_JSONL_PATH: str = "traces.jsonl"
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_SERVICE_NAME: str = "inference-gateway"
+    TRACING_FLUSH_INTERVAL: float = 2.0  # seconds
+    TRACING_MAX_BUFFER: int = 1000  # sampled traces waiting for export; oldest dropped beyond this
+
     class Config:
         env_file = ".env"
         extra = "ignore"  # Allow extra env vars (OpenAI, Gemini keys, etc.)
@@ -1,6 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String , Integer , Boolean, Float, DateTime, func, ForeignKey
+from sqlalchemy import String , Integer , BigInteger, Boolean, Float, DateTime, LargeBinary, func, ForeignKey
+from typing import Optional
 
 class Base(AsyncAttrs, DeclarativeBase):
     pass # All models will inherit from this base class 
@@ -18,26 +19,72 @@ class APIKey(Base):
 
     id: Mapped[int] = mapped_column(primary_key = True, index = True)
     key_hash: Mapped[str] = mapped_column(String(255), unique = True, index = True) 
+    # HMAC-SHA256 of the raw key; indexed so auth is a single lookup. NULL for legacy keys until first use.
+    key_fingerprint: Mapped[Optional[str]] = mapped_column(String(64), unique = True, index = True, nullable = True)
     rate_limit: Mapped[int] = mapped_column(Integer) # requests/minute, etc 
+    token_limit: Mapped[Optional[int]] = mapped_column(Integer, nullable = True) # tokens/minute; NULL = RATE_LIMIT_DEFAULT_TPM
     active: Mapped[bool] = mapped_column(Boolean, server_default = "true")
     owner_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    near_duplicate_cache: Mapped[bool] = mapped_column(Boolean, server_default = "false") # Opt-in to near-duplicate response cache
 
 class RequestLog(Base): 
     __tablename__ = "request_logs" 
+    # Range-partitioned on timestamp; partitions are created ahead of time and
+    # dropped for retention by RequestLogPartitionManager
+    __table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"}
 
-    id: Mapped[int] = mapped_column(primary_key = True, index = True) 
+    id: Mapped[int] = mapped_column(primary_key = True, autoincrement = True, index = True) 
     api_key_id: Mapped[int] = mapped_column(Integer, ForeignKey("api_keys.id"), nullable=True, index=True) # Link to API Key
     provider : Mapped[str] = mapped_column(String(100)) # eg : "openai", "groq", etc
     model : Mapped[str] = mapped_column(String(100), nullable=True) # Specific model used
     latency: Mapped[float] = mapped_column(Float) # eg : ms or seconds 
     token_count: Mapped[int] = mapped_column(Integer) 
+    input_tokens: Mapped[int] = mapped_column(Integer, server_default = "0") # Prompt share of token_count
+    output_tokens: Mapped[int] = mapped_column(Integer, server_default = "0") # Completion share of token_count
     cost: Mapped[float] = mapped_column(Float) # eg: In ₹ or $ 
     status: Mapped[str] = mapped_column(String(50)) # eg: "success", "failure"
+    ttft_ms: Mapped[Optional[float]] = mapped_column(Float, nullable=True) # Streaming: time to first token
+    stream_duration_ms: Mapped[Optional[float]] = mapped_column(Float, nullable=True) # Streaming: total stream time
+    coalesced: Mapped[bool] = mapped_column(Boolean, server_default = "false") # Shared another request's upstream call
+    fallback_hops: Mapped[int] = mapped_column(Integer, server_default = "0") # Failovers before `provider` served it
+    hedged: Mapped[bool] = mapped_column(Boolean, server_default = "false") # Winner or loser of a hedged request
+    requested_at: Mapped[Optional[DateTime]] = mapped_column(DateTime(timezone = True), nullable = True) # When the request was logged
     timestamp: Mapped[DateTime] = mapped_column(
         DateTime(timezone = True), 
-        server_default = func.now()
+        server_default = func.now(),
+        primary_key = True, # The partition key must be part of the primary key
+        index = True # Analytics range scans and the rollup compactor
     )
 
+class RequestLogRollup:
+    # Columns shared by the rollup tables: request_logs pre-aggregated per
+    # (bucket, api_key_id, provider, model, status), maintained by RollupCompactor
+    bucket: Mapped[DateTime] = mapped_column(DateTime(timezone = True), primary_key = True) # Hour/day start (UTC)
+    api_key_id: Mapped[int] = mapped_column(Integer, primary_key = True) # 0 = logged without a key
+    provider: Mapped[str] = mapped_column(String(100), primary_key = True)
+    model: Mapped[str] = mapped_column(String(100), primary_key = True) # '' = not recorded
+    status: Mapped[str] = mapped_column(String(50), primary_key = True)
+    request_count: Mapped[int] = mapped_column(BigInteger, server_default = "0")
+    token_count: Mapped[int] = mapped_column(BigInteger, server_default = "0")
+    input_tokens: Mapped[int] = mapped_column(BigInteger, server_default = "0")
+    output_tokens: Mapped[int] = mapped_column(BigInteger, server_default = "0")
+    cost: Mapped[float] = mapped_column(Float, server_default = "0")
+    hedged_count: Mapped[int] = mapped_column(BigInteger, server_default = "0") # Part of a hedged request
+    hedged_cost: Mapped[float] = mapped_column(Float, server_default = "0") # and what those cost
+    latency_sketch: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable = True) # Encoded LatencySketch
+
+class RequestLogHourly(RequestLogRollup, Base):
+    __tablename__ = "request_log_rollups_hourly"
+
+class RequestLogDaily(RequestLogRollup, Base):
+    __tablename__ = "request_log_rollups_daily"
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+
+    name: Mapped[str] = mapped_column(String(50), primary_key = True)
+    rolled_until: Mapped[DateTime] = mapped_column(DateTime(timezone = True)) # Everything before this is in the rollups
+
 class IdempotencyKey(Base):
     __tablename__ = "idempotency_keys"
 
@@ -1,7 +1,10 @@
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import AsyncSession
-from ..config import AsyncSessionLocal # From parent config 
+from ..config import AsyncSessionLocal, engine # From parent config 
+from ..utils.prometheus import registry
+
+registry.gauge("gateway_db_pool_checked_out", "DB connections checked out of the pool", lambda: engine.pool.checkedout())
 
 @asynccontextmanager
 async def get_session() -> AsyncGenerator[AsyncSession, None]: 
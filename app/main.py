@@ -1,20 +1,34 @@
+import hmac
 import logging
 import time
-from fastapi import FastAPI, Depends, Body, HTTPException, status
+from fastapi import FastAPI, Depends, Body, HTTPException, Request, status
+from fastapi.responses import Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text, select
 from sqlalchemy.exc import IntegrityError, DatabaseError
 from contextlib import asynccontextmanager
 from .db.session import get_db
-from .db.base import Base, User, IdempotencyKey
+from .db.base import Base, User
 from .config import engine
 from .auth.jwt import create_access_token, Token, get_current_user, verify_password
-from .auth.apikey import create_api_key, verify_api_key
+from .auth.apikey import create_api_key, verify_api_key, revoke_api_key
+from .auth.key_cache import key_cache
+from .services.logging_service import log_sink
+from .services.idempotency import idempotency_store
+from .services.rollups import rollup_compactor
+from .services.partitions import partition_manager
+from .utils.prometheus import metrics_store, CONTENT_TYPE
+from .utils.tracing import trace_exporter
+from .config import settings
+from .providers.registry import get_all_providers
 from pydantic import BaseModel,ValidationError
 from typing import Optional
 from .middleware.auth import APIMiddleware
+from .middleware.metrics import InFlightMiddleware
+from .middleware.tracing import TracingMiddleware
 from .api.infer import router as infer_router
 from .api.analytics import router as analytics_router
+from .api.providers import router as providers_router
 
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from .utils.errors import (
@@ -39,7 +53,33 @@ async def lifespan(app: FastAPI):
     # Startup: create DB tables
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # request_logs partitions: current + ahead created before the first log flush, old ones dropped
+    await partition_manager.start()
+    # Subscribe to API key revocations from other workers
+    await key_cache.start()
+    # Batched request-log writer; stop() drains the buffer before exit
+    await log_sink.start()
+    # Expired idempotency leases/responses sweeper (no-op for Redis)
+    await idempotency_store.start()
+    # Hourly/daily analytics rollups, advanced behind a watermark
+    if settings.ROLLUP_ENABLED:
+        await rollup_compactor.start()
+    # Pushes this worker's metrics to Redis so /metrics covers all workers
+    if settings.METRICS_ENABLED:
+        await metrics_store.start()
+    if settings.TRACING_SAMPLE_RATE > 0:
+        await trace_exporter.start()
     yield
+    await trace_exporter.stop()
+    await metrics_store.stop()
+    await rollup_compactor.stop()
+    await partition_manager.stop()
+    await idempotency_store.stop()
+    # Close provider connection pools
+    for provider in get_all_providers():
+        await provider.aclose()
+    await log_sink.stop()
+    await key_cache.stop()
     # Shutdown (if needed)
     # await engine.dispose()
 
@@ -47,6 +87,7 @@ async def lifespan(app: FastAPI):
 app = FastAPI(title="LLM Inference Gateway", lifespan=lifespan)
 app.include_router(infer_router)
 app.include_router(analytics_router)
+app.include_router(providers_router)
 
 # Serve Frontend Locally
 from fastapi.staticfiles import StaticFiles
@@ -82,6 +123,19 @@ async def health_check(db: AsyncSession = Depends(get_db)):
         return {"status": "unhealthy", "db": "disconnected", "error": str(e)}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus scrape endpoint: stage latency histograms, request counters and gauges, summed over workers."""
+    if not settings.METRICS_ENABLED or not settings.METRICS_BEARER_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    # Volumes, error rates and pool state aren't public: only scrapers holding the token
+    token = request.headers.get("authorization", "").removeprefix("Bearer ")
+    if not hmac.compare_digest(token.encode(), settings.METRICS_BEARER_TOKEN.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return Response(content=await metrics_store.render(), media_type=CONTENT_TYPE)
+
+
 # Test endpoint of authentication
 class LoginForm(BaseModel):
     email: str
@@ -118,6 +172,24 @@ async def generate_key(
     key = await create_api_key(db, owner_id=user.id)
     return {"api_key": key, "owner_id": user.id, "message": "Save this securely - shown once"}
 
+
+@app.delete("/api-keys/{key_id}")
+async def revoke_key(
+    key_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Revoke one of the authenticated user's API keys (takes effect on all workers)."""
+    user = await get_user_by_email(db, current_user["email"])
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found"
+        )
+    if not await revoke_api_key(db, key_id, owner_id=user.id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="API key not found")
+    return {"revoked": key_id}
+
 from fastapi import Request, Depends
 
 @app.get("/protected")
@@ -142,7 +214,8 @@ async def protected_apikey(api_key = Depends(verify_api_key)):
     return {"message": "API key auth works!", "key_id": api_key.id}
 
 # Rate limiting
-from .utils.ratelimit import limiter, SlowAPIMiddleware as RateLimitMiddleware, _rate_limit_exceeded_handler
+from .utils.ratelimit import limiter, _rate_limit_exceeded_handler
+from .middleware.ratelimit import RateLimitMiddleware
 from slowapi.errors import RateLimitExceeded
 
 app.state.limiter = limiter
@@ -156,6 +229,10 @@ async def hammer(request: Request):
 
 # Add Auth middleware LAST so it runs FIRST (outermost layer)
 app.add_middleware(APIMiddleware)
+# ...except for tracing, so auth and rate limiting show up in Server-Timing,
+app.add_middleware(TracingMiddleware)
+# ...and the in-flight gauge, which counts every request, rejected ones included
+app.add_middleware(InFlightMiddleware)
 
 # Exception handlers (order matters—specific first)
 app.add_exception_handler(ValidationError, validation_exception_handler)
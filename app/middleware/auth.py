@@ -1,78 +1,84 @@
-# Global API Key middleware 
-from fastapi import Request, HTTPException, status
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-import bcrypt
+# Global API Key middleware (pure ASGI - no BaseHTTPMiddleware task/stream wrapping)
 import hashlib
-from cachetools import TTLCache
-import asyncio
+import re
+import time
+from fastapi import status
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
 from ..db.session import get_session
-from ..db.base import APIKey
-
-# In-memory cache for validated API keys (hash -> key_id)
-# TTL of 1 hour, max 1000 keys
-api_key_cache = TTLCache(maxsize=1000, ttl=3600)
-cache_lock = asyncio.Lock()
-
-class APIMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request:Request, call_next):
-        # Skip health/root/frontend and auth endpoints
-        # Also skip analytics (uses JWT)
-        if (request.url.path in ["/", "/health", "/login", "/api-keys", "/docs", "/openapi.json"] 
-            or request.url.path.startswith("/analytics")
-            or request.url.path.startswith("/frontend")):
-            return await call_next(request)
-        
-        api_key_header = request.headers.get("X-API-KEY") or request.headers.get("Authorization")
+from ..auth.apikey import lookup_api_key
+from ..auth.key_cache import key_cache, APIKeyRecord
+from ..utils.prometheus import AUTH_SECONDS
+from ..utils.tracing import record
+
+# Skip health/root/frontend and auth endpoints
+# Also skip analytics (uses JWT) and metrics (uses METRICS_BEARER_TOKEN)
+PUBLIC_PATHS = frozenset({"/", "/health", "/metrics", "/login", "/api-keys", "/docs", "/openapi.json"})
+PUBLIC_PREFIXES = ("/api-keys/", "/analytics", "/frontend")
+
+# Precompiled once: a single anchored regex instead of a list scan per request
+_public_prefix = re.compile("|".join(re.escape(prefix) for prefix in PUBLIC_PREFIXES))
+
+
+def is_public_path(path: str) -> bool:
+    return path in PUBLIC_PATHS or _public_prefix.match(path) is not None
+
+
+def _unauthorized(detail: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        content={"detail": detail}
+    )
+
+
+class APIMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or is_public_path(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        api_key_header = headers.get("x-api-key") or headers.get("authorization")
         if not api_key_header:
-            raise HTTPException(status.HTTP_401_UNAUTHORIZED, "API Key required")
+            await _unauthorized("API Key required")(scope, receive, send)
+            return
 
+        start = time.perf_counter()
         # Strip "Bearer" prefix if present
         if api_key_header.startswith("Bearer "):
             api_key_header = api_key_header[len("Bearer "):]
-        
+
         # Use hash of API key as cache key (avoid storing plaintext in cache)
         cache_key = hashlib.sha256(api_key_header.encode()).hexdigest()
-        
-        validated_key = None
-        
-        # Check cache first (thread-safe access)
-        async with cache_lock:
-            cached_key_id = api_key_cache.get(cache_key)
-        
-        if cached_key_id:
-            # Cache hit - fetch by ID (fast indexed lookup)
-            async with get_session() as db:
-                result = await db.execute(
-                    select(APIKey).where(APIKey.id == cached_key_id, APIKey.active == True)
-                )
-                validated_key = result.scalar_one_or_none()
-        
+
+        # Cache hit - served from the in-process snapshot, no DB round trip
+        validated_key = key_cache.get(cache_key)
+        cache = "hit" if validated_key else "miss"
+
         if not validated_key:
-            # Cache miss - do expensive bcrypt validation
+            # Cache miss - indexed fingerprint lookup plus a single bcrypt check, or
+            # a capped bcrypt scan of unfingerprinted keys while API_KEY_LEGACY_SCAN is on
+            generation = key_cache.generation
             async with get_session() as db:
-                result = await db.execute(select(APIKey).where(APIKey.active == True))
-                db_keys = result.scalars().all()
-
-                for db_key in db_keys:
-                    if bcrypt.checkpw(api_key_header.encode(), db_key.key_hash.encode()):
-                        validated_key = db_key
-                        # Cache the key ID
-                        async with cache_lock:
-                            api_key_cache[cache_key] = db_key.id
-                        break
-        
+                db_key = await lookup_api_key(db, api_key_header)
+            if db_key:
+                validated_key = APIKeyRecord.from_model(db_key)
+                key_cache.put(cache_key, validated_key, generation)
+        end = time.perf_counter()
+        AUTH_SECONDS.observe(end - start, cache)
+        record("auth", start, end, cache=cache)
+
         if not validated_key:
-            return JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED, 
-                content={"detail": "Invalid API Key"}
-            )
-        
-        # Attach to request.state for all endpoints 
-        request.state.user_id = validated_key.owner_id
-        request.state.api_key = validated_key
-
-        response = await call_next(request) 
-        return response
\ No newline at end of file
+            await _unauthorized("Invalid API Key")(scope, receive, send)
+            return
+
+        # Attach to scope["state"] - this is what request.state reads in every endpoint
+        state = scope.setdefault("state", {})
+        state["user_id"] = validated_key.owner_id
+        state["api_key"] = validated_key
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,25 @@
+# In-flight request gauge (pure ASGI, outermost)
+from starlette.types import ASGIApp, Receive, Scope, Send
+from ..utils.prometheus import registry
+
+
+class InFlightMiddleware:
+    """Counts HTTP requests being served by this worker, rejected ones included."""
+
+    in_flight = 0
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        InFlightMiddleware.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            InFlightMiddleware.in_flight -= 1
+
+
+registry.gauge("gateway_inflight_requests", "HTTP requests being served", lambda: InFlightMiddleware.in_flight)
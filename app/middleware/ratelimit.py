@@ -0,0 +1,50 @@
+# Global default rate limit middleware (pure ASGI replacement for SlowAPIMiddleware)
+import math
+from fastapi import status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from ..utils.ratelimit import limiter, DEFAULT_LIMITS, scope_rate_limit_key
+from ..utils.leased_limiter import leased_limiter
+from ..utils.prometheus import RATELIMIT_SECONDS
+from ..utils.tracing import span
+
+
+class RateLimitMiddleware:
+    """
+    Applies the default limits to every HTTP request.
+
+    Runs inside APIMiddleware, so scope["state"]["api_key"] is already set for
+    authenticated routes. Per-route limits (@limiter.limit, api_key_limiter)
+    are still enforced by their decorators. Limits are checked against the
+    worker's leased share of each budget, so most requests never touch Redis.
+    """
+
+    def __init__(self, app: ASGIApp, rate_limiter=None, limits=None):
+        self.app = app
+        # Injectable for benchmarks; defaults to the shared leased limiter
+        self.rate_limiter = rate_limiter or leased_limiter
+        self.limits = limits or DEFAULT_LIMITS
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        key = scope_rate_limit_key(scope)
+        rejected = None
+        with RATELIMIT_SECONDS.time("default"), span("ratelimit"):
+            for limit in self.limits:
+                allowed, retry_after = await self.rate_limiter.hit(limit, key)
+                if not allowed:
+                    rejected = limit
+                    break
+        if rejected is not None:
+            response = JSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={"error": f"Rate limit exceeded: {rejected}"},
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
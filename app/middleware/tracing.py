@@ -0,0 +1,54 @@
+# Request trace + Server-Timing header (pure ASGI, wraps auth and rate limiting)
+import random
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..config import settings
+from ..utils import tracing
+from ..utils.tracing import trace_exporter
+
+
+class TracingMiddleware:
+    """
+    Starts a trace per HTTP request so stages deeper down can add spans.
+
+    With server_timing, the stages finished by the time the response starts
+    go out in a Server-Timing header (stages of a streamed body come after
+    the headers, so only show up in exported traces). A sample_rate share of
+    requests, plus those with a sampled W3C traceparent, are exported whole
+    and answer with X-Trace-Id. With neither enabled no trace is started and
+    every span() below is a no-op.
+    """
+
+    def __init__(self, app: ASGIApp, server_timing: bool = None, sample_rate: float = None, exporter=None):
+        self.app = app
+        self.server_timing = settings.TRACING_SERVER_TIMING if server_timing is None else server_timing
+        self.sample_rate = settings.TRACING_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.exporter = exporter or trace_exporter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not (self.server_timing or self.sample_rate > 0):
+            await self.app(scope, receive, send)
+            return
+
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        traceparent = Headers(scope=scope).get("traceparent") if self.sample_rate > 0 else None
+        trace = tracing.begin("request", sampled, traceparent, method=scope["method"], path=scope["path"])
+        status_code = None
+
+        async def send_with_timing(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                if self.server_timing:
+                    headers.append("Server-Timing", trace.server_timing())
+                if trace.sampled:
+                    headers.append("X-Trace-Id", trace.trace_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            tracing.finish(trace, status=status_code)
+            if trace.sampled:
+                self.exporter.export(trace)
@@ -0,0 +1,177 @@
+# Per-provider admission control: bounded concurrency, bounded queue, load shedding
+import asyncio
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, Dict
+from .base import BaseProvider, ProviderResponse, StreamChunk, ProviderUnavailableError
+from ..utils.tracing import span
+
+
+class ProviderOverloadedError(ProviderUnavailableError):
+    """Call shed because the provider's queue is full or the expected wait is over budget."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(provider, retry_after, "overloaded")
+
+
+class AdmissionController:
+    """
+    At most max_concurrency calls in flight; up to max_queue more wait FIFO.
+
+    A caller is shed instead of queued when the queue is full or when its
+    expected wait - queue position / max_concurrency * mean service time -
+    exceeds max_wait_ms, so waiting requests never pile up beyond what can
+    be served within the budget. The expected wait doubles as Retry-After.
+
+    Only touched from the event loop, so no locking. A released slot is
+    handed straight to the next waiter, so a newcomer can't jump the queue.
+    """
+
+    SERVICE_TIME_ALPHA = 0.1
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, max_wait_ms: float,
+                 initial_service_ms: float = 1000.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait_ms = max_wait_ms
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        # EWMA of call durations (ms), used to turn queue depth into expected wait
+        self.service_ms = initial_service_ms
+
+        # Stats
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.max_wait_seen_ms = 0.0
+        self._total_wait_ms = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait_ms(self, position: int = None) -> float:
+        """Expected queueing delay for a caller arriving now (0 if a slot is free)."""
+        if position is None:
+            position = len(self._waiters)
+        if self.in_flight < self.max_concurrency and position == 0:
+            return 0.0
+        return (position + 1) / self.max_concurrency * self.service_ms
+
+    def saturation(self) -> float:
+        """Expected wait as a fraction of the budget: 0 = idle, >= 1 = new calls are shed."""
+        if len(self._waiters) >= self.max_queue and self.in_flight >= self.max_concurrency:
+            return 1.0
+        return self.expected_wait_ms() / self.max_wait_ms if self.max_wait_ms > 0 else 0.0
+
+    def would_admit(self) -> bool:
+        return self.saturation() < 1.0
+
+    async def acquire(self):
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        expected_ms = self.expected_wait_ms()
+        if len(self._waiters) >= self.max_queue or expected_ms > self.max_wait_ms:
+            self.shed += 1
+            raise ProviderOverloadedError(self.name, expected_ms / 1000)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        start = time.perf_counter()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed to us just as we were cancelled - pass it on
+                self.release()
+            elif waiter in self._waiters:
+                # release() may already have popped (and skipped) our cancelled future
+                self._waiters.remove(waiter)
+            raise
+        wait_ms = (time.perf_counter() - start) * 1000
+        self._total_wait_ms += wait_ms
+        self.max_wait_seen_ms = max(self.max_wait_seen_ms, wait_ms)
+        self.admitted += 1
+
+    def release(self, service_ms: float = None):
+        if service_ms is not None:
+            self.service_ms += self.SERVICE_TIME_ALPHA * (service_ms - self.service_ms)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Hand our slot over; in_flight stays the same
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        waited = self.queued - len(self._waiters)
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "expected_wait_ms": round(self.expected_wait_ms(), 2),
+            "avg_service_ms": round(self.service_ms, 2),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "avg_wait_ms": round(self._total_wait_ms / waited, 2) if waited > 0 else 0.0,
+            "max_wait_ms": round(self.max_wait_seen_ms, 2)
+        }
+
+
+class AdmissionProvider(BaseProvider):
+    """Wraps a provider so every call first takes a slot from its AdmissionController."""
+
+    def __init__(self, provider: BaseProvider, controller: AdmissionController):
+        self.provider = provider
+        self.controller = controller
+
+    def __getattr__(self, attr):
+        # Provider-specific attributes (breaker, client, model, ...) pass through
+        return getattr(self.provider, attr)
+
+    @property
+    def name(self) -> str:
+        return self.provider.name
+
+    async def infer(self, prompt: str, max_tokens: int) -> ProviderResponse:
+        with span("admission", provider=self.provider.name):
+            await self.controller.acquire()
+        start = time.perf_counter()
+        try:
+            return await self.provider.infer(prompt, max_tokens)
+        finally:
+            self.controller.release((time.perf_counter() - start) * 1000)
+
+    async def infer_stream(self, prompt: str, max_tokens: int) -> AsyncIterator[StreamChunk]:
+        # A stream holds its slot until it ends; its duration depends on output
+        # length, so it doesn't feed the service-time estimate
+        with span("admission", provider=self.provider.name):
+            await self.controller.acquire()
+        try:
+            async with aclosing(self.provider.infer_stream(prompt, max_tokens)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+        finally:
+            self.controller.release()
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return self.provider.estimate_cost(input_tokens, output_tokens)
+
+    async def is_healthy(self) -> bool:
+        return await self.provider.is_healthy()
+
+    async def aclose(self):
+        await self.provider.aclose()
+
+
+# Provider name -> controller, filled by the provider registry and read by the router
+admission_controllers: Dict[str, AdmissionController] = {}
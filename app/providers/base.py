@@ -1,13 +1,22 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Optional
 from dataclasses import dataclass
 from datetime import datetime
+from .tokenizer import count_tokens, count_prompt_tokens
 
 # Provider-specific exceptions
 class ProviderTemporaryError(Exception):
     """Temporary provider error - can retry with fallback"""
     pass
 
+class ProviderUnavailableError(ProviderTemporaryError):
+    """Call refused by the gateway before reaching the provider (circuit open, overloaded)"""
+
+    def __init__(self, provider: str, retry_after: float, reason: str):
+        super().__init__(f"Provider {provider} is unavailable ({reason}), retry in {max(1, round(retry_after))}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
 class ProviderPermanentError(Exception):
     """Permanent provider error - don't retry"""
     pass
@@ -19,6 +28,17 @@ class ProviderResponse:
     latency_ms: float
     model_used: str
     cost: float
+    input_tokens: int = 0 # Prompt tokens (billed at the input price)
+    output_tokens: int = 0 # Completion tokens (billed at the output price)
+    provider: Optional[str] = None # Set by run_inference: provider that finally served the request
+    fallback_hops: int = 0 # Failovers before it was served (0 = first choice)
+
+@dataclass
+class StreamChunk:
+    text: str
+    tokens_used: Optional[int] = None # Set once the provider reports (or estimates) usage
+    input_tokens: Optional[int] = None # Split of tokens_used, on the same chunk
+    output_tokens: Optional[int] = None
 
 class BaseProvider(ABC):
     # Abstract base for all LLM providers
@@ -34,12 +54,34 @@ class BaseProvider(ABC):
         # Generate inference response 
         pass
     
+    async def infer_stream(self, prompt: str, max_tokens: int) -> AsyncIterator[StreamChunk]:
+        # Stream inference as chunks arrive. Providers without native
+        # streaming fall back to a single chunk with the full completion.
+        result = await self.infer(prompt, max_tokens)
+        yield StreamChunk(text=result.text, tokens_used=result.tokens_used,
+                          input_tokens=result.input_tokens, output_tokens=result.output_tokens)
+
     @abstractmethod
-    def estimate_cost(self, tokens: int) -> float:
-        # Estimate cost based on token usage
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        # Cost of a call from its input/output token split (see pricing.PRICING)
         pass 
+
+    def count_tokens(self, text: str) -> int:
+        # Offline estimate with this provider's tokenizer adapter (memoized)
+        return count_tokens(text, self.name)
+
+    def count_prompt_tokens(self, prompt: str) -> int:
+        return count_prompt_tokens(prompt, self.name)
+
+    def expected_cost(self, prompt: str, max_tokens: int) -> float:
+        # Worst case before dispatch: the whole output budget gets used
+        return self.estimate_cost(self.count_prompt_tokens(prompt), max_tokens)
     
     @abstractmethod
     async def is_healthy(self) -> bool:
         # Health check for provider 
-        pass
\ No newline at end of file
+        pass
+
+    async def aclose(self):
+        # Release pooled connections on shutdown (providers without their own pool: no-op)
+        pass
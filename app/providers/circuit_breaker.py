@@ -0,0 +1,231 @@
+# Per-provider circuit breakers: fail fast while a provider is down
+import asyncio
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, Optional
+from .base import BaseProvider, ProviderResponse, StreamChunk, ProviderPermanentError, ProviderUnavailableError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(ProviderUnavailableError):
+    """Provider call rejected without being attempted because its circuit is open."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(provider, retry_after, "circuit open")
+
+
+class CircuitBreaker:
+    """
+    closed -> open when, over the last window_size calls (at least min_calls),
+    the failure rate or the slow-call rate reaches its threshold.
+    open -> half_open once open_seconds have passed; up to half_open_max_calls
+    probe requests are let through. All probes succeeding closes the circuit,
+    any failed (or slow) probe re-opens it.
+
+    Only touched from the event loop, so no locking.
+    """
+
+    def __init__(self, name: str, failure_rate_threshold: float = 0.5, slow_call_ms: float = 10_000.0,
+                 slow_call_rate_threshold: float = 0.5, window_size: int = 20, min_calls: int = 5,
+                 open_seconds: float = 30.0, half_open_max_calls: int = 2):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_ms = slow_call_ms
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CLOSED
+        # Sliding window of (failed, slow) outcomes with running totals
+        self._window: deque = deque(maxlen=window_size)
+        self._failures = 0
+        self._slow = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        # Stats
+        self.trips = 0
+        self.rejected = 0
+
+    # --- state ---------------------------------------------------------
+
+    def _retry_after(self, now: float) -> float:
+        return max(0.0, self._opened_at + self.open_seconds - now)
+
+    def allows_request(self, now: Optional[float] = None) -> bool:
+        """Would acquire() let a call through right now? (No side effects - used by routing.)"""
+        now = time.monotonic() if now is None else now
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return self._retry_after(now) <= 0
+        return self._probes_in_flight < self.half_open_max_calls
+
+    def acquire(self, now: Optional[float] = None) -> bool:
+        """
+        Admit a call or raise CircuitOpenError. Returns True if the call is a
+        half-open probe; pass that flag back to on_success/on_failure/on_ignored.
+        """
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN:
+            retry_after = self._retry_after(now)
+            if retry_after > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, retry_after)
+            self.state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 1.0)
+            self._probes_in_flight += 1
+            return True
+        return False
+
+    def on_success(self, latency_ms: float, probe: bool, now: Optional[float] = None):
+        slow = latency_ms >= self.slow_call_ms
+        if probe:
+            self._finish_probe(ok=not slow, now=now)
+        elif self.state == CLOSED:
+            self._record(False, slow, now)
+
+    def on_failure(self, probe: bool, now: Optional[float] = None):
+        if probe:
+            self._finish_probe(ok=False, now=now)
+        elif self.state == CLOSED:
+            self._record(True, False, now)
+
+    def on_ignored(self, probe: bool):
+        # Client errors and cancellations say nothing about provider health
+        if probe and self.state == HALF_OPEN:
+            self._probes_in_flight -= 1
+
+    def _record(self, failed: bool, slow: bool, now: Optional[float]):
+        if len(self._window) == self._window.maxlen:
+            old_failed, old_slow = self._window[0]
+            self._failures -= old_failed
+            self._slow -= old_slow
+        self._window.append((failed, slow))
+        self._failures += failed
+        self._slow += slow
+
+        calls = len(self._window)
+        if calls >= self.min_calls and (
+            self._failures / calls >= self.failure_rate_threshold
+            or self._slow / calls >= self.slow_call_rate_threshold
+        ):
+            self._open(now)
+
+    def _finish_probe(self, ok: bool, now: Optional[float]):
+        # A probe admitted before the circuit re-opened has nothing left to decide
+        if self.state != HALF_OPEN:
+            return
+        self._probes_in_flight -= 1
+        if not ok:
+            self._open(now)
+            return
+        self._probe_successes += 1
+        if self._probe_successes >= self.half_open_max_calls:
+            self.state = CLOSED
+            self._window.clear()
+            self._failures = 0
+            self._slow = 0
+
+    def _open(self, now: Optional[float]):
+        self.state = OPEN
+        self._opened_at = time.monotonic() if now is None else now
+        self.trips += 1
+
+    def snapshot(self, now: Optional[float] = None) -> dict:
+        now = time.monotonic() if now is None else now
+        calls = len(self._window)
+        return {
+            "state": self.state,
+            "failure_rate": round(self._failures / calls, 4) if calls else 0.0,
+            "slow_call_rate": round(self._slow / calls, 4) if calls else 0.0,
+            "window_calls": calls,
+            "retry_after_s": round(self._retry_after(now), 2) if self.state == OPEN else 0.0,
+            "probes_in_flight": self._probes_in_flight if self.state == HALF_OPEN else 0,
+            "trips": self.trips,
+            "rejected": self.rejected
+        }
+
+
+class CircuitBreakerProvider(BaseProvider):
+    """Wraps a provider so every call goes through its CircuitBreaker."""
+
+    def __init__(self, provider: BaseProvider, breaker: CircuitBreaker):
+        self.provider = provider
+        self.breaker = breaker
+
+    def __getattr__(self, attr):
+        # Provider-specific attributes (client, model, ...) pass through
+        return getattr(self.provider, attr)
+
+    @property
+    def name(self) -> str:
+        return self.provider.name
+
+    async def infer(self, prompt: str, max_tokens: int) -> ProviderResponse:
+        probe = self.breaker.acquire()
+        start = asyncio.get_event_loop().time()
+        try:
+            # Includes the provider's own retries - a 20 s retry loop is a slow call
+            result = await self.provider.infer(prompt, max_tokens)
+        except (ValueError, ProviderPermanentError):
+            self.breaker.on_ignored(probe)
+            raise
+        except Exception:
+            self.breaker.on_failure(probe)
+            raise
+        except BaseException:
+            self.breaker.on_ignored(probe)
+            raise
+        self.breaker.on_success((asyncio.get_event_loop().time() - start) * 1000, probe)
+        return result
+
+    async def infer_stream(self, prompt: str, max_tokens: int) -> AsyncIterator[StreamChunk]:
+        probe = self.breaker.acquire()
+        start = asyncio.get_event_loop().time()
+        first_chunk_ms = None
+        verdict = None
+        try:
+            async with aclosing(self.provider.infer_stream(prompt, max_tokens)) as chunks:
+                async for chunk in chunks:
+                    if first_chunk_ms is None:
+                        # Stream length depends on max_tokens; judge slowness by time to first chunk
+                        first_chunk_ms = (asyncio.get_event_loop().time() - start) * 1000
+                    yield chunk
+            verdict = "success"
+        except (ValueError, ProviderPermanentError):
+            raise
+        except Exception:
+            verdict = "failure"
+            raise
+        finally:
+            if verdict == "success":
+                self.breaker.on_success(first_chunk_ms or 0.0, probe)
+            elif verdict == "failure":
+                self.breaker.on_failure(probe)
+            else:
+                self.breaker.on_ignored(probe)
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return self.provider.estimate_cost(input_tokens, output_tokens)
+
+    async def is_healthy(self) -> bool:
+        return self.breaker.allows_request() and await self.provider.is_healthy()
+
+    async def aclose(self):
+        await self.provider.aclose()
+
+
+# Provider name -> breaker, filled by the provider registry and read by the router
+circuit_breakers: Dict[str, CircuitBreaker] = {}
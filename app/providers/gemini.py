@@ -1,21 +1,83 @@
-import google.generativeai as genai
+import httpx
+import json
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from .base import BaseProvider, ProviderResponse, ProviderPermanentError, ProviderTemporaryError
+from .base import BaseProvider, ProviderResponse, ProviderPermanentError, ProviderTemporaryError, StreamChunk
+from .pricing import get_price
 import os
 import asyncio
-from typing import Any
+from typing import AsyncIterator, Optional, Tuple
 
 class GeminiProvider(BaseProvider):
+    # Native async REST client: calls share a pooled keep-alive connection set
+    # instead of each occupying a thread in the default executor
+
     def __init__(self):
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self.api_key = os.getenv("GEMINI_API_KEY")
         self.model_name = os.getenv("GEMINI_MODEL_NAME","gemini-1.5-flash")
-        self.model = genai.GenerativeModel(self.model_name)
         self.timeout = int(os.getenv("GEMINI_TIMEOUT", 30))
+        self.base_url = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+        max_connections = int(os.getenv("GEMINI_MAX_CONNECTIONS", 100))
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            headers={"x-goog-api-key": self.api_key or ""},
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60
+            )
+        )
 
     @property
     def name(self) -> str:
         return "gemini"
-    
+
+    def _body(self, prompt: str, max_tokens: int) -> dict:
+        return {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "maxOutputTokens": max_tokens,
+                "temperature": 0.1
+            }
+        }
+
+    @staticmethod
+    def _raise_for_status(status_code: int, detail: str):
+        if status_code < 400:
+            return
+        if status_code in (401, 403):
+            raise ProviderPermanentError("Gemini authorization denied")
+        if status_code in (400, 404):
+            raise ProviderPermanentError(f"Invalid request: {detail}")
+        # 429 and 5xx
+        raise ProviderTemporaryError(f"Temporary error from Gemini ({status_code}): {detail}")
+
+    @staticmethod
+    def _text(payload: dict) -> str:
+        candidates = payload.get("candidates") or []
+        if not candidates:
+            block_reason = (payload.get("promptFeedback") or {}).get("blockReason")
+            if block_reason:
+                raise ProviderPermanentError(f"Prompt blocked by Gemini: {block_reason}")
+            return ""
+        parts = (candidates[0].get("content") or {}).get("parts") or []
+        return "".join(part.get("text", "") for part in parts)
+
+    @staticmethod
+    def _usage(payload: dict) -> Optional[Tuple[int, int]]:
+        # (input, output); thinking tokens are billed as output
+        usage = payload.get("usageMetadata") or {}
+        if "promptTokenCount" not in usage:
+            return None
+        input_tokens = usage["promptTokenCount"]
+        if "totalTokenCount" in usage:
+            return input_tokens, usage["totalTokenCount"] - input_tokens
+        return input_tokens, usage.get("candidatesTokenCount", 0) + usage.get("thoughtsTokenCount", 0)
+
+    def _count_usage(self, prompt: str, text: str, max_tokens: int) -> Tuple[int, int]:
+        # No usage reported - count locally
+        return self.count_prompt_tokens(prompt), min(self.count_tokens(text), max_tokens)
+
     @retry(
         stop = stop_after_attempt(3),
         wait = wait_exponential(multiplier=1, min=4, max=10),
@@ -26,43 +88,67 @@ class GeminiProvider(BaseProvider):
         start = asyncio.get_event_loop().time()
 
         try:
-            # Gemiini sync client wrapped in threadpool for async
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.model.generate_content(
-                    prompt,
-                    generation_config={
-                        "max_output_tokens": max_tokens,
-                        "temperature": 0.1
-                    }
-                )
+            response = await self.client.post(
+                f"/v1beta/models/{self.model_name}:generateContent",
+                json=self._body(prompt, max_tokens)
             )
+        except httpx.HTTPError as e:
+            # Connect/read timeouts, resets, pool exhaustion
+            raise ProviderTemporaryError(f"Temporary error from Gemini: {e!r}")
 
-            text = response.text or ""
-            # Gemini does not return usage-rough estimate
-            tokens_used = min(len(prompt.split()) * 1.5 + 50, max_tokens)
-        
-        except Exception as e:
-            if "invalid_argument" in str(e).lower():
-                raise ProviderPermanentError(f"Invalid request: {e}")
-            elif "permission_denied" in str(e).lower():
-                raise ProviderPermanentError("Gemini authorization denied")
-            raise ProviderTemporaryError(f"Temporary error from Gemini: {e}")
+        self._raise_for_status(response.status_code, response.text)
+        payload = response.json()
+        text = self._text(payload)
+        input_tokens, output_tokens = self._usage(payload) or self._count_usage(prompt, text, max_tokens)
 
         latency_ms = (asyncio.get_event_loop().time() -start) * 1000
 
         return ProviderResponse(
             text=text,
-            tokens_used=tokens_used,
+            tokens_used=input_tokens + output_tokens,
             latency_ms=round(latency_ms, 2),
             model_used = self.model_name,
-            cost = self.estimate_cost(tokens_used)
+            cost = self.estimate_cost(input_tokens, output_tokens),
+            input_tokens=input_tokens,
+            output_tokens=output_tokens
         )
-    
-    def estimate_cost(self, tokens:int) -> float:
-        # Gemini 1.5 Flash: $0.075/1M input, $0.30/1M output → avg $0.1875/1M 
-        return (tokens / 1_000_000) * 0.1875 
-    
+
+    async def infer_stream(self, prompt: str, max_tokens: int) -> AsyncIterator[StreamChunk]:
+        usage = None
+        streamed = []
+        try:
+            async with self.client.stream(
+                "POST",
+                f"/v1beta/models/{self.model_name}:streamGenerateContent",
+                params={"alt": "sse"},
+                json=self._body(prompt, max_tokens)
+            ) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    self._raise_for_status(response.status_code, response.text)
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    payload = json.loads(line[5:])
+                    text = self._text(payload)
+                    if text:
+                        streamed.append(text)
+                        yield StreamChunk(text=text)
+                    # Usage arrives (cumulatively) on the later chunks
+                    usage = self._usage(payload) or usage
+        except httpx.HTTPError as e:
+            raise ProviderTemporaryError(f"Temporary error from Gemini: {e!r}")
+
+        input_tokens, output_tokens = usage or self._count_usage(prompt, "".join(streamed), max_tokens)
+        yield StreamChunk(text="", tokens_used=input_tokens + output_tokens,
+                          input_tokens=input_tokens, output_tokens=output_tokens)
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        # e.g. Gemini 1.5 Flash: $0.075/1M input, $0.30/1M output
+        return get_price(self.model_name, fallback="gemini-1.5-flash").cost(input_tokens, output_tokens)
+
     async def is_healthy(self) -> bool:
-        return bool(os.getenv("GEMINI_API_KEY"))
\ No newline at end of file
+        return bool(os.getenv("GEMINI_API_KEY"))
+
+    async def aclose(self):
+        await self.client.aclose()
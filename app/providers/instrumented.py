@@ -0,0 +1,72 @@
+# Per-provider call latency histograms (innermost wrapper: upstream time only)
+import time
+from contextlib import aclosing
+from typing import AsyncIterator
+from .base import BaseProvider, ProviderResponse, StreamChunk, ProviderTemporaryError, ProviderPermanentError
+from ..utils.prometheus import PROVIDER_SECONDS
+from ..utils.tracing import span, record
+
+
+def _outcome(error: BaseException) -> str:
+    if isinstance(error, ProviderTemporaryError):
+        return "temporary"
+    if isinstance(error, (ProviderPermanentError, ValueError)):
+        return "permanent"
+    if isinstance(error, Exception):
+        return "error"
+    return "cancelled"
+
+
+class InstrumentedProvider(BaseProvider):
+    """Wraps a provider so every call's duration lands in gateway_provider_call_seconds and the request's trace."""
+
+    def __init__(self, provider: BaseProvider):
+        self.provider = provider
+
+    def __getattr__(self, attr):
+        # Provider-specific attributes (client, model, ...) pass through
+        return getattr(self.provider, attr)
+
+    @property
+    def name(self) -> str:
+        return self.provider.name
+
+    async def infer(self, prompt: str, max_tokens: int) -> ProviderResponse:
+        start = time.perf_counter()
+        outcome = "success"
+        with span("provider", provider=self.provider.name, mode="infer") as scope:
+            try:
+                return await self.provider.infer(prompt, max_tokens)
+            except BaseException as e:
+                outcome = _outcome(e)
+                raise
+            finally:
+                PROVIDER_SECONDS.observe(time.perf_counter() - start, self.provider.name, "infer", outcome)
+                scope.set("outcome", outcome)
+
+    async def infer_stream(self, prompt: str, max_tokens: int) -> AsyncIterator[StreamChunk]:
+        # Whole stream, first byte to last chunk (or until the client went away)
+        start = time.perf_counter()
+        outcome = "cancelled"
+        try:
+            async with aclosing(self.provider.infer_stream(prompt, max_tokens)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+            outcome = "success"
+        except BaseException as e:
+            outcome = _outcome(e)
+            raise
+        finally:
+            end = time.perf_counter()
+            PROVIDER_SECONDS.observe(end - start, self.provider.name, "stream", outcome)
+            # Recorded after the fact: a span scope can't stay open across yields
+            record("provider", start, end, provider=self.provider.name, mode="stream", outcome=outcome)
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return self.provider.estimate_cost(input_tokens, output_tokens)
+
+    async def is_healthy(self) -> bool:
+        return await self.provider.is_healthy()
+
+    async def aclose(self):
+        await self.provider.aclose()
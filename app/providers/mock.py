@@ -0,0 +1,129 @@
+# Deterministic mock provider: simulated latency, errors, usage and streaming, no upstream calls
+import asyncio
+import math
+import random
+from typing import AsyncIterator, Tuple
+from .base import BaseProvider, ProviderResponse, StreamChunk, ProviderTemporaryError, ProviderPermanentError
+from .pricing import get_price
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+# Output is drawn from these, so responses look like text and tokenize like it
+_WORDS = ("the", "gateway", "routes", "each", "request", "to", "a", "provider", "and", "returns",
+          "tokens", "quickly", "model", "latency", "cost", "cache", "stream", "of", "answer", "with")
+
+
+class MockProvider(BaseProvider):
+    """
+    Stands in for a paid provider so the gateway's own overhead can be measured.
+
+    Each call draws its latency (ms) from `distribution` around `latency_ms`.
+    `spread` means sigma for lognormal, stdev/latency_ms for normal, and
+    half-width/latency_ms for uniform. A call fails with a temporary or
+    permanent error at the given rates, and otherwise returns `output_tokens`
+    words (capped by max_tokens). Streams send `chunk_tokens` words per
+    chunk: the first after `ttft_ratio` of the latency, the rest spread over
+    the remainder.
+
+    Deterministic: the draws for a call are seeded from (seed, prompt,
+    max_tokens), so the same request gets the same latency, outcome and
+    text in every run, whatever the concurrency or arrival order.
+    """
+
+    def __init__(self, latency_ms: float = 200.0, distribution: str = "lognormal", spread: float = 0.5,
+                 temporary_error_rate: float = 0.0, permanent_error_rate: float = 0.0,
+                 output_tokens: int = 64, chunk_tokens: int = 4, ttft_ratio: float = 0.3, seed: int = 0):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}. Available: {list(LATENCY_DISTRIBUTIONS)}")
+        self.latency_ms = latency_ms
+        self.distribution = distribution
+        self.spread = spread
+        self.temporary_error_rate = temporary_error_rate
+        self.permanent_error_rate = permanent_error_rate
+        self.output_tokens = output_tokens
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.ttft_ratio = min(max(ttft_ratio, 0.0), 1.0)
+        self.seed = seed
+        self.model = "mock"
+
+    @property
+    def name(self) -> str:
+        return "mock"
+
+    def _rng(self, prompt: str, max_tokens: int) -> random.Random:
+        # str seeds are hashed with SHA-512: stable across processes (unlike hash())
+        return random.Random(f"{self.seed}:{max_tokens}:{prompt}")
+
+    def sample_latency_ms(self, rng: random.Random) -> float:
+        mean, spread = self.latency_ms, self.spread
+        if self.distribution == "uniform":
+            value = rng.uniform(mean * (1 - spread), mean * (1 + spread))
+        elif self.distribution == "normal":
+            value = rng.gauss(mean, mean * spread)
+        elif self.distribution == "lognormal":
+            value = rng.lognormvariate(math.log(mean), spread) if mean > 0 else 0.0
+        elif self.distribution == "exponential":
+            value = rng.expovariate(1 / mean) if mean > 0 else 0.0
+        else:
+            value = mean
+        return max(0.0, value)
+
+    def plan(self, prompt: str, max_tokens: int) -> Tuple[float, str, str]:
+        """(latency ms, outcome, output text) this call will produce: outcome is success, temporary or permanent."""
+        rng = self._rng(prompt, max_tokens)
+        latency_ms = self.sample_latency_ms(rng)
+        roll = rng.random()
+        if roll < self.permanent_error_rate:
+            return latency_ms, "permanent", ""
+        if roll < self.permanent_error_rate + self.temporary_error_rate:
+            return latency_ms, "temporary", ""
+        words = [rng.choice(_WORDS) for _ in range(min(self.output_tokens, max_tokens))]
+        return latency_ms, "success", " ".join(words)
+
+    def _raise(self, outcome: str):
+        if outcome == "temporary":
+            raise ProviderTemporaryError("Mock provider: simulated temporary error")
+        raise ProviderPermanentError("Mock provider: simulated permanent error")
+
+    def _usage(self, prompt: str, max_tokens: int) -> Tuple[int, int]:
+        return self.count_prompt_tokens(prompt), min(self.output_tokens, max_tokens)
+
+    async def infer(self, prompt: str, max_tokens: int) -> ProviderResponse:
+        start = asyncio.get_event_loop().time()
+        latency_ms, outcome, text = self.plan(prompt, max_tokens)
+        await asyncio.sleep(latency_ms / 1000)
+        if outcome != "success":
+            self._raise(outcome)
+        input_tokens, output_tokens = self._usage(prompt, max_tokens)
+        return ProviderResponse(
+            text=text,
+            tokens_used=input_tokens + output_tokens,
+            latency_ms=round((asyncio.get_event_loop().time() - start) * 1000, 2),
+            model_used=self.model,
+            cost=self.estimate_cost(input_tokens, output_tokens),
+            input_tokens=input_tokens,
+            output_tokens=output_tokens
+        )
+
+    async def infer_stream(self, prompt: str, max_tokens: int) -> AsyncIterator[StreamChunk]:
+        latency_ms, outcome, text = self.plan(prompt, max_tokens)
+        words = text.split(" ") if text else []
+        chunks = [" ".join(words[i:i + self.chunk_tokens]) for i in range(0, len(words), self.chunk_tokens)]
+        ttft_ms = latency_ms * self.ttft_ratio
+        await asyncio.sleep(ttft_ms / 1000)
+        if outcome != "success":
+            self._raise(outcome)
+        gap_s = (latency_ms - ttft_ms) / 1000 / max(1, len(chunks) - 1)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(gap_s)
+            yield StreamChunk(text=chunk if i == 0 else " " + chunk)
+        input_tokens, output_tokens = self._usage(prompt, max_tokens)
+        yield StreamChunk(text="", tokens_used=input_tokens + output_tokens,
+                          input_tokens=input_tokens, output_tokens=output_tokens)
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return get_price(self.model, fallback="mock").cost(input_tokens, output_tokens)
+
+    async def is_healthy(self) -> bool:
+        return True
@@ -1,8 +1,10 @@
+import httpx
 import openai
 from openai import AsyncOpenAI
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from typing import Any
-from .base import BaseProvider , ProviderResponse
+from typing import Any, AsyncIterator
+from .base import BaseProvider , ProviderResponse, StreamChunk, ProviderTemporaryError, ProviderPermanentError
+from .pricing import get_price
 import os
 import asyncio
 from datetime import datetime
@@ -40,10 +42,13 @@ class OpenAIProvider(BaseProvider):
                 raise RuntimeError("OpenAI returned no choices")
             choice = response.choices[0]
             text = choice.message.content or ""
-            tokens_used = (
-                choice.finish_reason == "length" and max_tokens
-                or getattr(response.usage, 'total_tokens', len(prompt.split()) * 2)
-            )
+            if response.usage is not None:
+                input_tokens = response.usage.prompt_tokens
+                output_tokens = response.usage.completion_tokens
+            else:
+                # No usage reported - count locally
+                input_tokens = self.count_prompt_tokens(prompt)
+                output_tokens = max_tokens if choice.finish_reason == "length" else self.count_tokens(text)
         except openai.BadRequestError:
             raise ValueError(f"Invalid request for model {self.model}")
         except (openai.AuthenticationError, openai.PermissionDeniedError):
@@ -55,15 +60,59 @@ class OpenAIProvider(BaseProvider):
 
         return ProviderResponse(
             text=text,
-            tokens_used=tokens_used,
+            tokens_used=input_tokens + output_tokens,
             latency_ms=round(latency_ms, 2),
             model_used=self.model,
-            cost=self.estimate_cost(tokens_used)
+            cost=self.estimate_cost(input_tokens, output_tokens),
+            input_tokens=input_tokens,
+            output_tokens=output_tokens
         )
 
-    def estimate_cost(self, tokens: int) -> float:
-        # GPT-4o-mini cost estimation: $0.15/1M input, $0.60/1M output → avg $0.375/1M
-        return (tokens / 1_000_000) * 0.375
+    async def infer_stream(self, prompt: str, max_tokens: int) -> AsyncIterator[StreamChunk]:
+        # No tenacity retry here - once chunks reach the client we can't replay them
+        try:
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=0.1,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+        except openai.BadRequestError:
+            raise ValueError(f"Invalid request for model {self.model}")
+        except (openai.AuthenticationError, openai.PermissionDeniedError):
+            raise ValueError("OpenAI authentication/credentials invalid")
+        except (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError) as e:
+            raise ProviderTemporaryError(f"Temporary error from OpenAI: {e}")
+        except openai.APIError as e:
+            raise ProviderPermanentError(f"OpenAI stream failed: {e}")
+
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield StreamChunk(text=chunk.choices[0].delta.content)
+                if chunk.usage:
+                    # Final chunk (include_usage) carries totals and no choices
+                    yield StreamChunk(
+                        text="",
+                        tokens_used=chunk.usage.total_tokens,
+                        input_tokens=chunk.usage.prompt_tokens,
+                        output_tokens=chunk.usage.completion_tokens
+                    )
+        except (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError, httpx.HTTPError) as e:
+            raise ProviderTemporaryError(f"OpenAI stream interrupted: {e!r}")
+        except openai.APIError as e:
+            # Everything else, including an error event sent mid-stream: the
+            # stream can't be replayed, so report it to the client and stop
+            raise ProviderPermanentError(f"OpenAI stream failed: {e}")
+        finally:
+            # Runs on client disconnect too - closes the upstream HTTP response
+            await stream.close()
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        # e.g. GPT-4o-mini: $0.15/1M input, $0.60/1M output
+        return get_price(self.model, fallback="gpt-4o-mini").cost(input_tokens, output_tokens)
 
     async def is_healthy(self) -> bool:
         return bool(os.getenv("OPENAI_API_KEY"))
\ No newline at end of file
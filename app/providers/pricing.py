@@ -0,0 +1,46 @@
+# Per-model token prices, input and output billed separately
+import logging
+from dataclasses import dataclass
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ModelPrice:
+    input_per_1m: float  # USD per 1M prompt tokens
+    output_per_1m: float  # USD per 1M completion tokens
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens * self.input_per_1m + output_tokens * self.output_per_1m) / 1_000_000
+
+
+PRICING: Dict[str, ModelPrice] = {
+    "gpt-4o-mini": ModelPrice(0.15, 0.60),
+    "gpt-4o": ModelPrice(2.50, 10.00),
+    "gpt-4.1-nano": ModelPrice(0.10, 0.40),
+    "gpt-4.1-mini": ModelPrice(0.40, 1.60),
+    "gpt-4.1": ModelPrice(2.00, 8.00),
+    "gemini-1.5-flash": ModelPrice(0.075, 0.30),
+    "gemini-1.5-pro": ModelPrice(1.25, 5.00),
+    "gemini-2.0-flash": ModelPrice(0.10, 0.40),
+    "mock": ModelPrice(0.0, 0.0),  # MockProvider: load tests shouldn't show up as spend
+}
+
+_warned = set()
+
+
+def get_price(model: str, fallback: str) -> ModelPrice:
+    """
+    Price of `model`, matching dated snapshots (gpt-4o-mini-2024-07-18) by
+    longest prefix. Unknown models are priced as `fallback`, with a warning.
+    """
+    if model in PRICING:
+        return PRICING[model]
+    prefixes = [name for name in PRICING if model.startswith(name)]
+    if prefixes:
+        return PRICING[max(prefixes, key=len)]
+    if model not in _warned:
+        _warned.add(model)
+        logger.warning(f"No pricing for model {model}, using {fallback} prices")
+    return PRICING[fallback]
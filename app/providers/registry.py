@@ -1,13 +1,66 @@
 # Central registry for all providers
 from .openai import OpenAIProvider
 from .gemini import GeminiProvider
+from .mock import MockProvider
+from .circuit_breaker import CircuitBreaker, CircuitBreakerProvider, circuit_breakers
+from .admission import AdmissionController, AdmissionProvider, admission_controllers
+from .instrumented import InstrumentedProvider
+from ..config import settings
 
-# Singleton instances - only OpenAI and Gemini
+def _with_metrics(provider):
+    # Innermost: gateway_provider_call_seconds times the upstream call, not queueing or breaker rejections
+    return InstrumentedProvider(provider)
+
+def _with_breaker(provider):
+    # Every provider call goes through a per-provider circuit breaker
+    if not settings.CIRCUIT_BREAKER_ENABLED:
+        return provider
+    breaker = CircuitBreaker(
+        provider.name,
+        failure_rate_threshold=settings.CIRCUIT_FAILURE_RATE,
+        slow_call_ms=settings.CIRCUIT_SLOW_CALL_MS,
+        slow_call_rate_threshold=settings.CIRCUIT_SLOW_CALL_RATE,
+        window_size=settings.CIRCUIT_WINDOW_SIZE,
+        min_calls=settings.CIRCUIT_MIN_CALLS,
+        open_seconds=settings.CIRCUIT_OPEN_SECONDS,
+        half_open_max_calls=settings.CIRCUIT_HALF_OPEN_PROBES
+    )
+    circuit_breakers[provider.name] = breaker
+    return CircuitBreakerProvider(provider, breaker)
+
+def _with_admission(provider):
+    # Outermost: queue/shed before the breaker, so waiting calls don't hold half-open probe slots
+    if not settings.ADMISSION_ENABLED:
+        return provider
+    controller = AdmissionController(
+        provider.name,
+        max_concurrency=settings.ADMISSION_MAX_CONCURRENCY.get(provider.name, settings.ADMISSION_DEFAULT_CONCURRENCY),
+        max_queue=settings.ADMISSION_MAX_QUEUE,
+        max_wait_ms=settings.ADMISSION_MAX_WAIT_MS
+    )
+    admission_controllers[provider.name] = controller
+    return AdmissionProvider(provider, controller)
+
+# Singleton instances - OpenAI and Gemini, plus the mock provider when enabled
 _providers = {
-    "openai": OpenAIProvider(),
-    "gemini": GeminiProvider(),
+    "openai": _with_admission(_with_breaker(_with_metrics(OpenAIProvider()))),
+    "gemini": _with_admission(_with_breaker(_with_metrics(GeminiProvider()))),
 }
 
+if settings.MOCK_PROVIDER_ENABLED:
+    # Requested explicitly as model="mock"; the router never selects it for "auto"
+    _providers["mock"] = _with_admission(_with_breaker(_with_metrics(MockProvider(
+        latency_ms=settings.MOCK_LATENCY_MS,
+        distribution=settings.MOCK_LATENCY_DISTRIBUTION,
+        spread=settings.MOCK_LATENCY_SPREAD,
+        temporary_error_rate=settings.MOCK_TEMPORARY_ERROR_RATE,
+        permanent_error_rate=settings.MOCK_PERMANENT_ERROR_RATE,
+        output_tokens=settings.MOCK_OUTPUT_TOKENS,
+        chunk_tokens=settings.MOCK_STREAM_CHUNK_TOKENS,
+        ttft_ratio=settings.MOCK_STREAM_TTFT_RATIO,
+        seed=settings.MOCK_SEED
+    ))))
+
 def get_provider(name: str):
     """Get provider by name. Raises ValueError if not found."""
     if name not in _providers:
@@ -16,4 +69,8 @@ def get_provider(name: str):
 
 def get_all_providers():
     """Get all registered providers."""
-    return list(_providers.values())
\ No newline at end of file
+    return list(_providers.values())
+
+def list_providers():
+    """(name, provider) pairs for all registered providers."""
+    return list(_providers.items())
@@ -0,0 +1,113 @@
+# Offline prompt token counting with per-provider tokenizer adapters
+import hashlib
+import math
+import re
+from typing import Dict, Optional
+from cachetools import LRUCache
+
+# Pre-tokenizer shared by the adapters (GPT-style): a word, number or
+# punctuation run with at most one leading space, or a run of whitespace
+_PIECES = re.compile(r" ?[^\W\d_]+| ?\d+| ?(?:[^\w\s]|_)+|\s+")
+_CJK_START = "\u2e80"  # CJK, kana, hangul, ...: roughly one token per character
+
+
+class TokenCounter:
+    """
+    Approximates a provider's BPE/SentencePiece tokenizer without its vocabulary.
+
+    A word of up to word_chars letters is one token and longer ones cost a
+    token per further chars_per_token characters; digits are grouped
+    digits_per_token at a time and CJK text is counted per character. Good
+    enough for budgeting and routing, while billing uses the usage the
+    provider reports: scripts/check_tokenizer_accuracy.py measures the
+    openai adapter against cl100k_base (about 1% off in total on its
+    sample, 8% per text on average). The gemini adapter has no offline
+    reference to check against.
+
+    count() is memoized by a digest of the text (so the memo holds no
+    prompts), and the router scoring every provider and the provider itself
+    counting the same prompt only tokenize it once each.
+    """
+
+    def __init__(self, name: str, word_chars: int = 12, chars_per_token: float = 6.0,
+                 digits_per_token: int = 3, cjk_tokens_per_char: float = 1.0,
+                 message_overhead: int = 0, cache_size: int = 4096):
+        self.name = name
+        self.word_chars = word_chars
+        self.chars_per_token = chars_per_token
+        self.digits_per_token = digits_per_token
+        self.cjk_tokens_per_char = cjk_tokens_per_char
+        self.message_overhead = message_overhead  # chat framing added around a prompt
+        self._memo: LRUCache = LRUCache(maxsize=cache_size)
+        self.hits = 0
+        self.misses = 0
+
+    def _word(self, word: str) -> int:
+        cjk = sum(1 for c in word if c >= _CJK_START)
+        rest = len(word) - cjk
+        tokens = math.ceil(cjk * self.cjk_tokens_per_char)
+        if rest:
+            tokens += 1 if rest <= self.word_chars else 1 + math.ceil((rest - self.word_chars) / self.chars_per_token)
+        return tokens
+
+    def count(self, text: str) -> int:
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        tokens = self._memo.get(key)
+        if tokens is None:
+            self.misses += 1
+            tokens = self._memo[key] = self._count(text)
+        else:
+            self.hits += 1
+        return tokens
+
+    def _count(self, text: str) -> int:
+        tokens = 0
+        for piece in _PIECES.findall(text):
+            body = piece[1:] if piece[0] == " " and len(piece) > 1 else piece
+            if body.isspace():
+                tokens += 1 + len(body) // 16
+            elif body[0].isdigit():
+                tokens += math.ceil(len(body) / self.digits_per_token)
+            elif body[0].isalpha():
+                tokens += self._word(body)
+            else:
+                tokens += math.ceil(len(body) / 2)
+        return tokens
+
+    def count_prompt(self, prompt: str) -> int:
+        """Input tokens billed for a single-message prompt, framing included."""
+        return self.count(prompt) + self.message_overhead
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "cached": len(self._memo),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+TOKENIZERS: Dict[str, TokenCounter] = {
+    # o200k/cl100k BPE: digits in groups of 3, ~7 tokens of chat framing per message
+    "openai": TokenCounter("openai", word_chars=12, chars_per_token=6.0, digits_per_token=3,
+                           cjk_tokens_per_char=1.0, message_overhead=7),
+    # SentencePiece: every digit is its own token, denser on CJK
+    "gemini": TokenCounter("gemini", word_chars=12, chars_per_token=6.0, digits_per_token=1,
+                           cjk_tokens_per_char=0.8, message_overhead=0),
+}
+
+# Used before a provider is chosen (e.g. rate limit charges on "auto" requests)
+DEFAULT_TOKENIZER = "openai"
+
+
+def get_tokenizer(provider: Optional[str] = None) -> TokenCounter:
+    return TOKENIZERS.get(provider or DEFAULT_TOKENIZER, TOKENIZERS[DEFAULT_TOKENIZER])
+
+
+def count_tokens(text: str, provider: Optional[str] = None) -> int:
+    return get_tokenizer(provider).count(text)
+
+
+def count_prompt_tokens(prompt: str, provider: Optional[str] = None) -> int:
+    return get_tokenizer(provider).count_prompt(prompt)
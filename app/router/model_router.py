@@ -1,47 +1,119 @@
 from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
 from math import inf
+import os
+from .provider_stats import ProviderStatsStore
+from ..providers.circuit_breaker import CircuitBreaker, circuit_breakers
+from ..providers.admission import AdmissionController, admission_controllers
+from ..providers.pricing import get_price
+from ..providers.tokenizer import count_prompt_tokens
 
 @dataclass
 class ProviderMetrics:
     name : str
     healthy: bool
-    avg_latency_ms : float
-    cost_per_1k : float
+    avg_latency_ms : float # Prior only - live routing uses observed latency
+    model : str # Priced from pricing.PRICING
+    price_fallback : str = "gpt-4o-mini" # Priced as this if `model` isn't in the table
 
 class ModelRouter:
     # Pure provider selection logic
 
     LATENCY_WEIGHT = 0.6 # 60% latency priority
     COST_WEIGHT = 0.4    # 40% cost priority
+    ERROR_WEIGHT = 2.0   # Penalty per unit of windowed error rate (added on top)
+    SATURATION_WEIGHT = 1.0 # Penalty per unit of admission queue saturation (added on top)
+    REFERENCE_REQUEST = (500, 500) # (input, output) tokens used to compare prices when the request isn't known
 
-    def __init__(self, providers: List[ProviderMetrics]):
+    def __init__(self, providers: List[ProviderMetrics], stats: Optional[ProviderStatsStore] = None,
+                 breakers: Optional[Dict[str, CircuitBreaker]] = None,
+                 admission: Optional[Dict[str, AdmissionController]] = None):
         self.providers = providers 
+        # Live stats seeded with configured latencies as the warm-up prior
+        self.stats = stats or ProviderStatsStore({p.name: p.avg_latency_ms for p in providers})
+        # Shared with the provider registry, which wraps each provider in its breaker
+        self.breakers = circuit_breakers if breakers is None else breakers
+        self.admission = admission_controllers if admission is None else admission
+
+    def is_available(self, name: str, now: Optional[float] = None) -> bool:
+        """False while the provider's circuit is open (or half-open with all probe slots taken) or it would shed."""
+        breaker = self.breakers.get(name)
+        if breaker is not None and not breaker.allows_request(now):
+            return False
+        controller = self.admission.get(name)
+        return controller is None or controller.would_admit()
+
+    def saturation(self, name: str) -> float:
+        controller = self.admission.get(name)
+        return min(controller.saturation(), 1.0) if controller else 0.0
+
+    def expected_cost(self, name: str, prompt: Optional[str] = None, max_tokens: Optional[int] = None) -> float:
+        """
+        Expected cost of the request on `name`: its prompt counted with that
+        provider's tokenizer at the input price, plus max_tokens at the output price.
+        """
+        p = next(p for p in self.providers if p.name == name)
+        price = get_price(p.model, p.price_fallback)
+        if prompt is None:
+            return price.cost(*self.REFERENCE_REQUEST)
+        return price.cost(count_prompt_tokens(prompt, name), max_tokens or 0)
+
+    def record_outcome(self, name: str, latency_ms: float, success: bool):
+        """Feed an upstream call outcome into the live stats (O(1))."""
+        self.stats.record(name, latency_ms, success)
+
+    def observed_latency(self, name: str, now: Optional[float] = None) -> float:
+        stats = self.stats.get(name)
+        if stats is None:
+            return next((p.avg_latency_ms for p in self.providers if p.name == name), inf)
+        return stats.latency_ms(now)
+
+    def error_rate(self, name: str, now: Optional[float] = None) -> float:
+        stats = self.stats.get(name)
+        return stats.error_rate(now) if stats else 0.0
     
     def select_provider(
         self,
         auto: bool = False,
-        preferred: Optional[str] = None
+        preferred: Optional[str] = None,
+        now: Optional[float] = None,
+        prompt: Optional[str] = None,
+        max_tokens: Optional[int] = None
     ) -> str:
         # select best provider by scoring
 
         # Preferred model 
         if preferred:
-            healthy_pref = next((p for p in self.providers if p.name == preferred and p.healthy), None)
+            healthy_pref = next(
+                (p for p in self.providers if p.name == preferred and p.healthy and self.is_available(p.name, now)),
+                None
+            )
             if healthy_pref:
                 return preferred
         
         if not auto: 
             raise ValueError("Must specify model or auto = True")
 
-        # Auto: score healthy providers
+        # Auto: best-scored provider
+        return self.rank_providers(now, prompt, max_tokens)[0]
+
+    def rank_providers(self, now: Optional[float] = None, prompt: Optional[str] = None,
+                       max_tokens: Optional[int] = None) -> List[str]:
+        """Healthy providers, best score first. Cost is scored for this prompt/max_tokens when given."""
         candidates = [p for p in self.providers if p.healthy] 
         if not candidates:
             raise ValueError("No healthy providers available")
+        # Skip open circuits and saturated providers so auto traffic fails over
+        # immediately. If none is available, keep the full set: the call then
+        # fails fast with CircuitOpenError/ProviderOverloadedError (503 +
+        # Retry-After) rather than a 400.
+        candidates = [p for p in candidates if self.is_available(p.name, now)] or candidates
         
-        # Compute min/max for normalization
-        avg_latencies = [p.avg_latency_ms for p in candidates]
-        costs = [p.cost_per_1k for p in candidates]
+        # Compute min/max for normalization (live latency, not the configured prior)
+        latencies = {p.name: self.observed_latency(p.name, now) for p in candidates}
+        avg_latencies = list(latencies.values())
+        expected_costs = {p.name: self.expected_cost(p.name, prompt, max_tokens) for p in candidates}
+        costs = list(expected_costs.values())
         
         min_latency = min(avg_latencies)
         max_latency = max(avg_latencies)
@@ -55,22 +127,44 @@ class ModelRouter:
             latency_range = max_latency - min_latency
             normalized_latency = 0.0
             if latency_range > 0:
-                normalized_latency = (p.avg_latency_ms - min_latency) / latency_range
+                normalized_latency = (latencies[p.name] - min_latency) / latency_range
             
             cost_range = max_cost - min_cost
             normalized_cost = 0.0
             if cost_range > 0:
-                normalized_cost = (p.cost_per_1k - min_cost) / cost_range
+                normalized_cost = (expected_costs[p.name] - min_cost) / cost_range
             
-            total_score = normalized_latency * self.LATENCY_WEIGHT + normalized_cost * self.COST_WEIGHT
+            total_score = (
+                normalized_latency * self.LATENCY_WEIGHT
+                + normalized_cost * self.COST_WEIGHT
+                + self.error_rate(p.name, now) * self.ERROR_WEIGHT
+                + self.saturation(p.name) * self.SATURATION_WEIGHT
+            )
             scored.append((total_score, p.name))
 
         scored.sort() # Lowest score first
-        return scored[0][1] # Best provider name
+        return [name for _, name in scored]
+
+    def next_best(self, exclude: str, now: Optional[float] = None, prompt: Optional[str] = None,
+                  max_tokens: Optional[int] = None) -> Optional[str]:
+        """Best-scored provider other than `exclude` that would accept a call right now (hedging)."""
+        return next(
+            (name for name in self.rank_providers(now, prompt, max_tokens)
+             if name != exclude and self.is_available(name, now)),
+            None
+        )
+
+    def hedge_delay_ms(self, name: str) -> float:
+        """How long to wait on `name` before hedging: its observed p95."""
+        stats = self.stats.get(name)
+        if stats is None:
+            return inf
+        return stats.p95_ms()
 # Global singleton (config driven) 
+# avg_latency_ms values are warm-up priors; live EWMA latency takes over as requests complete
 PROVIDER_METRICS = [ 
-    ProviderMetrics("openai", True, 250, 0.375),
-    ProviderMetrics("gemini", True, 180, 0.1875),
+    ProviderMetrics("openai", True, 250, os.getenv("OPENAI_MODEL", "gpt-4o-mini"), "gpt-4o-mini"),
+    ProviderMetrics("gemini", True, 180, os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash"), "gemini-1.5-flash"),
 ]
 
 router = ModelRouter(PROVIDER_METRICS)
\ No newline at end of file
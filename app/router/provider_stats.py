@@ -0,0 +1,138 @@
+# Online per-provider latency/error statistics for live routing (O(1) per update)
+import math
+import time
+from typing import Dict, Optional
+
+
+class ProviderStats:
+    """
+    Live view of one provider, updated from real request outcomes.
+
+    - latency_ms: time-decayed EWMA. Observations decay with half_life_s and
+      their total weight is capped at max_weight (so alpha >= 1/max_weight
+      under load); they are blended with a non-decaying prior worth
+      prior_weight observations. A new provider starts at its configured
+      latency, and one that stops receiving traffic drifts back to it -
+      which is what lets a recovered provider win traffic back.
+    - p95_ms: stochastic streaming quantile estimate (no sample buffer).
+    - error_rate: failures / requests over a sliding window of buckets.
+    """
+
+    QUANTILE = 0.95
+    MIN_ERROR_SAMPLES = 5  # 1 failure out of 1 request shouldn't read as 100%
+
+    def __init__(self, prior_latency_ms: float, prior_weight: float = 10.0, half_life_s: float = 30.0,
+                 max_weight: float = 50.0, error_window_s: float = 60.0, error_buckets: int = 6,
+                 now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self.prior_latency_ms = prior_latency_ms
+        self.prior_weight = prior_weight
+        self.max_weight = max_weight
+        self._decay_rate = math.log(2) / half_life_s
+
+        # Decayed sum / count of observed latencies
+        self._sum = 0.0
+        self._count = 0.0
+        self._updated_at = now
+
+        # Streaming p95 state: step size tracks the spread of recent samples
+        self._p95 = prior_latency_ms * 1.5
+        self._spread = prior_latency_ms * 0.5
+
+        # Error ring buffer
+        self._bucket_s = error_window_s / error_buckets
+        self._requests = [0] * error_buckets
+        self._errors = [0] * error_buckets
+        self._bucket_index = 0
+        self._bucket_start = now
+
+        self.samples = 0
+
+    def _decay(self, now: float) -> float:
+        return math.exp(-self._decay_rate * max(0.0, now - self._updated_at))
+
+    def _advance_buckets(self, now: float):
+        elapsed = int((now - self._bucket_start) // self._bucket_s)
+        if elapsed <= 0:
+            return
+        # Clear every bucket we skipped over (at most the whole ring)
+        for _ in range(min(elapsed, len(self._requests))):
+            self._bucket_index = (self._bucket_index + 1) % len(self._requests)
+            self._requests[self._bucket_index] = 0
+            self._errors[self._bucket_index] = 0
+        self._bucket_start += elapsed * self._bucket_s
+
+    def record(self, latency_ms: float, success: bool, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self.samples += 1
+
+        self._advance_buckets(now)
+        self._requests[self._bucket_index] += 1
+        if not success:
+            self._errors[self._bucket_index] += 1
+            # Failures carry no useful latency signal (fast 4xx/5xx or timeouts)
+            return
+
+        decay = self._decay(now)
+        self._sum = self._sum * decay + latency_ms
+        self._count = self._count * decay + 1.0
+        if self._count > self.max_weight:
+            scale = self.max_weight / self._count
+            self._sum *= scale
+            self._count = self.max_weight
+        self._updated_at = now
+
+        # Quantile: E[step] is zero exactly where P(x <= q) = QUANTILE
+        self._spread += 0.05 * (abs(latency_ms - self._p95) - self._spread)
+        step = max(self._spread * 0.1, 1.0)
+        if latency_ms > self._p95:
+            self._p95 += step * self.QUANTILE
+        else:
+            self._p95 = max(0.0, self._p95 - step * (1 - self.QUANTILE))
+
+    def latency_ms(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        decay = self._decay(now)
+        weight = self._count * decay
+        return (self._sum * decay + self.prior_latency_ms * self.prior_weight) / (weight + self.prior_weight)
+
+    def p95_ms(self) -> float:
+        return max(self._p95, 0.0)
+
+    def error_rate(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        self._advance_buckets(now)
+        requests = sum(self._requests)
+        return sum(self._errors) / max(requests, self.MIN_ERROR_SAMPLES)
+
+    def snapshot(self, now: Optional[float] = None) -> dict:
+        return {
+            "latency_ms": round(self.latency_ms(now), 2),
+            "p95_ms": round(self.p95_ms(), 2),
+            "error_rate": round(self.error_rate(now), 4),
+            "samples": self.samples
+        }
+
+
+class ProviderStatsStore:
+    """Provider name -> ProviderStats, seeded with configured latency priors."""
+
+    def __init__(self, priors: Dict[str, float], **stats_kwargs):
+        self._stats_kwargs = stats_kwargs
+        self._stats: Dict[str, ProviderStats] = {
+            name: ProviderStats(prior, **stats_kwargs) for name, prior in priors.items()
+        }
+
+    def get(self, name: str) -> Optional[ProviderStats]:
+        return self._stats.get(name)
+
+    def record(self, name: str, latency_ms: float, success: bool, now: Optional[float] = None):
+        stats = self._stats.get(name)
+        if stats is None:
+            # Unknown provider: its first observation doubles as the prior
+            stats = ProviderStats(latency_ms, now=now, **self._stats_kwargs)
+            self._stats[name] = stats
+        stats.record(latency_ms, success, now)
+
+    def snapshot(self, now: Optional[float] = None) -> dict:
+        return {name: stats.snapshot(now) for name, stats in self._stats.items()}
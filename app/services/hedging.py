@@ -0,0 +1,103 @@
+# Hedged requests: race a backup provider against a slow primary, within a budget
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+from ..config import settings
+
+
+class HedgeBudget:
+    """
+    Caps hedges at roughly `ratio` extra upstream calls per eligible request.
+
+    Token bucket refilled by traffic rather than time: every eligible request
+    deposits `ratio` tokens, every hedge withdraws one. Under load, slow
+    primaries become common but the budget does not grow with them, so
+    hedging can't double the upstream traffic. max_balance bounds bursts.
+    """
+
+    def __init__(self, ratio: float, max_balance: float = 10.0):
+        self.ratio = ratio
+        self.max_balance = max_balance
+        self.balance = min(1.0, max_balance)
+        self.requests = 0
+        self.hedges = 0
+        self.denied = 0
+
+    def deposit(self):
+        self.requests += 1
+        self.balance = min(self.max_balance, self.balance + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        if self.balance < 1.0:
+            self.denied += 1
+            return False
+        self.balance -= 1.0
+        self.hedges += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "eligible_requests": self.requests,
+            "hedges_sent": self.hedges,
+            "hedges_denied_by_budget": self.denied,
+            "hedge_ratio": round(self.hedges / self.requests, 4) if self.requests else 0.0,
+            "budget_ratio": self.ratio,
+            "balance": round(self.balance, 3)
+        }
+
+
+@dataclass
+class HedgeResult:
+    result: Any
+    hedged: bool = False  # a backup request was sent
+    backup_won: bool = False
+    # The losing attempt: cancelled while still running, or already failed
+    loser_cancelled: bool = False
+    loser_error: Optional[BaseException] = None
+    loser_elapsed_ms: float = 0.0
+
+
+async def hedged_call(primary: Callable[[], Awaitable[Any]], backup: Callable[[], Awaitable[Any]],
+                      delay_s: float, budget: HedgeBudget) -> HedgeResult:
+    """
+    Start primary; if it hasn't finished after delay_s and the budget allows,
+    start backup too. The first successful result wins and the other attempt
+    is cancelled. If both fail, the primary's error is raised.
+    """
+    primary_start = time.perf_counter()
+    primary_task = asyncio.ensure_future(primary())
+    backup_task = None
+    try:
+        done, _ = await asyncio.wait({primary_task}, timeout=delay_s)
+        if done or not budget.try_withdraw():
+            return HedgeResult(await primary_task)
+
+        backup_start = time.perf_counter()
+        backup_task = asyncio.ensure_future(backup())
+        pending = {primary_task, backup_task}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in done if not task.cancelled() and task.exception() is None), None)
+            if winner is None:
+                continue
+            loser = backup_task if winner is primary_task else primary_task
+            loser_start = backup_start if loser is backup_task else primary_start
+            return HedgeResult(
+                winner.result(),
+                hedged=True,
+                backup_won=winner is backup_task,
+                loser_cancelled=not loser.done(),
+                loser_error=loser.exception() if loser.done() and not loser.cancelled() else None,
+                loser_elapsed_ms=(time.perf_counter() - loser_start) * 1000
+            )
+        # Both failed
+        raise primary_task.exception()
+    finally:
+        for task in (primary_task, backup_task):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+# Global singleton
+hedge_budget = HedgeBudget(settings.HEDGE_BUDGET_RATIO, settings.HEDGE_MAX_BURST)
@@ -0,0 +1,308 @@
+# Pluggable idempotency store: duplicates wait for the leader's stored response
+import asyncio
+import logging
+import secrets
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import delete, or_, and_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from ..config import settings, AsyncSessionLocal
+from ..db.base import IdempotencyKey
+from ..utils.prometheus import IDEMPOTENCY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StoredResponse:
+    status_code: int
+    body: bytes  # Pre-serialized JSON, returned verbatim
+
+
+class IdempotencyTimeout(Exception):
+    """A duplicate waited longer than wait_timeout for the leader to finish."""
+    pass
+
+
+class IdempotencyStore(ABC):
+    """
+    begin() either grants a lease (caller is the leader and must complete()
+    or release() it) or returns the stored response. While another request
+    holds the lease, begin() waits for its result instead of failing; leases
+    expire, so a crashed leader's key is taken over by the next duplicate.
+    """
+
+    POLL_MIN = 0.02
+    POLL_MAX = 0.5
+
+    def __init__(self, lease_seconds: float, ttl_seconds: int, wait_timeout: float):
+        self.lease_seconds = lease_seconds
+        self.ttl_seconds = ttl_seconds
+        self.wait_timeout = wait_timeout
+
+    @abstractmethod
+    async def _acquire(self, api_key_id: int, key: str) -> Optional[Any]:
+        # Take the lease if the key is free or its lease expired; returns a lease token or None
+        pass
+
+    @abstractmethod
+    async def _peek(self, api_key_id: int, key: str) -> Optional[StoredResponse]:
+        # Stored response, or None if missing/in progress
+        pass
+
+    @abstractmethod
+    async def complete(self, api_key_id: int, key: str, lease: Any, response: StoredResponse):
+        pass
+
+    @abstractmethod
+    async def release(self, api_key_id: int, key: str, lease: Any):
+        # Leader failed - free the key so the client (or a waiting duplicate) can retry
+        pass
+
+    async def begin(self, api_key_id: int, key: str) -> Tuple[Optional[Any], Optional[StoredResponse]]:
+        start = time.perf_counter()
+        outcome = "cancelled"
+        try:
+            deadline = time.monotonic() + self.wait_timeout
+            delay = self.POLL_MIN
+            while True:
+                lease = await self._acquire(api_key_id, key)
+                if lease is not None:
+                    outcome = "leader"
+                    return lease, None
+                stored = await self._peek(api_key_id, key)
+                if stored is not None:
+                    outcome = "replay"
+                    return None, stored
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    outcome = "timeout"
+                    raise IdempotencyTimeout(key)
+                await asyncio.sleep(min(delay, remaining))
+                delay = min(delay * 2, self.POLL_MAX)
+        finally:
+            IDEMPOTENCY_SECONDS.observe(time.perf_counter() - start, outcome)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class RedisIdempotencyStore(IdempotencyStore):
+    """
+    One key per (api key, idempotency key):
+      "pending:<token>" with a lease TTL while the leader runs (SET NX PX),
+      "done:<status>:<body>" with ttl_seconds once completed.
+    Redis expiry sweeps both stuck leases and old responses.
+    """
+
+    # Only the lease holder may write the result or free the key
+    _COMPLETE = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        return 1
+    end
+    return 0
+    """
+    _RELEASE = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, redis, lease_seconds: float, ttl_seconds: int, wait_timeout: float):
+        super().__init__(lease_seconds, ttl_seconds, wait_timeout)
+        self.redis = redis
+        self._complete = redis.register_script(self._COMPLETE)
+        self._release = redis.register_script(self._RELEASE)
+
+    @staticmethod
+    def _key(api_key_id: int, key: str) -> str:
+        return f"idem:{api_key_id}:{key}"
+
+    async def _acquire(self, api_key_id: int, key: str) -> Optional[str]:
+        token = "pending:" + secrets.token_hex(8)
+        acquired = await self.redis.set(
+            self._key(api_key_id, key), token, nx=True, px=int(self.lease_seconds * 1000)
+        )
+        return token if acquired else None
+
+    async def _peek(self, api_key_id: int, key: str) -> Optional[StoredResponse]:
+        value = await self.redis.get(self._key(api_key_id, key))
+        if not value or not value.startswith("done:"):
+            return None
+        _, status_code, body = value.split(":", 2)
+        return StoredResponse(status_code=int(status_code), body=body.encode())
+
+    async def complete(self, api_key_id: int, key: str, lease: str, response: StoredResponse):
+        value = f"done:{response.status_code}:{response.body.decode()}"
+        stored = await self._complete(keys=[self._key(api_key_id, key)], args=[lease, value, self.ttl_seconds])
+        if not stored:
+            logger.warning(f"Idempotency lease for {key} expired before completion; response not stored")
+
+    async def release(self, api_key_id: int, key: str, lease: str):
+        await self._release(keys=[self._key(api_key_id, key)], args=[lease])
+
+
+class PostgresIdempotencyStore(IdempotencyStore):
+    """
+    idempotency_keys table with leases: locked_at doubles as the lease token.
+    Acquire is a single INSERT ... ON CONFLICT that also takes over expired
+    leases; a background sweeper deletes expired leases and old responses.
+    """
+
+    def __init__(self, session_factory, lease_seconds: float, ttl_seconds: int, wait_timeout: float,
+                 sweep_interval: float):
+        super().__init__(lease_seconds, ttl_seconds, wait_timeout)
+        self.session_factory = session_factory
+        self.sweep_interval = sweep_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _acquire(self, api_key_id: int, key: str) -> Optional[datetime]:
+        now = datetime.now(timezone.utc)
+        stmt = pg_insert(IdempotencyKey).values(
+            idempotency_key=key, api_key_id=api_key_id, locked_at=now
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[IdempotencyKey.idempotency_key],
+            set_={"locked_at": now, "created_at": now},
+            where=and_(
+                IdempotencyKey.api_key_id == api_key_id,
+                IdempotencyKey.response_json.is_(None),
+                IdempotencyKey.locked_at < now - timedelta(seconds=self.lease_seconds)
+            )
+        ).returning(IdempotencyKey.idempotency_key)
+        async with self.session_factory() as db:
+            result = await db.execute(stmt)
+            acquired = result.scalar_one_or_none() is not None
+            await db.commit()
+        return now if acquired else None
+
+    async def _peek(self, api_key_id: int, key: str) -> Optional[StoredResponse]:
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(IdempotencyKey.response_json, IdempotencyKey.status_code).where(
+                    IdempotencyKey.idempotency_key == key,
+                    IdempotencyKey.api_key_id == api_key_id
+                )
+            )
+            row = result.one_or_none()
+        if row is None or row.response_json is None:
+            return None
+        return StoredResponse(status_code=row.status_code or 200, body=row.response_json.encode())
+
+    async def complete(self, api_key_id: int, key: str, lease: datetime, response: StoredResponse):
+        async with self.session_factory() as db:
+            await db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.idempotency_key == key, IdempotencyKey.locked_at == lease)
+                .values(response_json=response.body.decode(), status_code=response.status_code, locked_at=None)
+            )
+            await db.commit()
+
+    async def release(self, api_key_id: int, key: str, lease: datetime):
+        async with self.session_factory() as db:
+            await db.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.idempotency_key == key, IdempotencyKey.locked_at == lease)
+            )
+            await db.commit()
+
+    async def sweep(self) -> int:
+        now = datetime.now(timezone.utc)
+        async with self.session_factory() as db:
+            result = await db.execute(
+                delete(IdempotencyKey).where(or_(
+                    and_(IdempotencyKey.response_json.is_(None),
+                         IdempotencyKey.locked_at < now - timedelta(seconds=self.lease_seconds)),
+                    IdempotencyKey.created_at < now - timedelta(seconds=self.ttl_seconds)
+                ))
+            )
+            await db.commit()
+        return result.rowcount
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                removed = await self.sweep()
+                if removed:
+                    logger.info(f"Swept {removed} expired idempotency keys")
+            except Exception as e:
+                logger.error(f"Idempotency sweep failed: {e}")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """Single-process stand-in (tests, local runs). Expiry is checked on access."""
+
+    def __init__(self, lease_seconds: float, ttl_seconds: int, wait_timeout: float):
+        super().__init__(lease_seconds, ttl_seconds, wait_timeout)
+        # (api_key_id, key) -> (lease token or StoredResponse, expires_at)
+        self._entries: Dict[Tuple[int, str], Tuple[Any, float]] = {}
+
+    def _get(self, api_key_id: int, key: str):
+        entry = self._entries.get((api_key_id, key))
+        if entry is not None and entry[1] < time.monotonic():
+            del self._entries[(api_key_id, key)]
+            return None
+        return entry
+
+    async def _acquire(self, api_key_id: int, key: str) -> Optional[str]:
+        if self._get(api_key_id, key) is not None:
+            return None
+        token = secrets.token_hex(8)
+        self._entries[(api_key_id, key)] = (token, time.monotonic() + self.lease_seconds)
+        return token
+
+    async def _peek(self, api_key_id: int, key: str) -> Optional[StoredResponse]:
+        entry = self._get(api_key_id, key)
+        if entry is not None and isinstance(entry[0], StoredResponse):
+            return entry[0]
+        return None
+
+    async def complete(self, api_key_id: int, key: str, lease: str, response: StoredResponse):
+        entry = self._get(api_key_id, key)
+        if entry is not None and entry[0] == lease:
+            self._entries[(api_key_id, key)] = (response, time.monotonic() + self.ttl_seconds)
+
+    async def release(self, api_key_id: int, key: str, lease: str):
+        entry = self._get(api_key_id, key)
+        if entry is not None and entry[0] == lease:
+            del self._entries[(api_key_id, key)]
+
+
+def _build_store() -> IdempotencyStore:
+    common = dict(
+        lease_seconds=settings.IDEMPOTENCY_LEASE_SECONDS,
+        ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+        wait_timeout=settings.IDEMPOTENCY_WAIT_TIMEOUT
+    )
+    if settings.IDEMPOTENCY_BACKEND == "redis":
+        from ..utils.redis_client import redis_client
+        return RedisIdempotencyStore(redis_client, **common)
+    if settings.IDEMPOTENCY_BACKEND == "postgres":
+        return PostgresIdempotencyStore(
+            AsyncSessionLocal, sweep_interval=settings.IDEMPOTENCY_SWEEP_INTERVAL, **common
+        )
+    if settings.IDEMPOTENCY_BACKEND == "memory":
+        return InMemoryIdempotencyStore(**common)
+    raise ValueError(f"Unknown idempotency backend: {settings.IDEMPOTENCY_BACKEND}. Available: ['redis', 'postgres', 'memory']")
+
+
+# Global singleton
+idempotency_store = _build_store()
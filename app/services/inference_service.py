@@ -1,73 +1,283 @@
 from .metrics import InferenceMetrics
 from .logging_service import queue_log
+from .response_cache import response_cache, make_cache_key
+from .near_duplicate_cache import near_duplicate_cache
+from .singleflight import inference_flight
+from .hedging import hedge_budget, hedged_call, HedgeResult
+from ..config import settings
+from ..utils.tracing import span
 import asyncio
-from fastapi import BackgroundTasks
+import dataclasses
+import math
 from ..providers.registry import get_provider
-from ..providers.base import ProviderResponse, ProviderTemporaryError, ProviderPermanentError
+from ..providers.base import (
+    BaseProvider, ProviderResponse, ProviderTemporaryError, ProviderPermanentError, ProviderUnavailableError
+)
+from typing import AsyncIterator, Callable, List, Optional
 from tenacity import RetryError
 from ..router.model_router import router
 
+def fallback_chain(model: str, selected: str) -> List[str]:
+    """Providers to try in order: the selected one, then the configured chain for this model (or "*")."""
+    chain = settings.FALLBACK_CHAINS.get(model, settings.FALLBACK_CHAINS.get("*", []))
+    return [selected] + [name for name in chain if name != selected]
+
+
+async def _call_provider(provider: BaseProvider, prompt: str, max_tokens: int) -> ProviderResponse:
+    # Identical concurrent requests share one upstream call
+    if settings.SINGLEFLIGHT_ENABLED:
+        flight_key = (provider.name, prompt, max_tokens)
+        return await inference_flight.do(flight_key, lambda: provider.infer(prompt, max_tokens))
+    return await provider.infer(prompt, max_tokens)
+
+
 async def run_inference(model: str, prompt: str, max_tokens: int, 
-                       api_key_id: int, background_tasks: BackgroundTasks) -> ProviderResponse:
-    start_time = asyncio.get_event_loop().time()
+                       api_key_id: int, use_cache: bool = True,
+                       near_duplicate: bool = False) -> ProviderResponse:
+    loop = asyncio.get_event_loop()
+    start_time = loop.time()
     
     selected_model = model
     if model == "auto":
-        selected_model = router.select_provider(auto=True)
-    
+        with span("route"):
+            selected_model = router.select_provider(auto=True, prompt=prompt, max_tokens=max_tokens)
+
+    # Exact-match response cache (opt-in via RESPONSE_CACHE_ENABLED, bypassable per request)
+    cache_key = None
+    if use_cache and response_cache.enabled:
+        cache_key = make_cache_key(model, selected_model, prompt, max_tokens)
+        with span("cache", tier="exact") as scope:
+            cached = await response_cache.get(cache_key)
+            scope.set("hit", cached is not None)
+        if cached:
+            duration = loop.time() - start_time
+            result = dataclasses.replace(cached, latency_ms=round(duration * 1000, 2), cost=0.0, fallback_hops=0)
+            queue_log(InferenceMetrics.cache_hit(api_key_id, selected_model, selected_model, result))
+            return result
+
+    # Near-duplicate cache (opt-in per API key): whitespace/case/trailing-timestamp variants of a cached prompt
+    fingerprint = None
+    if use_cache and near_duplicate and near_duplicate_cache.enabled:
+        with span("cache", tier="near_duplicate") as scope:
+            fingerprint = near_duplicate_cache.fingerprint(prompt)
+            cached = near_duplicate_cache.get(selected_model, max_tokens, fingerprint)
+            scope.set("hit", cached is not None)
+        if cached:
+            duration = loop.time() - start_time
+            result = dataclasses.replace(cached, latency_ms=round(duration * 1000, 2), cost=0.0, fallback_hops=0)
+            queue_log(InferenceMetrics.cache_hit(api_key_id, selected_model, selected_model, result, status="near_cache_hit"))
+            return result
+
+    # Hedging (auto only): if the primary is slower than its p95, race the next-best provider
+    hedge_backup = None
+    if model == "auto" and settings.HEDGING_ENABLED:
+        hedge_budget.deposit()
+        backup_name = router.next_best(exclude=selected_model, prompt=prompt, max_tokens=max_tokens)
+        if backup_name and math.isfinite(router.hedge_delay_ms(selected_model)):
+            hedge_backup = get_provider(backup_name)
+
+    # Fail over along the chain on temporary errors, within one overall deadline
+    deadline = start_time + settings.FALLBACK_DEADLINE_SECONDS
     provider_used = selected_model
-    provider = None # Initialize 
-    
-    try:
-        provider = get_provider(selected_model)
-        result = await provider.infer(prompt, max_tokens)
+    coalesced = False
+    hops = -1
+    last_error = None
+
+    for provider_name in fallback_chain(model, selected_model):
+        if hops >= 0 and not router.is_available(provider_name):
+            continue # Fallback whose circuit is open (or that is saturated) would just refuse the call
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        provider = get_provider(provider_name)
+        provider_used = provider.name
+        hops += 1
+        attempt_start = loop.time()
+
+        # Someone else is already making this exact call: we'll share it ("coalesced")
+        coalesced = settings.SINGLEFLIGHT_ENABLED and inference_flight.in_flight((provider.name, prompt, max_tokens))
+
+        hedge = None
+        try:
+            if hops == 0 and hedge_backup is not None:
+                hedge = await asyncio.wait_for(hedged_call(
+                    lambda: _call_provider(provider, prompt, max_tokens),
+                    lambda: _call_provider(hedge_backup, prompt, max_tokens),
+                    delay_s=max(router.hedge_delay_ms(provider.name), settings.HEDGE_MIN_DELAY_MS) / 1000,
+                    budget=hedge_budget
+                ), remaining)
+                result = hedge.result
+            else:
+                result = await asyncio.wait_for(_call_provider(provider, prompt, max_tokens), remaining)
+        except asyncio.TimeoutError:
+            last_error = ProviderTemporaryError(
+                f"Request deadline of {settings.FALLBACK_DEADLINE_SECONDS}s exceeded on {provider.name}"
+            )
+            if not coalesced:
+                router.record_outcome(provider.name, (loop.time() - attempt_start) * 1000, False)
+            break
+        except RetryError as e:
+            # Unwrap tenacity RetryError
+            cause = e.last_attempt.exception()
+            if isinstance(cause, ProviderPermanentError):
+                _log_failure(api_key_id, selected_model, provider_used, "permanent", start_time, coalesced, hops)
+                raise cause
+            # Retries usually imply temporary issues
+            if not coalesced:
+                router.record_outcome(provider.name, (loop.time() - attempt_start) * 1000, False)
+            last_error = cause or e
+            continue
+        except ProviderTemporaryError as e:
+            # Only temporary errors count against provider health - permanent ones are usually the request's fault.
+            # A refused call (open circuit, overloaded) never reached the provider.
+            if not coalesced and not isinstance(e, ProviderUnavailableError):
+                router.record_outcome(provider.name, (loop.time() - attempt_start) * 1000, False)
+            last_error = e
+            continue
+        except ProviderPermanentError:
+            # The request itself is bad - another provider won't do better
+            _log_failure(api_key_id, selected_model, provider_used, "permanent", start_time, coalesced, hops)
+            raise
+
+        hedged = hedge is not None and hedge.hedged
+        if hedged:
+            loser = provider
+            if hedge.backup_won:
+                provider, coalesced = hedge_backup, False
+            else:
+                loser = hedge_backup
+            _log_hedge_loser(api_key_id, selected_model, loser, prompt, hedge)
+
+        result = dataclasses.replace(result, provider=provider.name, fallback_hops=hops)
+
+        # Only the leader fills the caches
+        if cache_key and not coalesced:
+            await response_cache.set(cache_key, result)
+        if fingerprint is not None and not coalesced:
+            near_duplicate_cache.set(selected_model, max_tokens, fingerprint, result)
         
         # Compute latency
-        duration = asyncio.get_event_loop().time() - start_time
+        duration = loop.time() - start_time
         
         # Metrics (success)
         metrics = InferenceMetrics.success(
-            api_key_id, selected_model, provider.name, result
+            api_key_id, selected_model, provider.name, result, coalesced=coalesced
         )
         metrics.latency_ms = duration * 1000  # Convert to milliseconds
-        queue_log(metrics, background_tasks)
+        metrics.hedged = hedged
+        queue_log(metrics)
+
+        # Feed live routing stats (followers would double count the leader's call)
+        if not coalesced:
+            router.record_outcome(provider.name, result.latency_ms, True)
         
         return result
 
-    except RetryError as e:
-        # Unwrap tenacity RetryError
-        cause = e.last_attempt.exception()
-        duration = asyncio.get_event_loop().time() - start_time
-        
-        # Log failure
-        error_type = "temporary" # Retries usually imply temporary issues
-        if isinstance(cause, ProviderPermanentError):
-            error_type = "permanent"
-            
-        metrics = InferenceMetrics.failure(api_key_id, selected_model, provider_used, error_type)
-        metrics.latency_ms = duration * 1000
-        queue_log(metrics, background_tasks)
-        
-        # Re-raise the cause if it's one of our known types, else re-raise original
-        if cause:
-            raise cause
-        raise e
-        
-    except ProviderTemporaryError as e:
-        # Compute latency
-        duration = asyncio.get_event_loop().time() - start_time
-        
-        # Log failure and re-raise for proper error handling
-        metrics = InferenceMetrics.failure(api_key_id, selected_model, provider_used, "temporary")
-        metrics.latency_ms = duration * 1000
-        queue_log(metrics, background_tasks)
+    # Chain exhausted or out of time
+    _log_failure(api_key_id, selected_model, provider_used, "temporary", start_time, coalesced, max(hops, 0))
+    if last_error is None:
+        last_error = ProviderTemporaryError(
+            f"Request deadline of {settings.FALLBACK_DEADLINE_SECONDS}s exceeded before a provider could be tried"
+        )
+    raise last_error
+
+
+def _log_hedge_loser(api_key_id: int, model: str, loser: BaseProvider, prompt: str, hedge: HedgeResult):
+    # The losing attempt of a hedged request gets its own row so hedging cost shows up in analytics
+    if hedge.loser_cancelled:
+        # Cancelled mid-flight: the provider still bills the prompt it received
+        tokens = loser.count_prompt_tokens(prompt)
+        metrics = InferenceMetrics(
+            api_key_id=api_key_id,
+            model_requested=model,
+            provider_used=loser.name,
+            latency_ms=hedge.loser_elapsed_ms,
+            tokens_used=tokens,
+            cost=loser.estimate_cost(tokens, 0),
+            status="hedge_cancelled",
+            hedged=True,
+            input_tokens=tokens
+        )
+        # Censored sample - it took at least this long - so a slow primary still looks slow
+        router.record_outcome(loser.name, hedge.loser_elapsed_ms, True)
+    else:
+        metrics = InferenceMetrics.failure(api_key_id, model, loser.name, "temporary")
+        metrics.latency_ms = hedge.loser_elapsed_ms
+        metrics.hedged = True
+        if not isinstance(hedge.loser_error, (ProviderUnavailableError, ProviderPermanentError, ValueError)):
+            router.record_outcome(loser.name, hedge.loser_elapsed_ms, False)
+    queue_log(metrics)
+
+
+def _log_failure(api_key_id: int, model: str, provider_name: str, error_type: str,
+                 start_time: float, coalesced: bool, hops: int):
+    metrics = InferenceMetrics.failure(api_key_id, model, provider_name, error_type)
+    metrics.latency_ms = (asyncio.get_event_loop().time() - start_time) * 1000
+    metrics.coalesced = coalesced
+    metrics.fallback_hops = hops
+    queue_log(metrics)
+
+
+def resolve_provider(model: str, prompt: Optional[str] = None, max_tokens: Optional[int] = None) -> BaseProvider:
+    """Resolve "auto" (scored for this prompt when given) or an explicit provider name. Raises ValueError if unknown."""
+    if model == "auto":
+        return get_provider(router.select_provider(auto=True, prompt=prompt, max_tokens=max_tokens))
+    return get_provider(model)
+
+
+async def stream_inference(provider: BaseProvider, model: str, prompt: str, max_tokens: int,
+                           api_key_id: int,
+                           on_usage: Optional[Callable[[int], None]] = None) -> AsyncIterator[str]:
+    """
+    Yield text deltas from the provider as they arrive.
+    Time-to-first-token and total stream duration are logged when the stream
+    ends - including when the client disconnects and the stream is cancelled.
+    on_usage (sync - it runs during cancellation) receives the tokens used.
+    """
+    loop = asyncio.get_event_loop()
+    start_time = loop.time()
+    ttft_ms = None
+    tokens_used = input_tokens = output_tokens = 0
+    # Assume the client went away until the stream completes or fails
+    status, error_type = "cancelled", None
+
+    upstream = provider.infer_stream(prompt, max_tokens)
+    try:
+        async for chunk in upstream:
+            if chunk.tokens_used is not None:
+                tokens_used = int(chunk.tokens_used)
+                input_tokens = int(chunk.input_tokens or 0)
+                output_tokens = int(chunk.output_tokens or 0)
+            if chunk.text:
+                if ttft_ms is None:
+                    ttft_ms = (loop.time() - start_time) * 1000
+                yield chunk.text
+        status = "success"
+    except ProviderTemporaryError:
+        status, error_type = "failure", "temporary"
         raise
-        
-    except ProviderPermanentError as e:
-        # Compute latency
-        duration = asyncio.get_event_loop().time() - start_time
-        
-        metrics = InferenceMetrics.failure(api_key_id, selected_model, provider_used, "permanent")
-        metrics.latency_ms = duration * 1000
-        queue_log(metrics, background_tasks)
+    except (ProviderPermanentError, ValueError):
+        status, error_type = "failure", "permanent"
         raise
+    finally:
+        duration_ms = (loop.time() - start_time) * 1000
+        metrics = InferenceMetrics(
+            api_key_id=api_key_id,
+            model_requested=model,
+            provider_used=provider.name,
+            latency_ms=duration_ms,
+            tokens_used=tokens_used,
+            cost=provider.estimate_cost(input_tokens, output_tokens),
+            status=status,
+            error_type=error_type,
+            ttft_ms=ttft_ms,
+            stream_duration_ms=duration_ms,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens
+        )
+        queue_log(metrics)
+        if on_usage is not None:
+            on_usage(tokens_used)
+        # Closes the upstream request if we are exiting early. Last, because
+        # the await can be interrupted again if we are being cancelled.
+        await upstream.aclose()
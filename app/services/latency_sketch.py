@@ -0,0 +1,138 @@
+# Mergeable latency percentile sketch (DDSketch) with a compact binary encoding
+import math
+import struct
+from typing import Dict, Iterable, Optional, Tuple
+
+RELATIVE_ACCURACY = 0.01  # every quantile is within 1% of the exact value
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LN_GAMMA = math.log(GAMMA)
+MIN_VALUE = 1e-3  # ms; anything at or below counts as zero
+
+_VERSION = 1
+_HEADER = struct.Struct("<Bdd")  # version, min, max
+
+
+def bin_index(value: float) -> Optional[int]:
+    """Bin holding `value`: (gamma^(i-1), gamma^i]. None for the zero bin."""
+    if value <= MIN_VALUE:
+        return None
+    return math.ceil(math.log(value) / LN_GAMMA)
+
+
+def _write_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+class LatencySketch:
+    """
+    DDSketch: values are counted in logarithmic bins, so any quantile is
+    answered within RELATIVE_ACCURACY of the exact one, and two sketches
+    merge exactly by adding bin counts. That makes them safe to keep per
+    rollup row and combine over any time range or grouping.
+
+    Latencies from 1 µs to an hour span ~1100 bins at 1% accuracy; a
+    typical hour of one provider/key uses a few dozen, a couple hundred
+    bytes encoded.
+    """
+
+    __slots__ = ("bins", "zero_count", "count", "min", "max")
+
+    def __init__(self):
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, count: int = 1):
+        index = bin_index(value)
+        self.add_bin(index, count)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def add_bin(self, index: Optional[int], count: int):
+        # Pre-binned counts (e.g. grouped in SQL); min/max are tracked by the caller
+        if index is None:
+            self.zero_count += count
+        else:
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += count
+
+    def merge(self, other: "LatencySketch") -> "LatencySketch":
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                value = 2 * GAMMA ** index / (GAMMA + 1)
+                # Never report outside what was actually observed
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self, quantiles: Iterable[float] = (0.5, 0.95, 0.99)) -> dict:
+        result = {"count": self.count}
+        for q in quantiles:
+            value = self.quantile(q)
+            result[f"p{round(q * 100):d}"] = round(value, 2) if value is not None else None
+        result["min"] = round(self.min, 2) if self.count else None
+        result["max"] = round(self.max, 2) if self.count else None
+        return result
+
+    def to_bytes(self) -> bytes:
+        """version/min/max header, then varints: zero count, bin count, (index delta, count) pairs."""
+        out = bytearray(_HEADER.pack(_VERSION, self.min if self.count else 0.0, self.max if self.count else 0.0))
+        _write_varint(out, self.zero_count)
+        _write_varint(out, len(self.bins))
+        previous = 0
+        for index in sorted(self.bins):
+            delta = index - previous
+            _write_varint(out, (delta << 1) ^ (delta >> 63))  # zigzag: indexes go negative below 1 ms
+            _write_varint(out, self.bins[index])
+            previous = index
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "LatencySketch":
+        version, low, high = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported latency sketch version: {version}")
+        sketch = cls()
+        pos = _HEADER.size
+        sketch.zero_count, pos = _read_varint(data, pos)
+        size, pos = _read_varint(data, pos)
+        index = 0
+        for _ in range(size):
+            zigzag, pos = _read_varint(data, pos)
+            index += (zigzag >> 1) ^ -(zigzag & 1)
+            sketch.bins[index], pos = _read_varint(data, pos)
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        if sketch.count:
+            sketch.min, sketch.max = low, high
+        return sketch
@@ -1,43 +1,285 @@
-from fastapi import BackgroundTasks
-from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import insert
 from ..db.base import RequestLog
-from ..config import AsyncSessionLocal
+from ..config import AsyncSessionLocal, settings
 from .metrics import InferenceMetrics
+from ..utils.prometheus import registry, REQUESTS, LOG_ENQUEUE_SECONDS, LOG_FLUSH_SECONDS
+from collections import deque
+from datetime import datetime
+from typing import Optional
+import asyncio
+import json
 import logging
-from dataclasses import asdict
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
-async def log_metrics(metrics: InferenceMetrics):
-    # Fire and forget logging of metrics
-    async with AsyncSessionLocal() as session:
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "spill")
+
+
+def metrics_to_row(metrics: InferenceMetrics) -> dict:
+    # Map InferenceMetrics fields to RequestLog columns
+    return {
+        "api_key_id": metrics.api_key_id,
+        "provider": metrics.provider_used,
+        "model": metrics.model_requested,
+        "latency": metrics.latency_ms,
+        "token_count": metrics.tokens_used,
+        "input_tokens": metrics.input_tokens,
+        "output_tokens": metrics.output_tokens,
+        "cost": metrics.cost,
+        "status": metrics.status,
+        "ttft_ms": metrics.ttft_ms,
+        "stream_duration_ms": metrics.stream_duration_ms,
+        "coalesced": metrics.coalesced,
+        "fallback_hops": metrics.fallback_hops,
+        "hedged": metrics.hedged,
+        # `timestamp` is left to the DB: the insert time, which rollups and partitions key on
+        "requested_at": metrics.created_at
+    }
+
+
+def row_to_json(row: dict) -> str:
+    requested_at = row["requested_at"]
+    return json.dumps({**row, "requested_at": requested_at.isoformat() if requested_at else None})
+
+
+def row_from_json(line: str) -> dict:
+    row = json.loads(line)
+    # Older spill files carried the request time as `timestamp`, or not at all
+    requested_at = row.pop("timestamp", None) or row.get("requested_at")
+    row["requested_at"] = datetime.fromisoformat(requested_at) if requested_at else None
+    return row
+
+
+class RequestLogSink:
+    """
+    Long-lived, in-memory buffer of request log rows flushed in bulk.
+
+    enqueue() never touches the DB, so telemetry doesn't hold a pool
+    connection per request. A single writer task flushes a batch when
+    batch_size rows are waiting or flush_interval elapses, whichever comes
+    first, using one multi-row INSERT per batch. Memory is bounded by
+    max_queue; on overflow rows are dropped (oldest or newest) or spilled
+    to a JSON-lines file that is replayed on the next start.
+    """
+
+    MAX_BACKOFF = 30.0
+
+    def __init__(self, session_factory, max_queue: int, batch_size: int, flush_interval: float,
+                 overflow_policy: str = "drop_oldest", spill_path: Optional[str] = None,
+                 drain_timeout: float = 10.0):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}. Available: {list(OVERFLOW_POLICIES)}")
+        if overflow_policy == "spill" and not spill_path:
+            raise ValueError("overflow_policy='spill' requires a spill_path")
+        self.session_factory = session_factory
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path
+        self.drain_timeout = drain_timeout
+
+        self._queue: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Stats
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    # --- producer side -------------------------------------------------
+
+    def enqueue(self, metrics: InferenceMetrics) -> bool:
+        """Buffer one row. Never blocks; returns False if the row was dropped or spilled."""
+        start = time.perf_counter()
+        self.enqueued += 1
+        REQUESTS.inc(metrics.provider_used, metrics.status, metrics.error_type or "")
+        buffered = self._push(metrics_to_row(metrics))
+        LOG_ENQUEUE_SECONDS.observe(time.perf_counter() - start)
+        return buffered
+
+    def _push(self, row: dict) -> bool:
+        if len(self._queue) >= self.max_queue:
+            if self.overflow_policy == "drop_newest":
+                self.dropped += 1
+                return False
+            if self.overflow_policy == "spill":
+                self._spill([row])
+                return False
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(row)
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _spill(self, rows: list):
         try:
-            # Drop None values to let DB defaults handle them if needed, or keep explicit
-            log_data = asdict(metrics)
-            # Map metrics fields to RequestLog columns if they differ
-            # InferenceMetrics: api_key_id, model_requested, provider_used, latency_ms, tokens_used, cost, status, error_type
-            # RequestLog: provider, latency, token_count, cost, status, timestamp(auto)
-            # Warning: RequestLog model does NOT have api_key_id, model_requested, error_type.
-            # We must map them or update RequestLog.
-            # Current RequestLog: provider, latency, token_count, cost, status.
-            
-            db_log = {
-                "api_key_id": metrics.api_key_id,
-                "provider": metrics.provider_used,
-                "model": metrics.model_requested,
-                "latency": metrics.latency_ms,
-                "token_count": metrics.tokens_used,
-                "cost": metrics.cost,
-                "status": metrics.status
-            }
-            stmt = insert(RequestLog).values(**db_log)
-            await session.execute(stmt)
-            await session.commit()
+            with open(self.spill_path, "a") as f:
+                for row in rows:
+                    f.write(row_to_json(row) + "\n")
+            self.spilled += len(rows)
+        except OSError as e:
+            logger.error(f"Failed to spill {len(rows)} request logs: {e}")
+            self.dropped += len(rows)
+
+    # --- writer side ---------------------------------------------------
+
+    async def _write(self, rows: list):
+        """Insert one batch. On failure the batch is requeued, unless it may already be committed."""
+        start = time.perf_counter()
+        phase = "insert"
+        try:
+            async with self.session_factory() as session:
+                # executemany -> batched multi-row INSERT ... VALUES on asyncpg
+                await session.execute(insert(RequestLog), rows)
+                phase = "commit"
+                await session.commit()
+                phase = "committed"
+        except BaseException as e:
+            self.flush_errors += 1
+            if phase == "insert" or (phase == "commit" and not isinstance(e, asyncio.CancelledError)):
+                # Nothing written (a failed COMMIT rolls back): retry later
+                self._requeue(rows)
+            elif phase == "commit":
+                # Cancelled after COMMIT was sent: it may have reached the server, and
+                # requeueing would write the batch twice - drop it (at most once)
+                self.dropped += len(rows)
+                logger.warning(f"Request log flush cancelled during commit, {len(rows)} rows may be lost")
+            else:
+                # The rows are written, only closing the session failed
+                self.flushed += len(rows)
+            raise
+        elapsed = time.perf_counter() - start
+        LOG_FLUSH_SECONDS.observe(elapsed)
+        elapsed_ms = elapsed * 1000
+        self.flush_count += 1
+        self.flushed += len(rows)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+
+    def _take_batch(self) -> list:
+        size = min(self.batch_size, len(self._queue))
+        return [self._queue.popleft() for _ in range(size)]
+
+    def _requeue(self, rows: list):
+        # Failed batch goes back to the front; anything past the bound follows the overflow policy
+        room = max(0, self.max_queue - len(self._queue))
+        keep, overflow = rows[:room], rows[room:]
+        self._queue.extendleft(reversed(keep))
+        if overflow:
+            if self.overflow_policy == "spill":
+                self._spill(overflow)
+            else:
+                self.dropped += len(overflow)
+
+    async def flush(self) -> int:
+        """Write everything currently buffered. Returns rows written."""
+        written = 0
+        while self._queue:
+            batch = self._take_batch()
+            await self._write(batch)
+            written += len(batch)
+        return written
+
+    async def _run(self):
+        backoff = self.flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                backoff = self.flush_interval
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to flush request logs ({len(self._queue)} buffered): {e}", exc_info=True)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.MAX_BACKOFF)
+
+    async def _replay_spill(self):
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        replay_path = self.spill_path + ".replay"
+        os.replace(self.spill_path, replay_path)
+        with open(replay_path) as f:
+            rows = [row_from_json(line) for line in f if line.strip()]
+        for row in rows:
+            self._push(row)
+        os.remove(replay_path)
+        logger.info(f"Replayed {len(rows)} spilled request logs")
+
+    async def start(self):
+        await self._replay_spill()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the writer and drain the buffer; whatever can't be written is spilled or reported."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await asyncio.wait_for(self.flush(), timeout=self.drain_timeout)
         except Exception as e:
-            logger.error(f"Failed to log metrics: {e}", exc_info=True)
-            await session.rollback()
+            remaining = list(self._queue)
+            self._queue.clear()
+            if remaining and self.spill_path:
+                self._spill(remaining)
+                logger.error(f"Request log drain failed, spilled {len(remaining)} rows: {e}")
+            elif remaining:
+                self.dropped += len(remaining)
+                logger.error(f"Request log drain failed, dropped {len(remaining)} rows: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.depth,
+            "max_queue": self.max_queue,
+            "overflow_policy": self.overflow_policy,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "flush_count": self.flush_count,
+            "flush_errors": self.flush_errors,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / self.flush_count, 2) if self.flush_count else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2)
+        }
+
+
+# Global singleton, started/stopped by the app lifespan
+log_sink = RequestLogSink(
+    AsyncSessionLocal,
+    max_queue=settings.LOG_SINK_MAX_QUEUE,
+    batch_size=settings.LOG_SINK_BATCH_SIZE,
+    flush_interval=settings.LOG_SINK_FLUSH_INTERVAL,
+    overflow_policy=settings.LOG_SINK_OVERFLOW_POLICY,
+    spill_path=settings.LOG_SINK_SPILL_PATH or None,
+    drain_timeout=settings.LOG_SINK_DRAIN_TIMEOUT
+)
+
+
+registry.gauge("gateway_log_queue_depth", "Request log rows buffered, not yet written", lambda: log_sink.depth)
+
 
-def queue_log(metrics: InferenceMetrics, background_tasks: BackgroundTasks):
-    #Background task wrapper to log metrics
-    background_tasks.add_task(log_metrics, metrics)
+def queue_log(metrics: InferenceMetrics):
+    # Non-blocking: buffered and written in bulk by the sink
+    log_sink.enqueue(metrics)
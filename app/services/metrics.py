@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from typing import Optional
 from ..providers.base import ProviderResponse
 
@@ -10,18 +11,47 @@ class InferenceMetrics:
     latency_ms: float
     tokens_used: int
     cost: float
-    status: str = "success"  # "success" or "failure"
+    status: str = "success"  # "success", "failure", "cache_hit", "near_cache_hit", "cancelled" or "hedge_cancelled"
     error_type: Optional[str] = None # "temporary", "permanent", or None
+    ttft_ms: Optional[float] = None # Streaming only: time to first token
+    stream_duration_ms: Optional[float] = None # Streaming only: request start to end of stream
+    coalesced: bool = False # Shared another request's in-flight upstream call
+    fallback_hops: int = 0 # Providers failed over from before this one served (or the chain gave up)
+    hedged: bool = False # Part of a hedged request (winner or losing attempt)
+    input_tokens: int = 0 # Split of tokens_used: prompt tokens
+    output_tokens: int = 0 # and completion tokens
+    # When the request was logged (request_logs.requested_at); flushes can lag or be replayed
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
 
     @classmethod
-    def success(cls, api_key_id: int, model:str, provider_name: str, result: ProviderResponse) -> "InferenceMetrics":
+    def success(cls, api_key_id: int, model:str, provider_name: str, result: ProviderResponse,
+                coalesced: bool = False) -> "InferenceMetrics":
+        # Coalesced followers made no upstream call - the leader's row carries the usage and cost
         return cls(
             api_key_id=api_key_id,
             model_requested=model,
             provider_used=provider_name,
             latency_ms=result.latency_ms,
-            tokens_used=result.tokens_used,
-            cost=result.cost
+            tokens_used=0 if coalesced else result.tokens_used,
+            cost=0.0 if coalesced else result.cost,
+            coalesced=coalesced,
+            fallback_hops=result.fallback_hops,
+            input_tokens=0 if coalesced else result.input_tokens,
+            output_tokens=0 if coalesced else result.output_tokens
+        )
+
+    @classmethod
+    def cache_hit(cls, api_key_id: int, model:str, provider_name: str, result: ProviderResponse,
+                  status: str = "cache_hit") -> "InferenceMetrics":
+        # Served from the response cache: no upstream call, nothing billed
+        return cls(
+            api_key_id=api_key_id,
+            model_requested=model,
+            provider_used=provider_name,
+            latency_ms=result.latency_ms,
+            tokens_used=0,
+            cost=0.0,
+            status=status
         )
 
     @classmethod
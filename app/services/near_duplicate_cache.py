@@ -0,0 +1,211 @@
+# Near-duplicate prompt cache: 64-bit SimHash fingerprints + LSH band index, fully offline
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set, Tuple
+from ..config import settings
+from ..providers.base import ProviderResponse
+
+FINGERPRINT_BITS = 64
+MAX_BANDS = 16
+
+# (numbers in the prompt, 64-bit SimHash)
+Fingerprint = Tuple[Tuple[str, ...], int]
+
+# A request timestamp appended to the prompt, on its own last line or in brackets:
+# "...\n2026-10-17T09:14:03Z", "... [2026-10-17 09:14]", "... (1760692443)".
+# Timestamps anywhere else may be what the prompt is asking about, so they stay.
+_STAMP = (r"(?:\d{4}-\d{2}-\d{2}[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:z|[+-]\d{2}:?\d{2})?"
+          r"|\d{10}(?:\d{3})?)")
+_TRAILING_TIMESTAMP = re.compile(rf"(?:\n\s*{_STAMP}|\s*\[{_STAMP}\]|\s*\({_STAMP}\))\s*$")
+_NUMBER = re.compile(r"\d+")
+_WORD = re.compile(r"\w+")
+
+# SimHash bit counting without a 64-step loop per feature: each fingerprint
+# bit is spread into its own 16-bit lane of a big int, so summing the spread
+# values of all features yields all 64 per-bit counts at once. Tables map
+# (byte position, byte value) -> pre-shifted lane pattern.
+_LANE = 16
+_LANE_MASK = (1 << _LANE) - 1
+_SPREAD = [
+    [sum(((value >> bit) & 1) << (_LANE * (8 * pos + bit)) for bit in range(8)) for value in range(256)]
+    for pos in range(8)
+]
+
+
+def normalize_prompt(prompt: str) -> str:
+    text = _TRAILING_TIMESTAMP.sub("", prompt.lower())
+    return " ".join(text.split())
+
+
+def numeric_tokens(text: str) -> Tuple[str, ...]:
+    """
+    Every number in already-normalized text, in order. Part of the lookup
+    scope: prompts that differ in a date, time, amount or phone number ask
+    different questions, however close their SimHash.
+    """
+    return tuple(_NUMBER.findall(text))
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over word unigrams and bigrams of already-normalized text."""
+    words = _WORD.findall(text)
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not features:
+        return 0
+    t0, t1, t2, t3, t4, t5, t6, t7 = _SPREAD
+    total = 0
+    for feature in features:
+        d = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        total += t0[d[0]] | t1[d[1]] | t2[d[2]] | t3[d[3]] | t4[d[4]] | t5[d[5]] | t6[d[6]] | t7[d[7]]
+    half = len(features) / 2
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        if (total >> (_LANE * bit)) & _LANE_MASK > half:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def max_distance_for(threshold: float) -> int:
+    # similarity = 1 - hamming / 64
+    return max(0, int((1.0 - threshold) * FINGERPRINT_BITS + 1e-9))
+
+
+class SimHashIndex:
+    """
+    LSH over fingerprint bands. With max_distance + 1 disjoint bands, any two
+    fingerprints within max_distance bits agree exactly on at least one band
+    (pigeonhole), so a lookup only has to check the ids in matching buckets.
+    Bands narrower than 4 bits would put most entries in every bucket, so
+    max_distance is capped at MAX_BANDS - 1 (a threshold of about 0.77).
+    """
+
+    def __init__(self, max_distance: int):
+        if max_distance + 1 > MAX_BANDS:
+            raise ValueError(
+                f"max_distance {max_distance} needs {max_distance + 1} bands; at most {MAX_BANDS} are supported "
+                f"(similarity threshold >= {1 - (MAX_BANDS - 1) / FINGERPRINT_BITS:.4f})"
+            )
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        width = FINGERPRINT_BITS // self.bands
+        # (shift, mask) per band; the last band absorbs any remainder bits
+        self._bands = []
+        for i in range(self.bands):
+            bits = width if i < self.bands - 1 else FINGERPRINT_BITS - width * i
+            self._bands.append((width * i, (1 << bits) - 1))
+        self._buckets: Dict[Tuple, Set[int]] = {}
+        self._fingerprints: Dict[int, Tuple[Hashable, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def _keys(self, scope: Hashable, fingerprint: int):
+        for i, (shift, mask) in enumerate(self._bands):
+            yield (scope, i, (fingerprint >> shift) & mask)
+
+    def add(self, entry_id: int, scope: Hashable, fingerprint: int):
+        self._fingerprints[entry_id] = (scope, fingerprint)
+        for key in self._keys(scope, fingerprint):
+            self._buckets.setdefault(key, set()).add(entry_id)
+
+    def remove(self, entry_id: int):
+        scope, fingerprint = self._fingerprints.pop(entry_id)
+        for key in self._keys(scope, fingerprint):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def query(self, scope: Hashable, fingerprint: int) -> Optional[Tuple[int, int]]:
+        """Closest entry within max_distance as (entry_id, distance), or None."""
+        best = None
+        seen = set()
+        for key in self._keys(scope, fingerprint):
+            for entry_id in self._buckets.get(key, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                distance = (self._fingerprints[entry_id][1] ^ fingerprint).bit_count()
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (entry_id, distance)
+                    if distance == 0:
+                        return best
+        return best
+
+
+class NearDuplicateCache:
+    """
+    Serves responses for prompts that differ only cosmetically from a cached one.
+    Entries are scoped by (provider, max_tokens, numbers in the prompt) and
+    evicted least-recently-used once max_entries is reached.
+    """
+
+    def __init__(self, threshold: float, max_entries: int, enabled: bool = True):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.index = SimHashIndex(max_distance_for(threshold))
+        self._entries: "OrderedDict[int, ProviderResponse]" = OrderedDict()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def fingerprint(prompt: str) -> Fingerprint:
+        text = normalize_prompt(prompt)
+        return numeric_tokens(text), simhash(text)
+
+    def get(self, provider: str, max_tokens: int, fingerprint: Fingerprint) -> Optional[ProviderResponse]:
+        numbers, bits = fingerprint
+        match = self.index.query((provider, max_tokens, numbers), bits)
+        if match is None:
+            self.misses += 1
+            return None
+        entry_id, _ = match
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        return self._entries[entry_id]
+
+    def set(self, provider: str, max_tokens: int, fingerprint: Fingerprint, response: ProviderResponse):
+        numbers, bits = fingerprint
+        scope = (provider, max_tokens, numbers)
+        match = self.index.query(scope, bits)
+        if match is not None and match[1] == 0:
+            # Same fingerprint already cached - refresh it instead of adding a twin
+            self._entries[match[0]] = response
+            self._entries.move_to_end(match[0])
+            return
+        while len(self._entries) >= self.max_entries:
+            oldest_id, _ = self._entries.popitem(last=False)
+            self.index.remove(oldest_id)
+            self.evictions += 1
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = response
+        self.index.add(entry_id, scope, bits)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "max_distance_bits": self.index.max_distance,
+            "bands": self.index.bands,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+# Global singleton
+near_duplicate_cache = NearDuplicateCache(
+    threshold=settings.NEAR_DUP_CACHE_THRESHOLD,
+    max_entries=settings.NEAR_DUP_CACHE_MAX_ENTRIES,
+    enabled=settings.NEAR_DUP_CACHE_ENABLED
+)
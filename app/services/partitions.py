@@ -0,0 +1,223 @@
+# Time-range partitions of request_logs: created ahead of time, dropped for retention
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional
+from sqlalchemy import text
+from ..config import AsyncSessionLocal, settings
+from .rollups import get_watermark
+
+logger = logging.getLogger(__name__)
+
+PARENT = "request_logs"
+DEFAULT_PARTITION = "request_logs_default"
+INTERVALS = {"day": timedelta(days=1), "week": timedelta(weeks=1)}
+
+# pg_get_expr(relpartbound): FOR VALUES FROM ('2026-10-17 00:00:00+00') TO ('2026-10-18 00:00:00+00')
+_BOUNDS = re.compile(r"FROM \((?:'([^']+)'|MINVALUE)\) TO \((?:'([^']+)'|MAXVALUE)\)")
+_LOCK_KEY = "request_logs_partitions"
+
+
+class Partition(NamedTuple):
+    name: str
+    start: Optional[datetime]  # None = MINVALUE
+    end: Optional[datetime]  # None = MAXVALUE
+
+
+def partition_start(ts: datetime, interval: str) -> datetime:
+    """Start of the UTC day/week (Monday) holding `ts`."""
+    day = ts.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return day - timedelta(days=day.weekday()) if interval == "week" else day
+
+
+def plan_partitions(existing: List[Partition], start: datetime, end: datetime, interval: str) -> List[Partition]:
+    """
+    Partitions to create so [start, end) is covered, on interval boundaries
+    and fitted around the existing ones (e.g. after switching day -> week,
+    or the migrated legacy partition ending mid-week).
+    """
+    step = INTERVALS[interval]
+    planned = []
+    cursor = start
+    while cursor < end:
+        covering = next((p for p in existing if (p.start is None or p.start <= cursor)
+                         and (p.end is None or cursor < p.end)), None)
+        if covering:
+            if covering.end is None:
+                break
+            cursor = covering.end
+            continue
+        upper = partition_start(cursor, interval) + step
+        upper = min([upper] + [p.start for p in existing if p.start is not None and p.start > cursor])
+        planned.append(Partition(f"{PARENT}_p{cursor:%Y%m%d}", cursor, upper))
+        cursor = upper
+    return planned
+
+
+class RequestLogPartitionManager:
+    """
+    Keeps request_logs range-partitioned by day or week: the current and the
+    next `ahead` partitions always exist, and with a retention period whole
+    partitions past it are dropped - no DELETE, no table or index bloat.
+    A partition is only dropped once the rollup watermark is past its end,
+    so analytics keep the aggregates of everything dropped.
+
+    Rows outside every partition land in request_logs_default; creating a
+    partition for their range moves them out first. Workers serialize on an
+    advisory lock, so any number of them can run this.
+    """
+
+    def __init__(self, session_factory, interval: str, ahead: int, retention_days: int,
+                 check_interval: float, keep_unrolled: bool = True):
+        if interval not in INTERVALS:
+            raise ValueError(f"Unknown partition interval: {interval}. Available: {list(INTERVALS)}")
+        self.session_factory = session_factory
+        self.interval = interval
+        self.ahead = ahead
+        self.retention = timedelta(days=retention_days) if retention_days > 0 else None
+        self.check_interval = check_interval
+        self.keep_unrolled = keep_unrolled
+        self._task: Optional[asyncio.Task] = None
+
+        # Stats
+        self.runs = 0
+        self.created = 0
+        self.dropped = 0
+        self.last_run_ms = 0.0
+
+    async def is_partitioned(self, db) -> bool:
+        relkind = await db.scalar(text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:parent)"),
+                                  {"parent": PARENT})
+        return relkind == "p"
+
+    async def partitions(self, db) -> List[Partition]:
+        """Range partitions in bound order (the default partition is left out)."""
+        rows = await db.execute(text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:parent)"
+        ), {"parent": PARENT})
+        result = []
+        for name, bound in rows:
+            match = _BOUNDS.search(bound)
+            if match:
+                low, high = match.groups()
+                result.append(Partition(
+                    name,
+                    datetime.fromisoformat(low) if low else None,
+                    datetime.fromisoformat(high) if high else None
+                ))
+        return sorted(result, key=lambda p: p.start or datetime.min.replace(tzinfo=timezone.utc))
+
+    async def _create(self, db, partition: Partition):
+        bounds = {"start": partition.start, "end": partition.end}
+        moving = await db.scalar(text(
+            f'SELECT count(*) FROM {DEFAULT_PARTITION} WHERE "timestamp" >= :start AND "timestamp" < :end'
+        ), bounds)
+        if moving:
+            # ATTACH/CREATE would fail on rows in the default partition that
+            # belong to the new one: detach it, re-route them, attach it back
+            await db.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {DEFAULT_PARTITION}"))
+        await db.execute(text(
+            f"CREATE TABLE {partition.name} PARTITION OF {PARENT} "
+            f"FOR VALUES FROM ('{partition.start.isoformat()}') TO ('{partition.end.isoformat()}')"
+        ))
+        if moving:
+            await db.execute(text(
+                f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE "timestamp" >= :start AND "timestamp" < :end '
+                f"RETURNING *) INSERT INTO {PARENT} SELECT * FROM moved"
+            ), bounds)
+            await db.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+            logger.info(f"Moved {moving} request log rows from {DEFAULT_PARTITION} to {partition.name}")
+
+    async def ensure(self, start: datetime, end: datetime) -> List[str]:
+        """Create the partitions missing to cover [start, end). Returns their names."""
+        async with self.session_factory() as db:
+            await db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": _LOCK_KEY})
+            await db.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+            planned = plan_partitions(
+                await self.partitions(db), partition_start(start, self.interval), end, self.interval
+            )
+            for partition in planned:
+                await self._create(db, partition)
+            await db.commit()
+        self.created += len(planned)
+        return [partition.name for partition in planned]
+
+    async def drop_expired(self) -> List[str]:
+        """Drop the partitions entirely older than the retention period. Returns their names."""
+        if self.retention is None:
+            return []
+        async with self.session_factory() as db:
+            await db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": _LOCK_KEY})
+            cutoff = datetime.now(timezone.utc) - self.retention
+            if self.keep_unrolled:
+                # Rows not rolled up yet would vanish from analytics
+                cutoff = min(cutoff, await get_watermark(db) or datetime.min.replace(tzinfo=timezone.utc))
+            expired = [p for p in await self.partitions(db) if p.end is not None and p.end <= cutoff]
+            for partition in expired:
+                await db.execute(text(f"DROP TABLE {partition.name}"))
+            await db.commit()
+        self.dropped += len(expired)
+        for partition in expired:
+            logger.info(f"Dropped request log partition {partition.name} (ended {partition.end:%Y-%m-%d})")
+        return [partition.name for partition in expired]
+
+    async def run_once(self) -> dict:
+        started = asyncio.get_event_loop().time()
+        async with self.session_factory() as db:
+            if not await self.is_partitioned(db):
+                logger.warning(f"{PARENT} is not partitioned (see migrations/013); partition upkeep skipped")
+                return {"created": [], "dropped": []}
+        now = datetime.now(timezone.utc)
+        step = INTERVALS[self.interval]
+        created = await self.ensure(now, partition_start(now, self.interval) + step * (self.ahead + 1))
+        dropped = await self.drop_expired()
+        self.runs += 1
+        self.last_run_ms = (asyncio.get_event_loop().time() - started) * 1000
+        return {"created": created, "dropped": dropped}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Request log partition upkeep failed: {e}", exc_info=True)
+
+    async def start(self):
+        # The current partition must exist before the log sink's first flush
+        try:
+            await self.run_once()
+        except Exception as e:
+            logger.error(f"Request log partition upkeep failed: {e}", exc_info=True)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "retention_days": self.retention.days if self.retention else None,
+            "runs": self.runs,
+            "created": self.created,
+            "dropped": self.dropped,
+            "last_run_ms": round(self.last_run_ms, 2)
+        }
+
+
+# Global singleton, started/stopped by the app lifespan
+partition_manager = RequestLogPartitionManager(
+    AsyncSessionLocal,
+    interval=settings.REQUEST_LOG_PARTITION_INTERVAL,
+    ahead=settings.REQUEST_LOG_PARTITIONS_AHEAD,
+    retention_days=settings.REQUEST_LOG_RETENTION_DAYS,
+    check_interval=settings.REQUEST_LOG_PARTITION_CHECK_SECONDS,
+    keep_unrolled=settings.ROLLUP_ENABLED
+)
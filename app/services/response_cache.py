@@ -0,0 +1,109 @@
+# Exact-match inference response cache: in-process LRU in front of a shared Redis tier
+import hashlib
+import json
+import logging
+import unicodedata
+from dataclasses import asdict
+from typing import Optional
+from cachetools import TTLCache
+from ..config import settings
+from ..providers.base import ProviderResponse
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "infer:v1:"
+
+
+def normalize_prompt(prompt: str) -> str:
+    # Unicode-normalize and trim so cosmetic differences share an entry
+    return unicodedata.normalize("NFC", prompt).strip()
+
+
+def make_cache_key(model: str, provider: str, prompt: str, max_tokens: int) -> str:
+    payload = json.dumps(
+        [model.strip().lower(), provider, normalize_prompt(prompt), max_tokens],
+        ensure_ascii=False
+    )
+    return KEY_PREFIX + hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of successful ProviderResponses.
+    Local tier is an LRU bounded by total serialized bytes (with TTL); the
+    Redis tier is shared across workers and expires entries by TTL. Redis
+    failures are treated as misses - the cache never fails a request.
+    """
+
+    def __init__(self, redis, ttl: int, max_bytes: int, enabled: bool = True, use_redis: bool = True):
+        self.redis = redis
+        self.ttl = ttl
+        self.enabled = enabled
+        self.use_redis = use_redis
+        self._local = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=len)
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[ProviderResponse]:
+        raw = self._local.get(key)
+        if raw is not None:
+            self.local_hits += 1
+            return ProviderResponse(**json.loads(raw))
+
+        if self.use_redis:
+            try:
+                raw = await self.redis.get(key)
+            except Exception as e:
+                logger.warning(f"Response cache Redis get failed: {e}")
+                raw = None
+            if raw is not None:
+                self.redis_hits += 1
+                self._store_local(key, raw)
+                return ProviderResponse(**json.loads(raw))
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, response: ProviderResponse):
+        raw = json.dumps(asdict(response))
+        self._store_local(key, raw)
+        if self.use_redis:
+            try:
+                await self.redis.set(key, raw, ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"Response cache Redis set failed: {e}")
+
+    def _store_local(self, key: str, raw: str):
+        try:
+            self._local[key] = raw
+        except ValueError:
+            pass  # Single value larger than the whole local tier - Redis only
+
+    def stats(self) -> dict:
+        hits = self.local_hits + self.redis_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "local_entries": len(self._local),
+            "local_bytes": self._local.currsize,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def _build_cache() -> ResponseCache:
+    from ..utils.redis_client import redis_client
+    return ResponseCache(
+        redis_client,
+        ttl=settings.RESPONSE_CACHE_TTL,
+        max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+        enabled=settings.RESPONSE_CACHE_ENABLED,
+        use_redis=settings.RESPONSE_CACHE_REDIS
+    )
+
+
+# Global singleton
+response_cache = _build_cache()
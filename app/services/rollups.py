@@ -0,0 +1,361 @@
+# Incrementally maintained hourly/daily rollups of request_logs for analytics
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Optional, Sequence, Tuple
+from sqlalchemy import select, update, func, case, union_all, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from ..db.base import RequestLog, RequestLogHourly, RequestLogDaily, RollupWatermark
+from ..config import AsyncSessionLocal, settings
+from .latency_sketch import LatencySketch, LN_GAMMA, MIN_VALUE
+
+logger = logging.getLogger(__name__)
+
+WATERMARK = "request_logs"
+MEASURES = ("request_count", "token_count", "input_tokens", "output_tokens", "cost", "hedged_count", "hedged_cost")
+KEYS = ("bucket", "api_key_id", "provider", "model", "status")
+
+# Inlined rather than bound: GROUP BY must repeat the SELECT expressions
+# exactly, and bound parameters would make them different expressions
+_HOUR, _DAY, _UTC = literal_column("'hour'"), literal_column("'day'"), literal_column("'UTC'")
+_NO_KEY, _NO_MODEL = literal_column("0"), literal_column("''")
+_LN_GAMMA, _MIN_LATENCY = literal_column(repr(LN_GAMMA)), literal_column(repr(MIN_VALUE))
+
+
+def _floor_hour(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _floor_day(ts: datetime) -> datetime:
+    return _floor_hour(ts).replace(hour=0)
+
+
+def date_range(start_date: Optional[date], end_date: Optional[date]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Inclusive UTC dates -> half-open [start, end) timestamps, usable as sargable range predicates."""
+    start = datetime.combine(start_date, time.min, tzinfo=timezone.utc) if start_date else None
+    end = datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=timezone.utc) if end_date else None
+    return start, end
+
+
+def _raw_keys() -> dict:
+    """request_logs expressions for the rollup KEYS (hour buckets, NULLs mapped like the rollups)."""
+    return {
+        "bucket": func.date_trunc(_HOUR, RequestLog.timestamp, _UTC),
+        "api_key_id": func.coalesce(RequestLog.api_key_id, _NO_KEY),
+        "provider": RequestLog.provider,
+        "model": func.coalesce(RequestLog.model, _NO_MODEL),
+        "status": RequestLog.status
+    }
+
+
+def _time_range(stmt, column, start: Optional[datetime], end: Optional[datetime]):
+    if start is not None:
+        stmt = stmt.where(column >= start)
+    if end is not None:
+        stmt = stmt.where(column < end)
+    return stmt
+
+
+def _raw_aggregate(start: Optional[datetime], end: Optional[datetime]):
+    """request_logs in [start, end) aggregated to rollup rows (hour buckets)."""
+    keys = _raw_keys()
+    stmt = select(
+        *(expression.label(name) for name, expression in keys.items()),
+        func.count().label("request_count"),
+        func.coalesce(func.sum(RequestLog.token_count), 0).label("token_count"),
+        func.coalesce(func.sum(RequestLog.input_tokens), 0).label("input_tokens"),
+        func.coalesce(func.sum(RequestLog.output_tokens), 0).label("output_tokens"),
+        func.coalesce(func.sum(RequestLog.cost), 0.0).label("cost"),
+        func.count().filter(RequestLog.hedged.is_(True)).label("hedged_count"),
+        func.coalesce(func.sum(RequestLog.cost).filter(RequestLog.hedged.is_(True)), 0.0).label("hedged_cost")
+    ).group_by(*keys.values())
+    return _time_range(stmt, RequestLog.timestamp, start, end)
+
+
+def _raw_latency_bins(group: Sequence[str], start: Optional[datetime], end: Optional[datetime], filters: dict):
+    """request_logs latencies in [start, end) counted per `group` and LatencySketch bin, in SQL."""
+    keys = _raw_keys()
+    # Same as latency_sketch.bin_index(); NULL is the zero bin
+    index = case((RequestLog.latency > _MIN_LATENCY, func.ceil(func.ln(RequestLog.latency) / _LN_GAMMA)))
+    stmt = select(
+        *(keys[name].label(name) for name in group),
+        index.label("bin"),
+        func.count().label("count"),
+        func.min(RequestLog.latency).label("low"),
+        func.max(RequestLog.latency).label("high")
+    ).where(
+        RequestLog.latency.is_not(None), *(keys[name] == value for name, value in filters.items())
+    ).group_by(*(keys[name] for name in group), index)
+    return _time_range(stmt, RequestLog.timestamp, start, end)
+
+
+def _fold_bins(rows, group: Sequence[str], sketches: Dict[tuple, LatencySketch]) -> Dict[tuple, LatencySketch]:
+    for row in rows:
+        key = tuple(getattr(row, name) for name in group)
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = LatencySketch()
+        sketch.add_bin(None if row.bin is None else int(row.bin), row.count)
+        sketch.min = min(sketch.min, row.low)
+        sketch.max = max(sketch.max, row.high)
+    return sketches
+
+
+def _rollup_rows(table, start: Optional[datetime], end: Optional[datetime]):
+    stmt = select(*(getattr(table, column) for column in KEYS + MEASURES))
+    return _time_range(stmt, table.bucket, start, end)
+
+
+def _upsert_adding(table, rows):
+    # Rows for an existing bucket add onto it (a day is built up hour by hour)
+    stmt = pg_insert(table).from_select(list(KEYS + MEASURES), rows)
+    return stmt.on_conflict_do_update(
+        index_elements=list(KEYS),
+        set_={column: getattr(table, column) + getattr(stmt.excluded, column) for column in MEASURES}
+    )
+
+
+async def get_watermark(db) -> Optional[datetime]:
+    return await db.scalar(select(RollupWatermark.rolled_until).where(RollupWatermark.name == WATERMARK))
+
+
+def _split(watermark: datetime, start: Optional[datetime], end: Optional[datetime]):
+    """[start, end) -> daily [start, day_end), hourly [hourly_start, rolled_end) and raw [tail_start, end)."""
+    rolled_end = watermark if end is None else min(end, watermark)
+    day_end = _floor_day(rolled_end)
+    hourly_start = day_end if start is None else max(day_end, start)
+    tail_start = watermark if start is None else max(watermark, start)
+    return day_end, hourly_start, rolled_end, tail_start
+
+
+async def rollup_source(db, start: Optional[datetime], end: Optional[datetime]):
+    """
+    Rollup-shaped rows (KEYS + MEASURES) covering [start, end), as a subquery:
+    whole days before the watermark's day from the daily rollup, the rest of
+    the rolled-up range from the hourly rollup, and the tail not rolled up
+    yet straight from request_logs. Every part is a range scan on an index.
+    `start` must be a day boundary (see date_range).
+    """
+    watermark = await get_watermark(db)
+    if watermark is None:
+        # Compactor hasn't run yet
+        return _raw_aggregate(start, end).subquery()
+
+    day_end, hourly_start, rolled_end, tail_start = _split(watermark, start, end)
+    return union_all(
+        _rollup_rows(RequestLogDaily, start, day_end),
+        _rollup_rows(RequestLogHourly, hourly_start, rolled_end),
+        _raw_aggregate(tail_start, end)
+    ).subquery()
+
+
+async def latency_sketches(db, start: Optional[datetime], end: Optional[datetime],
+                           group_by: Sequence[str] = (), **filters) -> Dict[tuple, LatencySketch]:
+    """
+    Latency sketches covering [start, end), merged per `group_by` value tuple
+    (names from KEYS), for rows equal to `filters`. Same split as
+    rollup_source: the stored sketches of the daily/hourly rollups are
+    merged, and only the tail not rolled up yet is binned from request_logs.
+    """
+    sketches: Dict[tuple, LatencySketch] = {}
+    tail_start = start
+    watermark = await get_watermark(db)
+    if watermark is not None:
+        day_end, hourly_start, rolled_end, tail_start = _split(watermark, start, end)
+        for table, low, high in ((RequestLogDaily, start, day_end), (RequestLogHourly, hourly_start, rolled_end)):
+            stmt = select(*(getattr(table, name) for name in group_by), table.latency_sketch).where(
+                table.latency_sketch.is_not(None), *(getattr(table, name) == value for name, value in filters.items())
+            )
+            for row in await db.execute(_time_range(stmt, table.bucket, low, high)):
+                key = tuple(row[:-1])
+                sketch = LatencySketch.from_bytes(row.latency_sketch)
+                if key in sketches:
+                    sketches[key].merge(sketch)
+                else:
+                    sketches[key] = sketch
+
+    rows = await db.execute(_raw_latency_bins(group_by, tail_start, end, filters))
+    return _fold_bins(rows, group_by, sketches)
+
+
+async def unrolled_rows(db, watermark: Optional[datetime], hours: int) -> dict:
+    """
+    Rows in request_logs from the `hours` before the watermark that the
+    hourly rollup doesn't count (inserted below the watermark after their
+    hour was rolled). Both sides are range scans on the hours checked.
+    """
+    if watermark is None or hours <= 0:
+        return {"hours_checked": 0, "rows": 0, "hours": []}
+    start = watermark - timedelta(hours=hours)
+    bucket = func.date_trunc(_HOUR, RequestLog.timestamp, _UTC)
+    raw = await db.execute(_time_range(
+        select(bucket.label("bucket"), func.count().label("count")).group_by(bucket),
+        RequestLog.timestamp, start, watermark
+    ))
+    rolled = await db.execute(_time_range(
+        select(RequestLogHourly.bucket, func.sum(RequestLogHourly.request_count).label("count"))
+        .group_by(RequestLogHourly.bucket),
+        RequestLogHourly.bucket, start, watermark
+    ))
+    rolled_counts = {row.bucket: int(row.count) for row in rolled}
+    # Fewer raw rows than rolled up is retention having dropped them, not a miss
+    missing = {row.bucket: int(row.count) - rolled_counts.get(row.bucket, 0) for row in raw}
+    missing = {hour: count for hour, count in missing.items() if count > 0}
+    return {"hours_checked": hours, "rows": sum(missing.values()), "hours": sorted(missing)}
+
+
+class RollupCompactor:
+    """
+    Folds request_logs into the hourly rollup, and the new hours into the
+    daily rollup, a whole hour at a time behind a watermark.
+
+    Each run rolls [watermark, upto) and advances the watermark in the same
+    transaction, so every row is counted exactly once. The watermark row is
+    locked FOR UPDATE: workers running the compactor at the same time
+    serialize, and the later one finds nothing left to do.
+
+    Rows are bucketed by `timestamp`, the insert transaction's start time -
+    never the request time (requested_at), which can be far in the past for
+    rows the log sink retried or replayed from its spill file. So a row only
+    lands below the watermark if its insert transaction was open for longer
+    than `lag`: an hour is rolled `lag` after it ends. unrolled_rows() checks
+    that this held for the hours just below the watermark.
+    """
+
+    def __init__(self, session_factory, interval: float, lag_seconds: float, max_hours_per_run: int):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.lag = timedelta(seconds=lag_seconds)
+        self.max_hours_per_run = max_hours_per_run
+        self._task: Optional[asyncio.Task] = None
+
+        # Stats
+        self.runs = 0
+        self.hours_rolled = 0
+        self.last_run_ms = 0.0
+
+    async def _lock_watermark(self, db) -> datetime:
+        stmt = select(RollupWatermark.rolled_until).where(RollupWatermark.name == WATERMARK).with_for_update()
+        watermark = await db.scalar(stmt)
+        if watermark is None:
+            # First run: start from the oldest log's hour
+            oldest = await db.scalar(select(func.min(RequestLog.timestamp)))
+            start = _floor_hour(oldest or datetime.now(timezone.utc))
+            await db.execute(
+                pg_insert(RollupWatermark).values(name=WATERMARK, rolled_until=start).on_conflict_do_nothing()
+            )
+            watermark = await db.scalar(stmt)
+        return watermark
+
+    async def run_once(self) -> int:
+        """Roll up to max_hours_per_run whole hours. Returns the number of hours rolled."""
+        started = asyncio.get_event_loop().time()
+        async with self.session_factory() as db:
+            watermark = await self._lock_watermark(db)
+            upto = min(
+                _floor_hour(datetime.now(timezone.utc) - self.lag),
+                watermark + timedelta(hours=self.max_hours_per_run)
+            )
+            if upto <= watermark:
+                await db.rollback()
+                return 0
+
+            await db.execute(_upsert_adding(RequestLogHourly, _raw_aggregate(watermark, upto)))
+            day = func.date_trunc(_DAY, RequestLogHourly.bucket, _UTC)
+            daily = select(
+                day.label("bucket"),
+                RequestLogHourly.api_key_id,
+                RequestLogHourly.provider,
+                RequestLogHourly.model,
+                RequestLogHourly.status,
+                *(func.sum(getattr(RequestLogHourly, column)).label(column) for column in MEASURES)
+            ).where(
+                RequestLogHourly.bucket >= watermark, RequestLogHourly.bucket < upto
+            ).group_by(
+                day, RequestLogHourly.api_key_id, RequestLogHourly.provider,
+                RequestLogHourly.model, RequestLogHourly.status
+            )
+            await db.execute(_upsert_adding(RequestLogDaily, daily))
+            await self._roll_latency(db, watermark, upto)
+            await db.execute(
+                update(RollupWatermark).where(RollupWatermark.name == WATERMARK).values(rolled_until=upto)
+            )
+            await db.commit()
+
+        hours = int((upto - watermark) / timedelta(hours=1))
+        self.runs += 1
+        self.hours_rolled += hours
+        self.last_run_ms = (asyncio.get_event_loop().time() - started) * 1000
+        return hours
+
+    async def _roll_latency(self, db, watermark: datetime, upto: datetime):
+        # Sketches for the new hourly rows, binned in SQL. Those rows were
+        # just created, so they are set outright; the day's sketch is merged
+        # with what earlier runs stored for the same day.
+        hourly = _fold_bins(await db.execute(_raw_latency_bins(KEYS, watermark, upto, {})), KEYS, {})
+        if not hourly:
+            return
+        await db.execute(update(RequestLogHourly), [
+            {**dict(zip(KEYS, key)), "latency_sketch": sketch.to_bytes()} for key, sketch in hourly.items()
+        ])
+
+        existing = select(*(getattr(RequestLogDaily, name) for name in KEYS), RequestLogDaily.latency_sketch).where(
+            RequestLogDaily.bucket >= _floor_day(watermark), RequestLogDaily.bucket < upto,
+            RequestLogDaily.latency_sketch.is_not(None)
+        )
+        daily = {tuple(row[:-1]): LatencySketch.from_bytes(row.latency_sketch) for row in await db.execute(existing)}
+        touched = set()
+        for (bucket, *rest), sketch in hourly.items():
+            key = (_floor_day(bucket), *rest)
+            touched.add(key)
+            if key in daily:
+                daily[key].merge(sketch)
+            else:
+                daily[key] = sketch
+        await db.execute(update(RequestLogDaily), [
+            {**dict(zip(KEYS, key)), "latency_sketch": daily[key].to_bytes()} for key in touched
+        ])
+
+    async def catch_up(self) -> int:
+        """Run until the watermark is current (backfill)."""
+        total = 0
+        while True:
+            hours = await self.run_once()
+            total += hours
+            if hours < self.max_hours_per_run:
+                return total
+
+    async def _run(self):
+        while True:
+            try:
+                await self.catch_up()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Request log rollup failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "hours_rolled": self.hours_rolled,
+            "last_run_ms": round(self.last_run_ms, 2)
+        }
+
+
+# Global singleton, started/stopped by the app lifespan
+rollup_compactor = RollupCompactor(
+    AsyncSessionLocal,
+    interval=settings.ROLLUP_INTERVAL_SECONDS,
+    lag_seconds=settings.ROLLUP_LAG_SECONDS,
+    max_hours_per_run=settings.ROLLUP_MAX_HOURS_PER_RUN
+)
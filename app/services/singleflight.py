@@ -0,0 +1,72 @@
+# Single-flight coalescing of identical in-flight upstream calls
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Concurrent do() calls with the same key share one execution of fn.
+
+    The shared call runs in its own task, and each caller awaits it through
+    asyncio.shield, so cancelling one caller (e.g. a client disconnect) never
+    cancels the call for the others. The call is only cancelled once every
+    caller has gone. An exception raised by the call is re-raised to every
+    caller.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.leaders = 0
+        self.coalesced = 0  # upstream calls saved
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._done(key, call, task))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller was cancelled - nobody wants the result any more
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _done(self, key: Hashable, call: _Call, task: asyncio.Task):
+        if not task.cancelled():
+            task.exception()  # Callers re-raise it; mark retrieved so asyncio doesn't warn
+        self._forget(key, call)
+
+    def _forget(self, key: Hashable, call: _Call):
+        # Only drop our own entry; a newer call may already own the key
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "upstream_calls": self.leaders,
+            "upstream_calls_saved": self.coalesced
+        }
+
+
+# Global singleton for provider inference calls
+inference_flight = SingleFlight()
@@ -67,7 +67,8 @@ async def http_exception_handler(request: Request, exc:StarletteHTTPException):
             "timestamp": datetime.now().isoformat(),
             "path":request.url.path,
             "method":request.method
-        }
+        },
+        headers=getattr(exc, "headers", None) # e.g. Retry-After
     )
 
 async def validation_exception_handler(request:Request, exc:ValidationError):
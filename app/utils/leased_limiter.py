@@ -0,0 +1,206 @@
+# Hybrid local/Redis rate limiter: workers spend leased shares of each budget locally
+import asyncio
+import logging
+import math
+import time
+from typing import Optional, Tuple
+from cachetools import LRUCache
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RedisLeaseStore:
+    """
+    One token bucket per (limit, key) - a hash {tokens, ts} refilled
+    continuously at `capacity` per window. A lease call returns a worker's
+    unused tokens and takes up to `want` new ones in a single Lua script,
+    so a sync is exactly one round trip.
+    """
+
+    # KEYS: bucket. ARGV: capacity, window_ms, want, give_back
+    _LEASE = """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+    local capacity, window = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local level = capacity
+    local v = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    if v[1] then level = math.min(capacity, tonumber(v[1]) + (now - tonumber(v[2])) * capacity / window) end
+    level = math.min(capacity, level + tonumber(ARGV[4]))
+    local grant = math.min(tonumber(ARGV[3]), math.floor(level))
+    local retry_ms = 0
+    if grant < 1 then
+        grant = 0
+        retry_ms = math.ceil((1 - level) * window / capacity)
+    end
+    redis.call('HSET', KEYS[1], 'tokens', level - grant, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], window * 2)
+    return {grant, retry_ms}
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self._lease = redis.register_script(self._LEASE)
+
+    async def lease(self, bucket: str, capacity: int, window_s: float, want: int, give_back: int) -> Tuple[int, float]:
+        granted, retry_ms = await self._lease(
+            keys=[f"ratelimit:lease:{bucket}"], args=[capacity, int(window_s * 1000), want, give_back]
+        )
+        return int(granted), retry_ms / 1000
+
+
+class InMemoryLeaseStore:
+    """Single-process stand-in with the same semantics as the Lua script (tests, local runs)."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._buckets = {}  # bucket -> (level, updated_at)
+
+    async def lease(self, bucket: str, capacity: int, window_s: float, want: int, give_back: int) -> Tuple[int, float]:
+        now = self.clock()
+        level, updated_at = self._buckets.get(bucket, (float(capacity), now))
+        level = min(capacity, level + (now - updated_at) * capacity / window_s + give_back)
+        granted = min(want, math.floor(level))
+        if granted < 1:
+            self._buckets[bucket] = (level, now)
+            return 0, math.ceil((1 - level) * window_s * 1000 / capacity) / 1000
+        self._buckets[bucket] = (level - granted, now)
+        return granted, 0.0
+
+
+class _Lease:
+    __slots__ = ("remaining", "expires_at", "denied_until", "refresh")
+
+    def __init__(self):
+        self.remaining = 0
+        self.expires_at = 0.0
+        self.denied_until = 0.0
+        self.refresh: Optional[asyncio.Task] = None
+
+
+class LeasedRateLimiter:
+    """
+    Approximate global limits without a Redis round trip per request.
+
+    Each worker leases lease_fraction of a (limit, key) budget from the shared
+    bucket and admits requests against it locally. It syncs with Redis only
+    when the lease runs low (refilled in the background, so steady traffic
+    never waits) or is about to expire, and returns any unused tokens to the
+    shared bucket on every renewal. A rejection is cached locally until its
+    Retry-After so a throttled client doesn't turn into Redis traffic.
+
+    Tokens are taken from the bucket before they are spent, so a lease can
+    only shift admissions in time: within any window a key can exceed its
+    limit by at most one lease per worker (workers * lease size), and tokens
+    held by an idle worker are out of circulation for at most lease_ttl.
+
+    Only touched from the event loop, so no locking.
+    """
+
+    LOW_WATER = 0.25  # refill once a lease is down to this share of its size
+
+    def __init__(self, store, lease_fraction: float = 0.1, max_lease: int = 50,
+                 lease_ttl: float = 2.0, max_keys: int = 10_000, clock=time.monotonic):
+        self.store = store
+        self.lease_fraction = lease_fraction
+        self.max_lease = max_lease
+        self.lease_ttl = lease_ttl
+        self.clock = clock
+        # Evicting a lease only forfeits its unused tokens (errs towards stricter)
+        self._leases: LRUCache = LRUCache(maxsize=max_keys)
+
+        # Stats
+        self.hits = 0
+        self.limited = 0
+        self.syncs = 0
+        self.sync_errors = 0
+
+    def lease_size(self, limit) -> int:
+        return max(1, min(self.max_lease, int(limit.amount * self.lease_fraction)))
+
+    async def hit(self, limit, key: str) -> Tuple[bool, float]:
+        """Spend one unit of `limit` for `key`. Returns (allowed, retry_after seconds)."""
+        self.hits += 1
+        bucket = f"{limit.amount}/{limit.get_expiry()}:{key}"
+        lease = self._leases.get(bucket)
+        if lease is None:
+            lease = self._leases[bucket] = _Lease()
+
+        now = self.clock()
+        while lease.remaining < 1 or now >= lease.expires_at:
+            if now < lease.denied_until:
+                self.limited += 1
+                return False, lease.denied_until - now
+            # Nothing usable locally: wait for a sync (shared by everyone who lands
+            # here) and retry - in a burst, earlier waiters may drain the new lease
+            if lease.refresh is None:
+                lease.refresh = asyncio.create_task(self._sync(bucket, limit, lease))
+            await asyncio.shield(lease.refresh)
+            now = self.clock()
+
+        lease.remaining -= 1
+        size = self.lease_size(limit)
+        if lease.refresh is None and (
+            lease.remaining <= size * self.LOW_WATER
+            or now >= lease.expires_at - self.lease_ttl * self.LOW_WATER
+        ):
+            lease.refresh = asyncio.create_task(self._sync(bucket, limit, lease))
+        return True, 0.0
+
+    async def _sync(self, bucket: str, limit, lease: _Lease):
+        try:
+            # Every renewal hands the unused tokens back and takes a fresh lease,
+            # so a worker never holds more than one lease size. Tokens spent while
+            # the call is in flight come out of the new grant.
+            give_back = lease.remaining
+            self.syncs += 1
+            try:
+                granted, retry_after = await self.store.lease(
+                    bucket, limit.amount, limit.get_expiry(), self.lease_size(limit), give_back
+                )
+            except Exception as e:
+                # Fail open: a Redis outage shouldn't take the API down with it
+                self.sync_errors += 1
+                logger.warning(f"Rate limit lease sync failed, admitting locally: {e}")
+                granted, retry_after = self.lease_size(limit), 0.0
+                lease.remaining = 0
+            else:
+                lease.remaining -= give_back
+
+            now = self.clock()
+            if granted:
+                lease.remaining += granted
+                lease.expires_at = now + self.lease_ttl
+                lease.denied_until = 0.0
+            elif lease.remaining < 1:
+                lease.denied_until = now + min(retry_after, self.lease_ttl)
+        finally:
+            lease.refresh = None
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "limited": self.limited,
+            "syncs": self.syncs,
+            "sync_errors": self.sync_errors,
+            "syncs_per_hit": round(self.syncs / self.hits, 4) if self.hits else 0.0,
+            "leases": len(self._leases)
+        }
+
+
+def _build_store():
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        return InMemoryLeaseStore()
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        from .redis_client import redis_client
+        return RedisLeaseStore(redis_client)
+    raise ValueError(f"Unknown rate limit backend: {settings.RATE_LIMIT_BACKEND}. Available: ['redis', 'memory']")
+
+
+# Global singleton
+leased_limiter = LeasedRateLimiter(
+    _build_store(),
+    lease_fraction=settings.RATE_LIMIT_LEASE_FRACTION,
+    max_lease=settings.RATE_LIMIT_LEASE_MAX,
+    lease_ttl=settings.RATE_LIMIT_LEASE_TTL
+)
@@ -0,0 +1,374 @@
+# In-process Prometheus metrics, summed across uvicorn workers through Redis
+import asyncio
+import bisect
+import logging
+import math
+import os
+import re
+import socket
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers in-process checks (sub-ms) up to slow provider calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# For work that never leaves the process (e.g. a deque append)
+FAST_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3, 1e-2)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Sample -> value, keyed by the exposition line without its value, e.g.
+# 'gateway_auth_seconds_bucket{cache="hit",le="0.001"}'
+Samples = Dict[str, float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def sample_names(self) -> Tuple[str, ...]:
+        return (self.name,)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self) -> Samples:
+        return {self.name + _labels(self.labelnames, labels): value for labels, value in self.values.items()}
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: "Histogram", labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Histogram(_Metric):
+    """
+    Fixed buckets; observe() is a bisect and two list updates. Bucket counts
+    are kept per bucket and made cumulative only when exported.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._bounds = [_format(bound) for bound in self.buckets] + ["+Inf"]
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def time(self, *labels) -> _Timer:
+        """with histogram.time("label"): ... observes the block's duration in seconds."""
+        return _Timer(self, labels)
+
+    def sample_names(self) -> Tuple[str, ...]:
+        return (f"{self.name}_bucket", f"{self.name}_sum", f"{self.name}_count")
+
+    def samples(self) -> Samples:
+        result = {}
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self._bounds, counts):
+                cumulative += count
+                result[f"{self.name}_bucket" + _labels(self.labelnames, labels, f'le="{bound}"')] = cumulative
+            plain = _labels(self.labelnames, labels)
+            result[f"{self.name}_sum{plain}"] = total
+            result[f"{self.name}_count{plain}"] = cumulative
+        return result
+
+
+class Gauge(_Metric):
+    """Read when exported: `collect` returns a value, or {label values: value} with labelnames."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, collect: Callable[[], object], labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def samples(self) -> Samples:
+        value = self.collect()
+        if isinstance(value, dict):
+            return {self.name + _labels(self.labelnames, labels): v for labels, v in value.items()}
+        return {self.name: float(value)}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, collect: Callable[[], object], labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, collect, labelnames))
+
+    def cumulative(self) -> Samples:
+        """Counter and histogram samples (additive across workers)."""
+        samples = {}
+        for metric in self.metrics.values():
+            if metric.kind != "gauge":
+                samples.update(metric.samples())
+        return samples
+
+    def gauges(self) -> Samples:
+        samples = {}
+        for metric in self.metrics.values():
+            if metric.kind == "gauge":
+                try:
+                    samples.update(metric.samples())
+                except Exception as e:
+                    logger.warning(f"Gauge {metric.name} failed: {e}")
+        return samples
+
+    def render(self, cumulative: Samples, gauges: Samples) -> str:
+        """Prometheus text exposition format (0.0.4) of the given samples, grouped by metric."""
+        family = {}
+        for metric in self.metrics.values():
+            for sample_name in metric.sample_names():
+                family[sample_name] = metric.name
+        grouped: Dict[str, List[Tuple[str, float]]] = {name: [] for name in self.metrics}
+        for samples in (cumulative, gauges):
+            for key, value in samples.items():
+                name = family.get(key.split("{", 1)[0])
+                if name is not None:  # samples from a newer/older worker's registry are skipped
+                    grouped[name].append((key, value))
+
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(grouped[name], key=_sample_order):
+                lines.append(f"{key} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+
+_LE = re.compile(r',?le="([^"]+)"')
+_SUFFIX_ORDER = {"_bucket": 0, "_sum": 1, "_count": 2}
+
+
+def _sample_order(item: Tuple[str, float]):
+    # Series together, buckets in numeric le order, then _sum and _count
+    key = item[0]
+    name, _, labels = key.partition("{")
+    le = _LE.search(labels)
+    bound = float(le.group(1)) if le else 0.0
+    suffix = next((order for suffix, order in _SUFFIX_ORDER.items() if name.endswith(suffix)), 0)
+    return _LE.sub("", labels), suffix, bound
+
+
+class LocalMetricsStore:
+    """This process only (single worker, tests)."""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+    async def render(self) -> str:
+        return self.registry.render(self.registry.cumulative(), self.registry.gauges())
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class RedisMetricsStore:
+    """
+    Sums every worker's metrics in Redis, so any worker's /metrics answers
+    for the whole deployment.
+
+    Counters and histograms are pushed as deltas (HINCRBYFLOAT) into one
+    shared hash every flush_interval, so totals stay monotonic when workers
+    restart or die. Gauges are point-in-time: each worker overwrites its own
+    hash, which expires when the worker stops refreshing it, and registers
+    itself in a sorted set scored by push time. A scrape reads only the
+    registered workers' hashes (never SCANs the keyspace, which also holds
+    the caches) and sums the live ones. The scraped worker pushes first; the
+    others' data is at most flush_interval old. If Redis is unreachable,
+    deltas keep accumulating locally and the scrape falls back to this
+    worker's metrics.
+    """
+
+    TOTALS = "metrics:totals"
+    GAUGES = "metrics:gauges:"
+    WORKERS = "metrics:workers"
+
+    def __init__(self, registry: MetricsRegistry, redis, flush_interval: float, worker_id: Optional[str] = None):
+        self.registry = registry
+        self.redis = redis
+        self.flush_interval = flush_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._pushed: Samples = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def push(self):
+        async with self._lock:
+            current = self.registry.cumulative()
+            deltas = {key: value - self._pushed.get(key, 0.0) for key, value in current.items()}
+            gauges = self.registry.gauges()
+            gauge_key = self.GAUGES + self.worker_id
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for key, delta in deltas.items():
+                    if delta:
+                        pipe.hincrbyfloat(self.TOTALS, key, delta)
+                pipe.delete(gauge_key)
+                if gauges:
+                    pipe.hset(gauge_key, mapping=gauges)
+                    pipe.expire(gauge_key, self._gauge_ttl)
+                pipe.zadd(self.WORKERS, {self.worker_id: time.time()})
+                await pipe.execute()
+            self._pushed = current
+
+    @property
+    def _gauge_ttl(self) -> int:
+        return max(1, math.ceil(self.flush_interval * 3))
+
+    async def _collect(self) -> Tuple[Samples, Samples]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self.TOTALS)
+            # Workers that stopped pushing (crashed) drop out once their gauges have expired
+            pipe.zremrangebyscore(self.WORKERS, "-inf", time.time() - self._gauge_ttl)
+            pipe.zrange(self.WORKERS, 0, -1)
+            raw_totals, _, workers = await pipe.execute()
+        totals = {key: float(value) for key, value in raw_totals.items()}
+        gauges: Samples = {}
+        if workers:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for worker_id in workers:
+                    pipe.hgetall(self.GAUGES + worker_id)
+                for worker in await pipe.execute():
+                    for key, value in worker.items():
+                        gauges[key] = gauges.get(key, 0.0) + float(value)
+        return totals, gauges
+
+    async def render(self) -> str:
+        try:
+            await self.push()
+            totals, gauges = await self._collect()
+        except Exception as e:
+            logger.warning(f"Metrics aggregation unavailable, serving this worker's only: {e}")
+            return self.registry.render(self.registry.cumulative(), self.registry.gauges())
+        return self.registry.render(totals, gauges)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.push()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Metrics push failed: {e}")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            # Last deltas, and drop our gauges rather than wait for them to expire
+            await self.push()
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(self.GAUGES + self.worker_id)
+                pipe.zrem(self.WORKERS, self.worker_id)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Final metrics push failed: {e}")
+
+
+registry = MetricsRegistry()
+
+# --- gateway metrics ------------------------------------------------------
+# Stage histograms are in seconds, as Prometheus expects
+
+AUTH_SECONDS = registry.histogram(
+    "gateway_auth_seconds", "API key authentication (cache lookup, DB + bcrypt on a miss)", ("cache",))
+RATELIMIT_SECONDS = registry.histogram(
+    "gateway_ratelimit_check_seconds", "Rate limit checks: default and per-key request limits, token buckets",
+    ("check",))
+IDEMPOTENCY_SECONDS = registry.histogram(
+    "gateway_idempotency_lookup_seconds", "Idempotency-Key lookup, including waiting for an in-flight leader",
+    ("outcome",))
+PROVIDER_SECONDS = registry.histogram(
+    "gateway_provider_call_seconds", "Upstream provider calls, including the provider's own retries",
+    ("provider", "mode", "outcome"))
+LOG_ENQUEUE_SECONDS = registry.histogram(
+    "gateway_log_enqueue_seconds", "Buffering one request log row", buckets=FAST_BUCKETS)
+LOG_FLUSH_SECONDS = registry.histogram(
+    "gateway_log_flush_seconds", "Writing one batch of request log rows")
+REQUESTS = registry.counter(
+    "gateway_inference_requests_total", "Inference requests by serving provider, status and error type",
+    ("provider", "status", "error_type"))
+
+
+def _build_store():
+    if settings.METRICS_BACKEND == "memory":
+        return LocalMetricsStore(registry)
+    from .redis_client import redis_client
+    return RedisMetricsStore(registry, redis_client, flush_interval=settings.METRICS_FLUSH_INTERVAL)
+
+
+# Global singleton, started/stopped by the app lifespan
+metrics_store = _build_store()
@@ -2,16 +2,23 @@
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
-from redis.asyncio import Redis
+from limits import parse
+from fastapi import HTTPException, status
 from ..config import settings
+from .leased_limiter import leased_limiter
+from .prometheus import RATELIMIT_SECONDS
 import functools
-import hashlib
-import asyncio
-from cachetools import LRUCache
+import math
 
-# Reddis connection (reuse across the app)
-redis_client = Redis.from_url(settings.REDIS_URL, decode_responses = True)
+DEFAULT_LIMIT = settings.RATE_LIMIT_DEFAULT # Fallback rate limit
+DEFAULT_LIMITS = [parse(DEFAULT_LIMIT)]
+
+def scope_rate_limit_key(scope) -> str:
+    """Same key as the limiter's key_func, computed straight from the ASGI scope."""
+    client = scope.get("client")
+    address = client[0] if client else "127.0.0.1"
+    api_key = scope.get("state", {}).get("api_key")
+    return f"{api_key.id}:{address}" if api_key else address
 
 limiter = Limiter(
     key_func=lambda request: (
@@ -19,71 +26,44 @@ limiter = Limiter(
         if hasattr(request.state, "api_key") and request.state.api_key
         else get_remote_address(request)
     ),
-    default_limits = ["100 per minute"], # Fallback rate limit
+    default_limits = [DEFAULT_LIMIT],
     storage_uri = settings.REDIS_URL,
     enabled=True
 )
 
-# In-memory config sources (Simulating DB/Config Store)
-KEY_LIMITS = {
-    "1": "50 per minute",  # Admin Key
-    "2": "20 per minute",  # User Key
-}
-DEFAULT_TIER_LIMIT = "10 per minute"
-
 # Custom per-key limit (Overrides default) 
-def get_key_limit(key_id: str) -> str:
+def get_key_limit(api_key) -> str:
     """
-    Fetch explicit configured limit for the API key.
-    Falls back to a tier-based default if not found.
+    Requests/minute limit of the API key, from its APIKey.rate_limit column
+    (via the cached APIKeyRecord, so changes apply within API_KEY_CACHE_TTL).
     """
-    return KEY_LIMITS.get(str(key_id), DEFAULT_TIER_LIMIT)
+    return f"{api_key.rate_limit} per minute"
 
-# Cache for decorated functions to avoid recreation (Bounded LRU)
-_limiter_cache = LRUCache(maxsize=100)
-_cache_lock = asyncio.Lock()
+_parse_limit = functools.lru_cache(maxsize=256)(parse)
 
-# Rate limit decorator using key-specific limit
+# Rate limit decorator using key-specific limit (leased, like the global default limit)
 def api_key_limiter():
     def decorator(func):
         @functools.wraps(func)
         async def wrapper(request, *args, **kwargs):
             # Verify api_key exists
-            if not hasattr(request.state, "api_key") or not request.state.api_key:
+            api_key = getattr(request.state, "api_key", None)
+            if not api_key:
                 raise ValueError("api_key_limiter requires request.state.api_key to be set")
-            
-            key_id = request.state.api_key.id
-            limit_str = get_key_limit(str(key_id))
-            
-            # Cache key: (function reference, limit string)
-            cache_key = (func, limit_str)
-            
-            # Double-checked locking optimization
-            cached_func = _limiter_cache.get(cache_key)
-            
-            if cached_func is None:
-                async with _cache_lock:
-                    # Re-check inside lock
-                    cached_func = _limiter_cache.get(cache_key)
-                    if cached_func is None:
-                        # Create and cache the decorated function 
-                        limit_decorator = limiter.limit(limit_str)
-                        
-                        @limit_decorator
-                        @functools.wraps(func)
-                        async def limited(request, *args, **kwargs):
-                            return await func(request, *args, **kwargs)
-                        
-                        _limiter_cache[cache_key] = limited
-                        cached_func = limited
-            
-            return await cached_func(request, *args, **kwargs)
+
+            limit = _parse_limit(get_key_limit(api_key))
+            with RATELIMIT_SECONDS.time("key"):
+                allowed, retry_after = await leased_limiter.hit(limit, f"key:{api_key.id}")
+            if not allowed:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail=f"Rate limit exceeded: {limit}",
+                    headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+                )
+            return await func(request, *args, **kwargs)
         return wrapper
     return decorator
 
-#Global middleware
-middleware = SlowAPIMiddleware
-
 # 429 Handler
 def rate_limit_handler(request, exc):
     return _rate_limit_exceeded_handler(request, exc)
@@ -0,0 +1,5 @@
+from redis.asyncio import Redis
+from ..config import settings
+
+# Shared Redis connection (reuse across the app)
+redis_client = Redis.from_url(settings.REDIS_URL, decode_responses = True)
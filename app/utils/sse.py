@@ -0,0 +1,39 @@
+# Server-sent events helpers
+import json
+import anyio
+from typing import Optional
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    # One SSE frame; JSON keeps multi-line text inside a single data: line
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+class EventSourceResponse(StreamingResponse):
+    """
+    StreamingResponse that always watches for client disconnect.
+    Starlette only does this for ASGI < 2.4 and otherwise notices on the next
+    failed send; here the body iterator is closed as soon as the client goes
+    away, which cancels the upstream provider stream with it.
+    """
+    media_type = "text/event-stream"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async with anyio.create_task_group() as task_group:
+            async def stream():
+                try:
+                    await self.stream_response(send)
+                except OSError:
+                    pass  # Client disconnected mid-send
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(stream)
+            await self.listen_for_disconnect(receive)
+            task_group.cancel_scope.cancel()
+
+        await self.body_iterator.aclose()
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,187 @@
+# Per-key requests/minute + tokens/minute limiter on atomic token buckets
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, Set, Tuple
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceededError(Exception):
+    """A key is over its requests/minute or tokens/minute budget."""
+
+    def __init__(self, limit: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded: {limit} per minute")
+        self.limit = limit  # "requests" or "tokens"
+        self.retry_after = retry_after
+
+
+@dataclass
+class Charge:
+    key_id: int
+    tokens_per_minute: int
+    tokens: int  # charged up front, reconciled against actual usage later
+
+
+class RedisTokenBucketStore:
+    """
+    Two buckets per key (requests, tokens), each a hash {tokens, ts} refilled
+    continuously at capacity per minute. Both are checked and charged in one
+    Lua script, so concurrent requests on any worker can't overspend; the
+    Redis server clock is used so workers never disagree on refill.
+    """
+
+    # KEYS: request bucket, token bucket. ARGV: rpm, tpm, token cost
+    _ACQUIRE = """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+    local function level(key, capacity)
+        local v = redis.call('HMGET', key, 'tokens', 'ts')
+        if not v[1] then return capacity end
+        return math.min(capacity, tonumber(v[1]) + (now - tonumber(v[2])) * capacity / 60000)
+    end
+    local rpm, tpm = tonumber(ARGV[1]), tonumber(ARGV[2])
+    -- A single request larger than the whole budget is let through on a full bucket
+    local cost = math.min(tonumber(ARGV[3]), tpm)
+    local requests = level(KEYS[1], rpm)
+    local tokens = level(KEYS[2], tpm)
+    if requests < 1 then
+        return {0, 'requests', math.ceil((1 - requests) * 60000 / rpm)}
+    end
+    if tokens < cost then
+        return {0, 'tokens', math.ceil((cost - tokens) * 60000 / tpm)}
+    end
+    redis.call('HSET', KEYS[1], 'tokens', requests - 1, 'ts', now)
+    redis.call('HSET', KEYS[2], 'tokens', tokens - cost, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], 120000)
+    redis.call('PEXPIRE', KEYS[2], 120000)
+    return {1, '', 0}
+    """
+
+    # KEYS: token bucket. ARGV: tpm, delta (> 0 refunds, < 0 charges extra - may go into debt)
+    _ADJUST = """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+    local tpm = tonumber(ARGV[1])
+    local v = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tpm
+    if v[1] then tokens = math.min(tpm, tonumber(v[1]) + (now - tonumber(v[2])) * tpm / 60000) end
+    tokens = math.min(tpm, tokens + tonumber(ARGV[2]))
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], 120000)
+    return 1
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self._acquire = redis.register_script(self._ACQUIRE)
+        self._adjust = redis.register_script(self._ADJUST)
+
+    @staticmethod
+    def _keys(key_id: int) -> Tuple[str, str]:
+        return f"ratelimit:{key_id}:requests", f"ratelimit:{key_id}:tokens"
+
+    async def acquire(self, key_id: int, rpm: int, tpm: int, tokens: int) -> Tuple[bool, str, float]:
+        allowed, limit, retry_ms = await self._acquire(keys=list(self._keys(key_id)), args=[rpm, tpm, tokens])
+        return bool(allowed), limit, retry_ms / 1000
+
+    async def adjust(self, key_id: int, tpm: int, delta: int):
+        await self._adjust(keys=[self._keys(key_id)[1]], args=[tpm, delta])
+
+
+class InMemoryTokenBucketStore:
+    """Single-process stand-in with the same semantics as the Lua scripts (tests, local runs)."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        # (key_id, "requests"|"tokens") -> (level, updated_at)
+        self._buckets: Dict[Tuple[int, str], Tuple[float, float]] = {}
+
+    def _level(self, bucket: Tuple[int, str], capacity: int, now: float) -> float:
+        state = self._buckets.get(bucket)
+        if state is None:
+            return float(capacity)
+        level, updated_at = state
+        return min(capacity, level + (now - updated_at) * capacity / 60)
+
+    async def acquire(self, key_id: int, rpm: int, tpm: int, tokens: int) -> Tuple[bool, str, float]:
+        now = self.clock()
+        cost = min(tokens, tpm)
+        requests = self._level((key_id, "requests"), rpm, now)
+        available = self._level((key_id, "tokens"), tpm, now)
+        if requests < 1:
+            return False, "requests", math.ceil((1 - requests) * 60000 / rpm) / 1000
+        if available < cost:
+            return False, "tokens", math.ceil((cost - available) * 60000 / tpm) / 1000
+        self._buckets[(key_id, "requests")] = (requests - 1, now)
+        self._buckets[(key_id, "tokens")] = (available - cost, now)
+        return True, "", 0.0
+
+    async def adjust(self, key_id: int, tpm: int, delta: int):
+        now = self.clock()
+        level = self._level((key_id, "tokens"), tpm, now)
+        self._buckets[(key_id, "tokens")] = (min(tpm, level + delta), now)
+
+
+class TokenBucketLimiter:
+    """
+    Enforces APIKey.rate_limit (requests/minute) and APIKey.token_limit
+    (tokens/minute, RATE_LIMIT_DEFAULT_TPM when unset) per key.
+
+    Limits are read from the APIKeyRecord snapshot, so they refresh with
+    the API key cache. A request is charged its worst case (max_tokens +
+    prompt estimate) up front; settle() later refunds the difference to the
+    actual usage, or charges the overrun.
+    """
+
+    def __init__(self, store, default_tpm: int):
+        self.store = store
+        self.default_tpm = default_tpm
+        self._pending: Set[asyncio.Task] = set()
+        self.allowed = 0
+        self.limited = 0
+
+    async def acquire(self, api_key, tokens: int) -> Charge:
+        """Charge one request and `tokens` tokens, or raise RateLimitExceededError."""
+        tpm = api_key.token_limit or self.default_tpm
+        allowed, limit, retry_after = await self.store.acquire(api_key.id, api_key.rate_limit, tpm, tokens)
+        if not allowed:
+            self.limited += 1
+            raise RateLimitExceededError(limit, retry_after)
+        self.allowed += 1
+        return Charge(key_id=api_key.id, tokens_per_minute=tpm, tokens=min(tokens, tpm))
+
+    async def reconcile(self, charge: Charge, actual_tokens: int):
+        delta = charge.tokens - int(actual_tokens)
+        if delta:
+            await self.store.adjust(charge.key_id, charge.tokens_per_minute, delta)
+
+    def settle(self, charge: Charge, actual_tokens: int):
+        """Reconcile in the background - never adds latency to (or fails) the response."""
+        task = asyncio.create_task(self.reconcile(charge, actual_tokens))
+        self._pending.add(task)
+        task.add_done_callback(self._settled)
+
+    def _settled(self, task: asyncio.Task):
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Token bucket reconcile failed: {task.exception()}")
+
+    def stats(self) -> dict:
+        return {"allowed": self.allowed, "limited": self.limited, "pending_reconciles": len(self._pending)}
+
+
+def _build_store():
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        return InMemoryTokenBucketStore()
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        from .redis_client import redis_client
+        return RedisTokenBucketStore(redis_client)
+    raise ValueError(f"Unknown rate limit backend: {settings.RATE_LIMIT_BACKEND}. Available: ['redis', 'memory']")
+
+
+# Global singleton
+token_limiter = TokenBucketLimiter(_build_store(), default_tpm=settings.RATE_LIMIT_DEFAULT_TPM)
@@ -0,0 +1,350 @@
+# Per-request stage spans: Server-Timing header + sampled trace export
+import asyncio
+import json
+import logging
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# The request's trace, and the index of the span new spans nest under
+_trace: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_parent: ContextVar[int] = ContextVar("trace_parent", default=0)
+
+
+class Span:
+    """One timed stage; also the context manager span() returns."""
+
+    __slots__ = ("name", "index", "parent", "start", "end", "attributes", "_token")
+
+    def __init__(self, name: str, index: int, parent: int, start: float, attributes: dict):
+        self.name = name
+        self.index = index
+        self.parent = parent
+        self.start = start  # perf_counter seconds
+        self.end: Optional[float] = None
+        self.attributes = attributes
+
+    def __enter__(self):
+        self._token = _parent.set(self.index)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        _parent.reset(self._token)
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+
+class Trace:
+    """
+    Spans of one request; span 0 is the request itself. Times are
+    perf_counter readings, mapped to wall-clock time only on export.
+    trace_id/parent_span_id come from an incoming W3C traceparent header
+    when there is one.
+    """
+
+    __slots__ = ("_trace_id", "_span_ids", "parent_span_id", "sampled", "started_at", "spans", "_tokens")
+
+    def __init__(self, name: str, sampled: bool, trace_id: Optional[str] = None,
+                 parent_span_id: Optional[str] = None, **attributes):
+        self._trace_id = trace_id
+        self._span_ids: List[str] = []
+        self.parent_span_id = parent_span_id
+        self.sampled = sampled
+        self.started_at = time.time_ns()
+        self.spans: List[Span] = [Span(name, 0, -1, time.perf_counter(), attributes)]
+
+    @property
+    def trace_id(self) -> str:
+        # Generated on first use: most traces are only ever a Server-Timing header
+        if self._trace_id is None:
+            self._trace_id = f"{random.getrandbits(128):032x}"
+        return self._trace_id
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def timings(self) -> Dict[str, float]:
+        """Milliseconds per stage name (repeats, e.g. fallback attempts, summed) over the finished spans."""
+        result: Dict[str, float] = {}
+        for span in self.spans[1:]:
+            if span.end is not None:
+                result[span.name] = result.get(span.name, 0.0) + (span.end - span.start) * 1000
+        return result
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={ms:.2f}" for name, ms in self.timings().items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.root.start) * 1000:.2f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> dict:
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "parent_span_id": self.parent_span_id,
+            "timestamp": datetime.fromtimestamp(self.started_at / 1e9, timezone.utc).isoformat(),
+            "duration_ms": round(((root.end or root.start) - root.start) * 1000, 3),
+            "spans": [{
+                "span_id": self.span_id(i),
+                "parent_id": self.span_id(span.parent) if span.parent >= 0 else self.parent_span_id,
+                "name": span.name,
+                "start_ms": round((span.start - root.start) * 1000, 3),
+                "duration_ms": round(((span.end or span.start) - span.start) * 1000, 3),
+                "attributes": span.attributes
+            } for i, span in enumerate(self.spans)]
+        }
+
+    def span_id(self, index: int) -> str:
+        # Random per span, so requests sharing an incoming trace (retries, fan-out) don't
+        # collide; drawn on first use (export), then stable so children can name parents
+        while len(self._span_ids) <= index:
+            self._span_ids.append(f"{random.getrandbits(64) or 1:016x}")
+        return self._span_ids[index]
+
+    def unix_ns(self, perf: float) -> int:
+        return self.started_at + int((perf - self.root.start) * 1e9)
+
+
+class _NoopScope:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def set(self, key: str, value):
+        pass
+
+
+_NOOP = _NoopScope()
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def span(name: str, **attributes):
+    """
+    with span("stage", key=value) as s: ... - times the block as a child of
+    the current span (s.set() adds attributes). Outside a traced request
+    this is one ContextVar lookup returning a shared no-op.
+    Not for async generators: a scope must end in the context it started in.
+    """
+    trace = _trace.get()
+    if trace is None:
+        return _NOOP
+    spans = trace.spans
+    span = Span(name, len(spans), _parent.get(), time.perf_counter(), attributes)
+    spans.append(span)
+    return span
+
+
+def record(name: str, start: float, end: float, **attributes):
+    """Add an already timed (perf_counter) stage, e.g. from a generator or an existing timer."""
+    trace = _trace.get()
+    if trace is not None:
+        span = Span(name, len(trace.spans), _parent.get(), start, attributes)
+        span.end = end
+        trace.spans.append(span)
+
+
+def parse_traceparent(value: Optional[str]):
+    """W3C traceparent -> (trace_id, parent span id, sampled), or None if malformed."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def begin(name: str, sampled: bool, traceparent: Optional[str] = None, **attributes) -> Trace:
+    """Start the request's trace in the current context."""
+    parent = parse_traceparent(traceparent)
+    if parent:
+        trace_id, parent_span_id, parent_sampled = parent
+        trace = Trace(name, sampled or parent_sampled, trace_id, parent_span_id, **attributes)
+    else:
+        trace = Trace(name, sampled, **attributes)
+    trace._tokens = (_trace.set(trace), _parent.set(0))
+    return trace
+
+
+def finish(trace: Trace, **attributes):
+    """End the request span and detach the trace from the context."""
+    trace.root.end = time.perf_counter()
+    trace.root.attributes.update(attributes)
+    trace_token, parent_token = trace._tokens
+    _parent.reset(parent_token)
+    _trace.reset(trace_token)
+
+
+# --- export ---------------------------------------------------------------
+
+class TraceExporter(ABC):
+    """
+    Buffers finished sampled traces and ships them from a background task
+    every flush_interval, so export never runs on the request path. The
+    buffer is bounded; when the exporter falls behind, the oldest traces
+    are dropped.
+    """
+
+    def __init__(self, flush_interval: float, max_buffer: int):
+        self.flush_interval = flush_interval
+        self._buffer: deque = deque(maxlen=max_buffer)
+        self._task: Optional[asyncio.Task] = None
+
+        # Stats
+        self.exported = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def export(self, trace: Trace):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(trace)
+
+    @abstractmethod
+    async def _send(self, traces: List[Trace]):
+        """Ship one batch of finished traces; raising counts the batch as dropped."""
+        pass
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        traces = list(self._buffer)
+        self._buffer.clear()
+        try:
+            await self._send(traces)
+            self.exported += len(traces)
+        except Exception as e:
+            self.errors += 1
+            self.dropped += len(traces)
+            logger.warning(f"Failed to export {len(traces)} traces: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {"buffered": len(self._buffer), "exported": self.exported,
+                "dropped": self.dropped, "errors": self.errors}
+
+
+class JsonLinesTraceExporter(TraceExporter):
+    """One JSON object per trace, appended to a file (written off the event loop)."""
+
+    def __init__(self, path: str, flush_interval: float, max_buffer: int):
+        super().__init__(flush_interval, max_buffer)
+        self.path = path
+
+    def _append(self, lines: List[str]):
+        with open(self.path, "a") as f:
+            f.writelines(lines)
+
+    async def _send(self, traces: List[Trace]):
+        lines = [json.dumps(trace.to_dict(), default=str) + "\n" for trace in traces]
+        await asyncio.to_thread(self._append, lines)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPTraceExporter(TraceExporter):
+    """OTLP/HTTP with the JSON encoding, e.g. to a local OpenTelemetry Collector on :4318."""
+
+    def __init__(self, endpoint: str, service_name: str, flush_interval: float, max_buffer: int):
+        super().__init__(flush_interval, max_buffer)
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._client = None
+
+    def payload(self, traces: List[Trace]) -> dict:
+        spans = []
+        for trace in traces:
+            for i, span in enumerate(trace.spans):
+                parent = trace.span_id(span.parent) if span.parent >= 0 else trace.parent_span_id
+                otlp_span = {
+                    "traceId": trace.trace_id,
+                    "spanId": trace.span_id(i),
+                    "name": span.name,
+                    "kind": 2 if i == 0 else 1,  # SERVER for the request, INTERNAL for stages
+                    "startTimeUnixNano": str(trace.unix_ns(span.start)),
+                    "endTimeUnixNano": str(trace.unix_ns(span.end or span.start)),
+                    "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+                    "status": {"code": 2 if "error" in span.attributes else 0}
+                }
+                if parent:
+                    otlp_span["parentSpanId"] = parent
+                spans.append(otlp_span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "gateway"}, "spans": spans}]
+        }]}
+
+    async def _send(self, traces: List[Trace]):
+        import httpx
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=5.0)
+        response = await self._client.post(self.endpoint, json=self.payload(traces))
+        response.raise_for_status()
+
+    async def stop(self):
+        await super().stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _build_exporter() -> TraceExporter:
+    if settings.TRACING_EXPORTER == "otlp":
+        return OTLPTraceExporter(settings.TRACING_OTLP_ENDPOINT, settings.TRACING_SERVICE_NAME,
+                                 flush_interval=settings.TRACING_FLUSH_INTERVAL,
+                                 max_buffer=settings.TRACING_MAX_BUFFER)
+    if settings.TRACING_EXPORTER != "jsonl":
+        raise ValueError(f"Unknown trace exporter: {settings.TRACING_EXPORTER}. Available: ['jsonl', 'otlp']")
+    return JsonLinesTraceExporter(settings.TRACING_JSONL_PATH,
+                                  flush_interval=settings.TRACING_FLUSH_INTERVAL,
+                                  max_buffer=settings.TRACING_MAX_BUFFER)
+
+
+# Global singleton, started/stopped by the app lifespan when sampling is on
+trace_exporter = _build_exporter()
@@ -0,0 +1,26 @@
+-- Migration: Add key_fingerprint column to api_keys table
+-- Replaces the bcrypt scan over every active key with one indexed lookup
+-- Date: 2026-10-17
+
+-- HMAC-SHA256(API_KEY_HMAC_SECRET or SECRET_KEY, raw_key), hex encoded
+ALTER TABLE api_keys 
+ADD COLUMN key_fingerprint VARCHAR(64) NULL;
+
+-- Unique index used by the auth lookup (NULLs are allowed for legacy keys)
+CREATE UNIQUE INDEX ix_api_keys_key_fingerprint ON api_keys(key_fingerprint);
+
+-- ============================================================================
+-- BACKFILL (automatic, no SQL needed)
+-- ============================================================================
+-- Raw keys are never stored, so existing rows cannot be fingerprinted here.
+-- While API_KEY_LEGACY_SCAN=true (default), a key without a fingerprint is
+-- matched by bcrypt-scanning only the rows WHERE key_fingerprint IS NULL, and
+-- its fingerprint is written on first successful use. A scan costs at most
+-- API_KEY_LEGACY_SCAN_MAX bcrypt checks (keys past it are logged, not
+-- matched) and a key it didn't match skips it for API_KEY_LEGACY_MISS_TTL.
+--
+-- Track progress with:
+-- SELECT COUNT(*) FROM api_keys WHERE active = true AND key_fingerprint IS NULL;
+--
+-- Once this returns 0 (or the remaining keys are abandoned and can be
+-- deactivated), set API_KEY_LEGACY_SCAN=false so misses never scan.
@@ -0,0 +1,11 @@
+-- Migration: Add streaming timing columns to request_logs table
+-- Populated by POST /infer/stream; NULL for non-streaming requests
+-- Date: 2026-10-17
+
+-- Time from request start to the first streamed token (ms)
+ALTER TABLE request_logs 
+ADD COLUMN ttft_ms DOUBLE PRECISION NULL;
+
+-- Time from request start to the end of the stream (ms)
+ALTER TABLE request_logs 
+ADD COLUMN stream_duration_ms DOUBLE PRECISION NULL;
@@ -0,0 +1,9 @@
+-- Migration: Add per-key opt-in for the near-duplicate response cache
+-- Date: 2026-10-17
+
+-- Off by default: near-duplicate hits may answer a slightly different prompt
+ALTER TABLE api_keys 
+ADD COLUMN near_duplicate_cache BOOLEAN NOT NULL DEFAULT false;
+
+-- Enable for a key:
+-- UPDATE api_keys SET near_duplicate_cache = true WHERE id = <key_id>;
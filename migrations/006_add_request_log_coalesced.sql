@@ -0,0 +1,7 @@
+-- Migration: Mark request logs served by a coalesced (shared) upstream call
+-- Date: 2026-10-17
+
+-- true for followers that received another in-flight request's result;
+-- their token_count and cost are 0 (the leader's row carries the usage)
+ALTER TABLE request_logs 
+ADD COLUMN coalesced BOOLEAN NOT NULL DEFAULT false;
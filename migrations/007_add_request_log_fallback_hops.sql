@@ -0,0 +1,7 @@
+-- Migration: Record cross-provider failover on request logs
+-- Date: 2026-10-17
+
+-- provider now holds the provider that finally served the request;
+-- fallback_hops counts the providers failed over from first (0 = first choice)
+ALTER TABLE request_logs 
+ADD COLUMN fallback_hops INTEGER NOT NULL DEFAULT 0;
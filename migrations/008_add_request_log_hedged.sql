@@ -0,0 +1,8 @@
+-- Migration: Mark request logs that belong to a hedged request
+-- Date: 2026-10-17
+
+-- true on both rows of a hedged request: the winner (normal status) and the
+-- losing attempt (status 'hedge_cancelled' with its estimated prompt cost,
+-- or 'failure' if it had already failed)
+ALTER TABLE request_logs 
+ADD COLUMN hedged BOOLEAN NOT NULL DEFAULT false;
@@ -0,0 +1,7 @@
+-- Migration: Per-key tokens/minute limit
+-- Date: 2026-10-17
+
+-- Enforced together with rate_limit (requests/minute) by the token bucket
+-- limiter. NULL means RATE_LIMIT_DEFAULT_TPM.
+ALTER TABLE api_keys 
+ADD COLUMN token_limit INTEGER;
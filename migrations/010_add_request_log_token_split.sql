@@ -0,0 +1,9 @@
+-- Migration: Record input and output tokens separately on request logs
+-- Date: 2026-10-17
+
+-- Providers price prompt and completion tokens differently; cost is now
+-- computed from the split. token_count stays the total (input + output).
+-- Rows written before this migration keep 0/0.
+ALTER TABLE request_logs 
+ADD COLUMN input_tokens INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN output_tokens INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,37 @@
+-- Migration: Hourly/daily rollups of request_logs for the analytics endpoints
+-- Date: 2026-10-17
+
+-- Analytics now filter request_logs with half-open timestamp ranges, which
+-- can use this index (func.date(timestamp) could not). On a large live
+-- table run it on its own, outside a transaction:
+--   CREATE INDEX CONCURRENTLY ix_request_logs_timestamp ON request_logs (timestamp);
+CREATE INDEX IF NOT EXISTS ix_request_logs_timestamp ON request_logs (timestamp);
+
+-- One row per (bucket, api_key_id, provider, model, status). api_key_id 0
+-- and model '' stand in for NULLs so they take part in the primary key.
+CREATE TABLE IF NOT EXISTS request_log_rollups_hourly (
+    bucket TIMESTAMPTZ NOT NULL,
+    api_key_id INTEGER NOT NULL,
+    provider VARCHAR(100) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    request_count BIGINT NOT NULL DEFAULT 0,
+    token_count BIGINT NOT NULL DEFAULT 0,
+    input_tokens BIGINT NOT NULL DEFAULT 0,
+    output_tokens BIGINT NOT NULL DEFAULT 0,
+    cost DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, api_key_id, provider, model, status)
+);
+
+CREATE TABLE IF NOT EXISTS request_log_rollups_daily (
+    LIKE request_log_rollups_hourly INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+    PRIMARY KEY (bucket, api_key_id, provider, model, status)
+);
+
+-- Everything in request_logs before rolled_until is in the rollups. The
+-- compactor creates the row on its first run (at the oldest log's hour)
+-- and backfills history ROLLUP_MAX_HOURS_PER_RUN hours per transaction.
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    name VARCHAR(50) PRIMARY KEY,
+    rolled_until TIMESTAMPTZ NOT NULL
+);
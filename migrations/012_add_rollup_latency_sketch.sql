@@ -0,0 +1,11 @@
+-- Migration: Mergeable latency sketches on the request log rollups
+-- Date: 2026-10-17
+
+-- Encoded LatencySketch (DDSketch, 1% relative accuracy) of request_logs.latency
+-- for the row's (bucket, api_key_id, provider, model, status). A couple hundred
+-- bytes per row; /analytics/latency merges them instead of scanning request_logs.
+-- Rows rolled up before this migration stay NULL and are skipped by the
+-- percentile queries; to backfill, reset the watermark and re-run the compactor
+-- against emptied rollup tables.
+ALTER TABLE request_log_rollups_hourly ADD COLUMN IF NOT EXISTS latency_sketch BYTEA;
+ALTER TABLE request_log_rollups_daily ADD COLUMN IF NOT EXISTS latency_sketch BYTEA;
@@ -0,0 +1,66 @@
+-- Migration: Range-partition request_logs by time
+-- Date: 2026-10-17
+
+-- request_logs becomes a table partitioned by RANGE (timestamp). The app
+-- (RequestLogPartitionManager) creates day/week partitions ahead of time
+-- and, with REQUEST_LOG_RETENTION_DAYS set, drops whole partitions instead
+-- of DELETEing rows. Range predicates on timestamp (analytics, rollups)
+-- only scan the partitions they overlap.
+--
+-- Databases created after this change get the partitioned table from
+-- create_all; this converts an existing one. Nothing is copied: the old
+-- table is attached as the partition holding everything before tomorrow
+-- (UTC), and is dropped by retention like any other partition once all of
+-- it has expired. Writes to request_logs block until the COMMIT; the one
+-- full scan is the CHECK below, which lets SET NOT NULL and ATTACH skip
+-- theirs. The new primary key index is built on the old table in the
+-- same transaction; on a large table build it beforehand with
+--   CREATE UNIQUE INDEX CONCURRENTLY request_logs_legacy_pkey ON request_logs (id, "timestamp");
+-- and use PRIMARY KEY USING INDEX request_logs_legacy_pkey below.
+
+BEGIN;
+
+ALTER TABLE request_logs RENAME TO request_logs_legacy;
+ALTER INDEX IF EXISTS ix_request_logs_id RENAME TO ix_request_logs_legacy_id;
+ALTER INDEX IF EXISTS ix_request_logs_api_key_id RENAME TO ix_request_logs_legacy_api_key_id;
+ALTER INDEX IF EXISTS ix_request_logs_timestamp RENAME TO ix_request_logs_legacy_timestamp;
+
+-- The partition key has to be part of the primary key
+ALTER TABLE request_logs_legacy DROP CONSTRAINT request_logs_pkey;
+ALTER TABLE request_logs_legacy ADD CONSTRAINT request_logs_legacy_pkey PRIMARY KEY (id, "timestamp");
+
+-- Same columns and defaults (id keeps drawing from request_logs_id_seq)
+CREATE TABLE request_logs (LIKE request_logs_legacy INCLUDING DEFAULTS)
+PARTITION BY RANGE ("timestamp");
+ALTER TABLE request_logs ALTER COLUMN "timestamp" SET NOT NULL;
+ALTER TABLE request_logs ADD CONSTRAINT request_logs_pkey PRIMARY KEY (id, "timestamp");
+ALTER TABLE request_logs ADD CONSTRAINT request_logs_api_key_id_fkey
+    FOREIGN KEY (api_key_id) REFERENCES api_keys (id);
+ALTER SEQUENCE request_logs_id_seq OWNED BY request_logs.id;
+-- Partitioned indexes; ATTACH reuses the legacy table's matching ones
+CREATE INDEX ix_request_logs_id ON request_logs (id);
+CREATE INDEX ix_request_logs_api_key_id ON request_logs (api_key_id);
+CREATE INDEX ix_request_logs_timestamp ON request_logs ("timestamp");
+
+DO $$
+DECLARE
+    cutover TIMESTAMPTZ;
+BEGIN
+    SELECT greatest(date_trunc('day', now(), 'UTC'), date_trunc('day', max("timestamp"), 'UTC')) + interval '1 day'
+    INTO cutover FROM request_logs_legacy;
+
+    EXECUTE format(
+        'ALTER TABLE request_logs_legacy ADD CONSTRAINT request_logs_legacy_range '
+        'CHECK ("timestamp" IS NOT NULL AND "timestamp" < %L)', cutover
+    );
+    ALTER TABLE request_logs_legacy ALTER COLUMN "timestamp" SET NOT NULL;
+    EXECUTE format(
+        'ALTER TABLE request_logs ATTACH PARTITION request_logs_legacy FOR VALUES FROM (MINVALUE) TO (%L)', cutover
+    );
+    ALTER TABLE request_logs_legacy DROP CONSTRAINT request_logs_legacy_range;
+END $$;
+
+-- Catches rows outside every partition until the app creates theirs
+CREATE TABLE request_logs_default PARTITION OF request_logs DEFAULT;
+
+COMMIT;
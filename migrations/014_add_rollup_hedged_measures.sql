@@ -0,0 +1,12 @@
+-- Migration: Hedged request counts on the request log rollups
+-- Date: 2026-10-17
+
+-- Requests and cost of the row's (bucket, api_key_id, provider, model, status)
+-- that were part of a hedged request, so /analytics/hedging reads the
+-- rollups instead of filtering request_logs on `hedged`. Rows rolled up
+-- before this migration stay 0; to backfill, reset the watermark and re-run
+-- the compactor against emptied rollup tables.
+ALTER TABLE request_log_rollups_hourly ADD COLUMN IF NOT EXISTS hedged_count BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE request_log_rollups_hourly ADD COLUMN IF NOT EXISTS hedged_cost DOUBLE PRECISION NOT NULL DEFAULT 0;
+ALTER TABLE request_log_rollups_daily ADD COLUMN IF NOT EXISTS hedged_count BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE request_log_rollups_daily ADD COLUMN IF NOT EXISTS hedged_cost DOUBLE PRECISION NOT NULL DEFAULT 0;
@@ -0,0 +1,12 @@
+-- Migration: Request time on request_logs, separate from the insert time
+-- Date: 2026-10-17
+
+-- The request log writer batches rows, retries them through DB outages
+-- and replays spilled rows on the next start, so a row can be inserted
+-- long after its request. `timestamp` stays the insert time: rollups,
+-- partition routing and retention key on it, and a row is never inserted
+-- below the rollup watermark or into a dropped partition's range.
+-- requested_at records when the request was logged. Rows written before
+-- this migration keep it NULL. On the partitioned table the column is
+-- added to every partition, with no rewrite.
+ALTER TABLE request_logs ADD COLUMN IF NOT EXISTS requested_at TIMESTAMPTZ;
@@ -0,0 +1,74 @@
+"""
+Accuracy check: merged latency sketches vs. exact percentiles.
+
+For each synthetic latency distribution, --samples values are split into
+--shards sketches (like hourly rollup rows), each is round-tripped through
+the binary encoding, and the shards are merged. p50/p95/p99 of the merged
+sketch must be within the sketch's relative accuracy of the exact
+percentile (same rank definition). Also reports the encoded size. Exits
+non-zero on the first violation.
+
+Usage:
+    python scripts/check_latency_sketch.py
+    python scripts/check_latency_sketch.py --samples 1000000 --shards 720
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.latency_sketch import LatencySketch, RELATIVE_ACCURACY
+
+QUANTILES = (0.5, 0.95, 0.99, 0.999)
+
+
+def distributions(rng: random.Random):
+    return {
+        "lognormal (api calls)": lambda: rng.lognormvariate(5.5, 0.6),
+        "bimodal (cache + upstream)": lambda: rng.uniform(0.2, 2.0) if rng.random() < 0.3 else rng.gauss(800, 150),
+        "pareto tail": lambda: 50 * rng.paretovariate(1.5),
+        "timeouts at 30 s": lambda: 30_000.0 if rng.random() < 0.02 else rng.expovariate(1 / 400),
+        "sub-millisecond": lambda: rng.uniform(0.0, 0.9),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=200_000)
+    parser.add_argument("--shards", type=int, default=168)  # a week of hourly rows
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    failed = False
+    for name, draw in distributions(rng).items():
+        values = [max(0.0, draw()) for _ in range(args.samples)]
+        shards = [LatencySketch() for _ in range(args.shards)]
+        for i, value in enumerate(values):
+            shards[i % args.shards].add(value)
+        encoded = [shard.to_bytes() for shard in shards]
+        merged = LatencySketch()
+        for data in encoded:
+            merged.merge(LatencySketch.from_bytes(data))
+
+        values.sort()
+        print(f"{name}: {len(values)} values, {args.shards} shards, "
+              f"{sum(map(len, encoded)) / len(encoded):.0f} B/shard, {len(merged.to_bytes())} B merged")
+        for q in QUANTILES:
+            exact = values[int(q * (len(values) - 1))]
+            estimate = merged.quantile(q)
+            error = abs(estimate - exact) / exact if exact > 0 else abs(estimate)
+            ok = error <= RELATIVE_ACCURACY + 1e-9 or (exact <= 1e-3 and estimate == 0.0)
+            failed |= not ok
+            print(f"  {'ok ' if ok else 'FAIL'} p{q * 100:g}: exact {exact:10.3f}  sketch {estimate:10.3f}  "
+                  f"error {error * 100:.3f}%")
+
+    if failed:
+        sys.exit(1)
+    print(f"all quantiles within {RELATIVE_ACCURACY:.0%}")
+
+
+if __name__ == "__main__":
+    main()
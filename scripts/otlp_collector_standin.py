@@ -0,0 +1,85 @@
+"""
+Stand-in for a local OpenTelemetry Collector: receives OTLP/HTTP JSON traces.
+
+Listens on --port (4318, the collector's OTLP/HTTP port) for POST
+/v1/traces, prints each trace as an indented span tree with durations, and
+with --output appends the raw payloads as JSON lines. Enough to check
+TRACING_EXPORTER=otlp end to end without running a collector.
+
+Usage:
+    python scripts/otlp_collector_standin.py --port 4318
+    TRACING_SAMPLE_RATE=1 TRACING_EXPORTER=otlp uvicorn app.main:app
+"""
+import argparse
+import json
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def print_trace(trace_id: str, spans: list):
+    children = defaultdict(list)
+    ids = {span["spanId"] for span in spans}
+    for span in spans:
+        parent = span.get("parentSpanId")
+        children[parent if parent in ids else None].append(span)
+
+    def walk(parent, depth):
+        for span in sorted(children[parent], key=lambda s: int(s["startTimeUnixNano"])):
+            ms = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+            attributes = {a["key"]: next(iter(a["value"].values())) for a in span.get("attributes", [])}
+            print(f"  {'  ' * depth}{span['name']:<{24 - 2 * depth}} {ms:10.3f} ms  {attributes}")
+            walk(span["spanId"], depth + 1)
+
+    print(f"trace {trace_id}")
+    walk(None, 0)
+
+
+class Handler(BaseHTTPRequestHandler):
+    output = None
+
+    def do_POST(self):
+        if self.path != "/v1/traces":
+            self.send_error(404)
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self.send_error(400, "expected OTLP/HTTP JSON")
+            return
+        traces = defaultdict(list)
+        for resource in payload.get("resourceSpans", []):
+            for scope in resource.get("scopeSpans", []):
+                for span in scope.get("spans", []):
+                    traces[span["traceId"]].append(span)
+        for trace_id, spans in traces.items():
+            print_trace(trace_id, spans)
+        if self.output:
+            with open(self.output, "a") as f:
+                f.write(json.dumps(payload) + "\n")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", help="append received payloads to this JSON-lines file")
+    args = parser.parse_args()
+    Handler.output = args.output
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"OTLP/HTTP stand-in listening on http://{args.host}:{args.port}/v1/traces")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
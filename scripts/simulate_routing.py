@@ -0,0 +1,81 @@
+"""
+Simulation: live adaptive routing shifts traffic away from a degraded provider.
+
+Drives ModelRouter with a simulated clock. Gemini starts healthy (~180 ms),
+degrades to --degraded-ms between --degrade-at and --recover-at, then
+recovers. Every routed request's latency is fed back through
+record_outcome, exactly as run_inference does. Prints gemini's share of
+auto traffic per window and exits non-zero if routing did not shift away
+during the degradation.
+
+Usage:
+    python scripts/simulate_routing.py
+    python scripts/simulate_routing.py --degraded-ms 600 --rps 50
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.router.model_router import ModelRouter, ProviderMetrics
+from app.router.provider_stats import ProviderStatsStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=300.0)
+    parser.add_argument("--rps", type=float, default=20.0)
+    parser.add_argument("--degrade-at", type=float, default=100.0)
+    parser.add_argument("--recover-at", type=float, default=200.0)
+    parser.add_argument("--degraded-ms", type=float, default=900.0)
+    parser.add_argument("--window", type=float, default=25.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    providers = [
+        ProviderMetrics("openai", True, 250, "gpt-4o-mini"),
+        ProviderMetrics("gemini", True, 180, "gemini-1.5-flash"),
+    ]
+    router = ModelRouter(providers, ProviderStatsStore({p.name: p.avg_latency_ms for p in providers}))
+
+    def true_latency(name: str, t: float) -> float:
+        base = 250.0 if name == "openai" else 180.0
+        if name == "gemini" and args.degrade_at <= t < args.recover_at:
+            base = args.degraded_ms
+        return base * rng.lognormvariate(0, 0.25)
+
+    windows = {}
+    t = 0.0
+    step = 1.0 / args.rps
+    while t < args.duration:
+        name = router.select_provider(auto=True, now=t)
+        router.stats.record(name, true_latency(name, t), True, now=t)
+        window = int(t // args.window)
+        total, gemini = windows.get(window, (0, 0))
+        windows[window] = (total + 1, gemini + (name == "gemini"))
+        t += step
+
+    print(f"{'window (s)':>12} | {'phase':<9} | gemini share")
+    degraded_shares, healthy_shares = [], []
+    for window, (total, gemini) in sorted(windows.items()):
+        start = window * args.window
+        degraded = args.degrade_at <= start < args.recover_at
+        share = gemini / total
+        (degraded_shares if degraded else healthy_shares).append(share)
+        print(f"{start:>5.0f}-{start + args.window:<6.0f} | {'degraded' if degraded else 'healthy':<9} | {share:6.1%}")
+
+    print("\nfinal stats:", router.stats.snapshot(now=t))
+    avg_degraded = sum(degraded_shares) / len(degraded_shares)
+    avg_healthy = sum(healthy_shares) / len(healthy_shares)
+    print(f"gemini share healthy={avg_healthy:.1%} degraded={avg_degraded:.1%}")
+    if avg_degraded >= avg_healthy / 2:
+        print("FAIL: routing did not shift away from the degraded provider")
+        sys.exit(1)
+    print("OK: routing shifted away during degradation")
+
+
+if __name__ == "__main__":
+    main()